@@ -1,10 +1,11 @@
 from django.contrib import admin
 
-from .models import Topic, Message, Tag, Comment
+from .models import Topic, Message, Tag, Comment, Job
 
 # Register your models here.
 
 admin.site.register(Topic)
 admin.site.register(Message)
 admin.site.register(Tag)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Comment)
+admin.site.register(Job)
\ No newline at end of file
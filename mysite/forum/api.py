@@ -0,0 +1,255 @@
+"""読み取り専用の JSON API。
+
+一覧はカーソルでページングし、fields= で返すフィールドを選べる
+(例: ?fields=id,content)。選ばれなかったフィールドのカラム、JOIN、prefetch は
+クエリに含めない。応答はオブジェクトを 1 件ずつエンコードしながら送る。
+"""
+from collections import namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Prefetch
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.generic.base import View
+
+from .forms import MessageSearchForm
+from .models import Comment, Message, Tag, Topic, TopicTag, TopicTerm
+from .pagination import CursorPaginator, InvalidCursor
+from .search import get_search_backend
+from .terms import normalize
+from .topics import get_topic_or_404
+from .views import ReadDatabaseMixin
+
+# columns: only() に渡すカラム。select_related / prefetch はそのフィールドを
+# 返すときだけ使う
+APIField = namedtuple(
+    "APIField", ["columns", "value", "select_related", "prefetch"], defaults=[None, None]
+)
+
+
+def image_url(image):
+    return image.url if image else None
+
+
+TOPIC_FIELDS = {
+    "id": APIField(["id"], lambda topic: topic.id),
+    "name": APIField(["name"], lambda topic: topic.name),
+    "last_activity_at": APIField(
+        ["last_activity_at"], lambda topic: topic.last_activity_at
+    ),
+    "message_count": APIField(["message_count"], lambda topic: topic.message_count),
+    "comment_count": APIField(["comment_count"], lambda topic: topic.comment_count),
+}
+
+MESSAGE_FIELDS = {
+    "id": APIField(["id"], lambda message: message.id),
+    "content": APIField(["content"], lambda message: message.content),
+    "created_at": APIField(["created_at"], lambda message: message.created_at),
+    "user": APIField(
+        ["user__username"], lambda message: message.user.username, "user"
+    ),
+    "image": APIField(["image"], lambda message: image_url(message.image)),
+    "thumbnails": APIField(["thumbnails"], lambda message: message.thumbnails),
+    "tags": APIField(
+        [],
+        lambda message: [tag.name for tag in message.tag.all()],
+        prefetch=Prefetch("tag", queryset=Tag.objects.only("name").order_by("name")),
+    ),
+    "reply_count": APIField(["reply_count"], lambda message: message.reply_count),
+    "latest_reply_at": APIField(
+        ["latest_reply_at"], lambda message: message.latest_reply_at
+    ),
+}
+
+COMMENT_FIELDS = {
+    "id": APIField(["id"], lambda comment: comment.id),
+    "message": APIField(["message"], lambda comment: comment.message_id),
+    "content": APIField(["content"], lambda comment: comment.content),
+    "created_at": APIField(["created_at"], lambda comment: comment.created_at),
+    "user": APIField(
+        ["user__username"], lambda comment: comment.user.username, "user"
+    ),
+}
+
+
+class InvalidParameter(Exception):
+    pass
+
+
+def get_limit(request, default, maximum):
+    try:
+        limit = int(request.GET.get("limit", default))
+    except ValueError:
+        raise InvalidParameter("limit must be an integer.")
+    if not 1 <= limit <= maximum:
+        raise InvalidParameter(f"limit must be between 1 and {maximum}.")
+    return limit
+
+
+class APIListView(ReadDatabaseMixin, View):
+    """JSON の一覧の基底クラス。
+
+    応答は {"results": [...], "next": URL, "previous": URL} で、next / previous は
+    次・前のページがなければ null。
+    """
+
+    fields = {}
+    ordering = ("created_at", "id")
+    default_limit = 20
+    max_limit = 100
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_fields(self):
+        value = self.request.GET.get("fields")
+        if not value:
+            return list(self.fields)
+        names = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise InvalidParameter(f"Unknown fields: {', '.join(unknown)}")
+        return list(dict.fromkeys(names))
+
+    def get_limit(self):
+        return get_limit(self.request, self.default_limit, self.max_limit)
+
+    def select_fields(self, queryset, names):
+        # カーソルに使うカラムは返さなくても読み込む
+        columns = {field.lstrip("-") for field in self.ordering}
+        for name in names:
+            field = self.fields[name]
+            columns.update(field.columns)
+            if field.select_related:
+                queryset = queryset.select_related(field.select_related)
+            if field.prefetch:
+                queryset = queryset.prefetch_related(field.prefetch)
+        return queryset.only(*columns)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            names = self.get_fields()
+            limit = self.get_limit()
+            queryset = self.select_fields(self.get_queryset(), names)
+            paginator = CursorPaginator(queryset, limit, self.ordering)
+            page = paginator.page(request.GET.get("cursor"))
+        except (InvalidParameter, InvalidCursor) as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        response = StreamingHttpResponse(
+            self.serialize(page, names), content_type="application/json"
+        )
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    def page_url(self, cursor):
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query["cursor"] = cursor
+        return f"{self.request.path}?{query.urlencode()}"
+
+    def serialize(self, page, names):
+        encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(",", ":"))
+        values = [(name, self.fields[name].value) for name in names]
+        yield '{"results":['
+        for i, obj in enumerate(page):
+            item = {name: value(obj) for name, value in values}
+            yield ("," if i else "") + encoder.encode(item)
+        yield '],"next":%s,"previous":%s}' % (
+            encoder.encode(self.page_url(page.next_cursor)),
+            encoder.encode(self.page_url(page.previous_cursor)),
+        )
+
+
+class TopicListAPIView(APIListView):
+    """トピックの一覧。IndexView と同じく最終アクティビティの新しい順"""
+
+    fields = TOPIC_FIELDS
+    ordering = ("-last_activity_at", "-id")
+
+    def get_queryset(self):
+        return Topic.objects.order_by(F("last_activity_at").desc(nulls_last=True))
+
+
+class MessageListAPIView(APIListView):
+    """トピックのメッセージの一覧。ForumView と同じく tag と keyword で絞り込める"""
+
+    fields = MESSAGE_FIELDS
+    ordering = ("created_at", "id")
+
+    def get_queryset(self):
+        topic = get_topic_or_404(self.kwargs["topic"])
+        queryset = Message.objects.filter(topic_id=topic.id)
+        if "tag" in self.request.GET:
+            queryset = queryset.filter(tag__name=self.request.GET["tag"])
+
+        form = MessageSearchForm(self.request.GET)
+        if form.is_valid():
+            keyword = form.cleaned_data["keyword"]
+            if keyword:
+                queryset = get_search_backend().search(queryset, keyword)
+        return queryset
+
+
+class CommentListAPIView(APIListView):
+    """メッセージのコメントの一覧。CommentListView と同じく新しい順"""
+
+    fields = COMMENT_FIELDS
+    ordering = ("-created_at", "-id")
+
+    def get_queryset(self):
+        topic = get_topic_or_404(self.kwargs["topic"])
+        message = get_object_or_404(
+            Message.objects.only("id"), id=self.kwargs["message_id"], topic_id=topic.id
+        )
+        return Comment.objects.filter(message=message)
+
+
+class SuggestionAPIView(ReadDatabaseMixin, View):
+    """検索欄の入力補完。
+
+    q で始まるトピック内のタグ名と、メッセージに現れる語 (TopicTerm) を
+    メッセージ数の多い順に返す。どちらも (topic, ...) の索引の範囲を引くだけで、
+    メッセージの本文は読まない。
+    """
+
+    default_limit = 5
+    max_limit = 20
+    # 文字を消して同じ入力に戻ったときはブラウザのキャッシュを使う
+    max_age = 30
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = get_limit(request, self.default_limit, self.max_limit)
+        except InvalidParameter as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        topic = get_topic_or_404(self.kwargs["topic"])
+        query = request.GET.get("q", "").strip()
+        prefix = normalize(query)
+        tags, terms = [], []
+        if prefix:
+            tags = (
+                TopicTag.objects.filter(
+                    topic_id=topic.id, count__gt=0, tag__name__istartswith=query
+                )
+                .order_by("-count", "tag__name")
+                .values_list("tag__name", "count")[:limit]
+            )
+            terms = (
+                TopicTerm.objects.starting_with(topic.id, prefix)
+                .order_by("-count", "term")
+                .values_list("term", "count")[:limit]
+            )
+
+        response = JsonResponse(
+            {
+                "q": query,
+                "tags": [{"name": name, "count": count} for name, count in tags],
+                "terms": [{"term": term, "count": count} for term, count in terms],
+            }
+        )
+        patch_cache_control(response, private=True, max_age=self.max_age)
+        return response
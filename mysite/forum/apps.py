@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class ForumConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'forum'
+
+    def ready(self):
+        from . import checks  # noqa: F401 (システムチェックの登録)
+        from . import db, signals
+
+        connection_created.connect(db.configure_sqlite)
+
+        post_migrate.connect(signals.install_search_index, sender=self)
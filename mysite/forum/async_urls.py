@@ -0,0 +1,32 @@
+from django.urls import path
+from . import api, async_views, views
+
+app_name = "forum"
+
+# ASGI で使う URL。一覧は非同期版のビューにする (forum.urls と同じ名前)
+urlpatterns = [
+    path('', async_views.index, name='index'),
+    path('<topic>/', async_views.forum, name='forum'),
+    path(
+        '<topic>/messages/<int:message_id>/comments/',
+        views.CommentListView.as_view(),
+        name='comments',
+    ),
+    path('<topic>/events/', views.EventStreamView.as_view(), name='events'),
+    path('api/topics/', api.TopicListAPIView.as_view(), name='api-topics'),
+    path(
+        'api/topics/<topic>/messages/',
+        api.MessageListAPIView.as_view(),
+        name='api-messages',
+    ),
+    path(
+        'api/topics/<topic>/messages/<int:message_id>/comments/',
+        api.CommentListAPIView.as_view(),
+        name='api-comments',
+    ),
+    path(
+        'api/topics/<topic>/suggestions/',
+        api.SuggestionAPIView.as_view(),
+        name='api-suggestions',
+    ),
+]
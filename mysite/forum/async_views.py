@@ -0,0 +1,139 @@
+"""ASGI で使う IndexView / ForumView の非同期版。
+
+Django 4.0 の ORM は同期なので、互いに依存しない取得 (メッセージのページ、
+タグの集計、検索フォーム) をそれぞれスレッドで同時に実行し、テンプレートの
+描画もスレッドで行う。ロジックは同期版のビューのメソッドをそのまま使う。
+"""
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.cache import patch_vary_headers
+from django.views.generic.list import BaseListView
+
+from .cache import get_fragment
+from .db import use_read_database
+from .views import ForumView, IndexView
+
+
+def concurrent_queries_enabled():
+    # TestCase のトランザクション内のデータは、別スレッドの接続からは見えない
+    return getattr(settings, "FORUM_ASYNC_CONCURRENT_QUERIES", True)
+
+
+def run_in_thread(request, func, *args, **kwargs):
+    """func をスレッドで実行する awaitable を返す。
+
+    FORUM_ASYNC_CONCURRENT_QUERIES が有効なら、リクエストのスレッドとは別の
+    スレッド (と接続) を使うので、複数の呼び出しを同時に実行できる。
+    """
+    if not concurrent_queries_enabled():
+        return sync_to_async(func)(*args, **kwargs)
+
+    @functools.wraps(func)
+    def isolated():
+        # 接続はスレッドごとなので、リクエストの開始・終了時と同じ後始末をする
+        close_old_connections()
+        try:
+            stats = getattr(request, "query_stats", None)
+            if stats is None:
+                return func(*args, **kwargs)
+            with stats.record():
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(isolated, thread_sensitive=False)()
+
+
+def rendered(response):
+    response.render()
+    return response
+
+
+async def conditional_response(view, request, render):
+    # ConditionalGetMixin.conditional_response の非同期版
+    if not view.conditional_get_enabled():
+        return await render()
+
+    etag, last_modified = await run_in_thread(request, view.get_conditional_headers)
+    response = view.not_modified(request, etag, last_modified)
+    if response is None:
+        response = await render()
+    view.set_conditional_headers(response, etag, last_modified)
+    return response
+
+
+def safe_methods_only(view_class):
+    """GET / HEAD 以外は同期版のビューに任せるデコレーター"""
+    sync_view = sync_to_async(view_class.as_view())
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await sync_view(request, *args, **kwargs)
+            view = view_class()
+            view.setup(request, *args, **kwargs)
+            with use_read_database():
+                return await func(view, request)
+
+        return wrapper
+
+    return decorator
+
+
+@safe_methods_only(IndexView)
+async def index(view, request):
+    async def render():
+        return await run_in_thread(
+            request, lambda: rendered(BaseListView.get(view, request))
+        )
+
+    return await conditional_response(view, request, render)
+
+
+@safe_methods_only(ForumView)
+async def forum(view, request):
+    async def render():
+        if not hasattr(view, "topic"):
+            view.topic = await run_in_thread(request, view.get_topic)
+        return await render_forum(view, request)
+
+    response = await conditional_response(view, request, render)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+async def render_forum(view, request):
+    # ForumView.render_list の非同期版
+    key = await run_in_thread(request, view.get_fragment_key)
+    fragment = await run_in_thread(request, get_fragment, key) if key else None
+    if fragment is not None:
+        view.object_list = None
+        return await run_in_thread(
+            request,
+            lambda: rendered(
+                view.render_page(view.get_form_context(), fragment, "hit")
+            ),
+        )
+
+    def page_context():
+        # 検索のバックエンドは初回にクエリを実行するので、クエリセットもスレッドで作る
+        view.object_list = view.get_queryset()
+        return view.get_page_context()
+
+    page_context, tag_facets, form_context = await asyncio.gather(
+        run_in_thread(request, page_context),
+        run_in_thread(request, lambda: list(view.get_tag_facets())),
+        run_in_thread(request, view.get_form_context),
+    )
+    context = {**page_context, **form_context, "tag_facets": tag_facets}
+
+    def render():
+        fragment = view.render_message_list(context, key)
+        return rendered(view.render_page(context, fragment, "miss" if key else None))
+
+    return await run_in_thread(request, render)
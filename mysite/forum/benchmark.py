@@ -0,0 +1,311 @@
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.test import Client, RequestFactory, override_settings
+from django.utils import timezone, translation
+
+from accounts.models import CustomUser
+from .models import Tag, Topic, TopicTag, TopicTerm, Message, Comment
+
+
+@dataclass
+class Scale:
+    topics: int
+    messages: int  # トピックあたり
+    comments: int  # メッセージあたり
+    tags: int
+    users: int
+
+
+SCALES = {
+    "tiny": Scale(topics=2, messages=20, comments=3, tags=5, users=5),
+    "small": Scale(topics=10, messages=200, comments=5, tags=20, users=50),
+    "medium": Scale(topics=20, messages=2000, comments=10, tags=50, users=500),
+    "large": Scale(topics=50, messages=10000, comments=20, tags=100, users=5000),
+}
+
+WORDS = [
+    "django", "python", "forum", "message", "comment", "cache", "query",
+    "こんにちは", "ありがとう", "質問", "回答", "エラー", "設定", "画像",
+]
+
+BATCH_SIZE = 2000
+
+
+def build_dataset(scale, seed=0):
+    """bulk_create で合成データを作る。シグナルを通らない集計列は最後に再計算する。"""
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    users = CustomUser.objects.bulk_create(
+        CustomUser(username=f"bench{i}", email=f"bench{i}@example.com")
+        for i in range(scale.users)
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(name=f"tag{i}") for i in range(scale.tags)
+    )
+    topics = Topic.objects.bulk_create(
+        Topic(name=f"topic{i}") for i in range(scale.topics)
+    )
+
+    for topic in topics:
+        messages = Message.objects.bulk_create(
+            (
+                Message(
+                    content=" ".join(rng.choices(WORDS, k=8)),
+                    topic=topic,
+                    user=rng.choice(users),
+                )
+                for _ in range(scale.messages)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        # auto_now_add を上書きして投稿日時を散らす
+        for i, message in enumerate(messages):
+            message.created_at = now - timedelta(minutes=scale.messages - i)
+        Message.objects.bulk_update(messages, ["created_at"], batch_size=BATCH_SIZE)
+
+        Through = Tag.message.through
+        Through.objects.bulk_create(
+            (
+                Through(tag=tag, message=message)
+                for message in messages
+                for tag in rng.sample(tags, k=min(2, len(tags)))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        Comment.objects.bulk_create(
+            (
+                Comment(
+                    content=" ".join(rng.choices(WORDS, k=5)),
+                    message=message,
+                    user=rng.choice(users),
+                )
+                for message in messages
+                for _ in range(scale.comments)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+    Message.objects.refresh_replies()
+    Topic.objects.refresh_activity()
+    TopicTag.objects.rebuild(Topic.objects.all())
+    TopicTerm.objects.rebuild(Topic.objects.all())
+    return topics, tags, users
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(durations, queries, peak_memory):
+    return {
+        "requests": len(durations),
+        "mean_ms": round(statistics.mean(durations) * 1000, 3),
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p95_ms": round(percentile(durations, 95) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+        "queries": max(queries),
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+    }
+
+
+def get_scenarios(scale, topics, tags, users):
+    topic = topics[0].name
+    forum_url = f"/ja/forum/{topic}/"
+    deep_page = max(1, scale.messages // 5)
+    message = Message.objects.filter(topic=topics[0]).latest("created_at")
+
+    return {
+        "index": ("get", "/ja/forum/", {}),
+        "forum_first_page": ("get", forum_url, {}),
+        "forum_deep_page": ("get", forum_url, {"page": deep_page}),
+        "forum_tag": ("get", forum_url, {"tag": tags[0].name}),
+        "forum_keyword": ("get", forum_url, {"keyword": "こんにちは"}),
+        "post_message": (
+            "post",
+            forum_url,
+            {"message": "1", "content": "benchmark", "tag": [tags[0].pk]},
+        ),
+        "post_comment": (
+            "post",
+            forum_url,
+            {"comment": str(message.pk), "content": "benchmark"},
+        ),
+    }
+
+
+def run_scenario(client, method, url, data, repeat, clear_cache=True):
+    durations, queries = [], []
+    for _ in range(repeat):
+        if clear_cache:
+            cache.clear()
+        start = time.perf_counter()
+        res = getattr(client, method)(url, data)
+        durations.append(time.perf_counter() - start)
+        if res.status_code >= 400:
+            raise RuntimeError(f"{method.upper()} {url} returned {res.status_code}")
+        queries.append(res.wsgi_request.query_stats.count)
+
+    # メモリの計測は遅くなるので別に 1 回だけ行う
+    if clear_cache:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        getattr(client, method)(url, data)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(durations, queries, peak_memory)
+
+
+def run_benchmark(
+    scale, repeat=20, clear_cache=True, seed=0, concurrency=0, requests=200, stdout=None
+):
+    start = time.perf_counter()
+    topics, tags, users = build_dataset(scale, seed=seed)
+    result = {
+        "dataset": asdict(scale),
+        "build_seconds": round(time.perf_counter() - start, 3),
+        "scenarios": {},
+    }
+
+    client = Client()
+    client.force_login(users[0])
+    # LocaleMiddleware が切り替えた言語を呼び出し元に持ち越さない
+    with translation.override(translation.get_language()):
+        scenarios = get_scenarios(scale, topics, tags, users)
+        for name, (method, url, data) in scenarios.items():
+            result["scenarios"][name] = run_scenario(
+                client, method, url, data, repeat, clear_cache=clear_cache
+            )
+            if stdout is not None:
+                stdout.write(f"  {name}: {result['scenarios'][name]}")
+
+        if concurrency:
+            result["throughput"] = run_throughput(
+                scenarios, requests=requests, concurrency=concurrency
+            )
+            if stdout is not None:
+                for interface, summary in result["throughput"].items():
+                    stdout.write(f"  {interface}: {summary}")
+    return result
+
+
+# WSGI と ASGI の比較に使うページ (同じデータに対して同じ順で送る)
+THROUGHPUT_SCENARIOS = ("index", "forum_first_page", "forum_deep_page", "forum_tag")
+
+# インターフェースごとの ROOT_URLCONF
+INTERFACES = {
+    "wsgi": "mysite.urls",
+    "asgi": "mysite.async_urls",
+}
+
+
+def summarize_throughput(results, elapsed, concurrency):
+    durations = [duration for duration, status in results]
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": sum(1 for duration, status in results if status >= 400),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(results) / elapsed, 1),
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p95_ms": round(percentile(durations, 95) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+    }
+
+
+def run_wsgi(requests, concurrency):
+    """WSGI アプリケーションをスレッドプールから呼び出す (gunicorn の gthread 相当)"""
+    app = get_wsgi_application()
+    factory = RequestFactory()
+
+    def send(request):
+        url, data = request
+        environ = factory.get(url, data).environ
+        statuses = []
+        start = time.perf_counter()
+        body = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            b"".join(body)
+        finally:
+            body.close()
+        return time.perf_counter() - start, int(statuses[0].split()[0])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, requests))
+    return results, time.perf_counter() - start
+
+
+async def run_asgi(requests, concurrency):
+    """ASGI アプリケーションを 1 つのイベントループから同時に concurrency 件呼び出す"""
+    app = get_asgi_application()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(request):
+        url, data = request
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": url,
+            "raw_path": url.encode(),
+            "root_path": "",
+            "query_string": urlencode(data).encode(),
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        messages = []
+
+        async def collect(message):
+            messages.append(message)
+
+        async with semaphore:
+            start = time.perf_counter()
+            await app(scope, receive, collect)
+            return time.perf_counter() - start, messages[0]["status"]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(send(request) for request in requests))
+    return results, time.perf_counter() - start
+
+
+def run_throughput(scenarios, requests=200, concurrency=50):
+    """同じリクエスト列を WSGI と ASGI (非同期版のビュー) で処理し、スループットを比べる"""
+    pages = [
+        (url, data)
+        for name, (method, url, data) in scenarios.items()
+        if name in THROUGHPUT_SCENARIOS
+    ]
+    batch = [pages[i % len(pages)] for i in range(requests)]
+
+    result = {}
+    for interface, urlconf in INTERFACES.items():
+        cache.clear()
+        with override_settings(ROOT_URLCONF=urlconf):
+            if interface == "asgi":
+                results, elapsed = asyncio.run(run_asgi(batch, concurrency))
+            else:
+                results, elapsed = run_wsgi(batch, concurrency)
+        result[interface] = summarize_throughput(results, elapsed, concurrency)
+    return result
@@ -0,0 +1,107 @@
+import hashlib
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils.safestring import mark_safe
+
+STATS_KEYS = {"hits": "forum:fragment:hits", "misses": "forum:fragment:misses"}
+
+def _generation_key(topic_id):
+    return f"forum:topic:{topic_id}:generation"
+
+
+INDEX_GENERATION_KEY = "forum:index:generation"
+
+TAGS_GENERATION_KEY = "forum:tags:generation"
+
+
+def _new_generation():
+    # 世代番号は変更した時刻 (ナノ秒)。キーが消えても過去の世代番号と衝突せず、
+    # Last-Modified にも使える
+    return time.time_ns()
+
+
+def topic_generation(topic_id):
+    return cache.get_or_set(_generation_key(topic_id), _new_generation, None)
+
+
+def index_generation():
+    # いずれかのトピックが変更されると変わる
+    return cache.get_or_set(INDEX_GENERATION_KEY, _new_generation, None)
+
+
+def tags_generation():
+    # タグが追加・変更・削除されると変わる (すべてのトピックの投稿フォームに出る)
+    return cache.get_or_set(TAGS_GENERATION_KEY, _new_generation, None)
+
+
+def invalidate_tags():
+    cache.set(TAGS_GENERATION_KEY, _new_generation(), None)
+
+
+def generation_time(generation):
+    return generation / 1e9
+
+
+def invalidate_topic(*topic_ids):
+    if not topic_ids:
+        return
+    generation = _new_generation()
+    cache.set_many(
+        {_generation_key(topic_id): generation for topic_id in set(topic_ids)}, None
+    )
+    cache.set(INDEX_GENERATION_KEY, generation, None)
+
+
+def fragment_key(topic_id, language, params):
+    digest = hashlib.md5(
+        "&".join(f"{k}={v}" for k, v in sorted(params.items())).encode()
+    ).hexdigest()
+    return (
+        f"forum:fragment:{topic_id}:{topic_generation(topic_id)}:{language}:{digest}"
+    )
+
+
+def csrf_placeholder():
+    # キャッシュする断片には CSRF トークンの代わりにこの文字列を埋め込み、
+    # リクエストごとに本物のトークンへ置き換える。投稿の本文に同じ文字列を
+    # 書かれても置き換えないよう、描画のたびに推測できない値にする
+    return f"__forum_csrf_{secrets.token_hex(16)}__"
+
+
+def get_fragment(key):
+    """(CSRF トークンの代わりの文字列, HTML) を返す。なければ None"""
+    fragment = cache.get(key)
+    _count("hits" if fragment is not None else "misses")
+    return fragment
+
+
+def set_fragment(key, placeholder, html):
+    cache.set(
+        key,
+        (placeholder, html),
+        getattr(settings, "FORUM_FRAGMENT_CACHE_TIMEOUT", 300),
+    )
+
+
+def render_fragment(request, placeholder, html):
+    return mark_safe(html.replace(placeholder, get_token(request)))
+
+
+def _count(name):
+    try:
+        cache.incr(STATS_KEYS[name])
+    except ValueError:
+        cache.add(STATS_KEYS[name], 0, None)
+        cache.incr(STATS_KEYS[name])
+
+
+def stats():
+    return {name: cache.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core import checks
+
+# プロセスごとに別々の値を持つキャッシュ
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """世代番号をすべてのワーカーで共有できるキャッシュか確かめる。
+
+    トピックのキャッシュ (forum.topics) や断片キャッシュは世代番号が変わるまで
+    読み込み直さないので、ワーカーごとのキャッシュでは別のワーカーの変更に
+    気づけない。
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        checks.Error(
+            f"The forum needs a cache shared by all workers, not {backend}.",
+            hint="Use memcached, Redis or another shared backend for "
+            "CACHES['default'].",
+            id="forum.E001",
+        )
+    ]
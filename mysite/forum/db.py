@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# 同時に書き込まれても "database is locked" になりにくく、読み取りが書き込みを
+# 待たないようにする
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "busy_timeout": 5000,
+    "synchronous": "normal",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20000,  # 負の値は KiB 単位
+}
+
+_use_read_database = ContextVar("forum_use_read_database", default=False)
+
+
+def is_read_only(connection):
+    return "mode=ro" in str(connection.settings_dict["NAME"])
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created で SQLite の接続に PRAGMA を設定する。"""
+    if connection.vendor != "sqlite":
+        return
+
+    pragmas = dict(getattr(settings, "FORUM_SQLITE_PRAGMAS", DEFAULT_SQLITE_PRAGMAS))
+    if connection.is_in_memory_db() or is_read_only(connection):
+        # ジャーナルモードはファイルに記録されるので、書き込める接続で設定する
+        pragmas.pop("journal_mode", None)
+    if is_read_only(connection):
+        pragmas["query_only"] = "on"
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def get_read_database():
+    """FORUM_READ_DATABASE の別名。使えない場合は None。
+
+    プライマリと同じデータベースを指す場合 (テストのミラーなど) も None を返す。
+    別の接続から読むと、自分の書き込みが見えなくなるだけで利点がない。
+    """
+    alias = getattr(settings, "FORUM_READ_DATABASE", None)
+    if not alias or alias not in connections.settings:
+        return None
+    name = str(connections[alias].settings_dict["NAME"])
+    if name == str(connections[DEFAULT_DB_ALIAS].settings_dict["NAME"]):
+        return None
+    return alias
+
+
+@contextmanager
+def use_read_database():
+    """このブロック内の読み取りを FORUM_READ_DATABASE に送る。"""
+    token = _use_read_database.set(True)
+    try:
+        yield
+    finally:
+        _use_read_database.reset(token)
+
+
+class ReadWriteRouter:
+    """use_read_database() の中の読み取りを読み取り専用の接続に、
+    書き込みはすべてプライマリに送る。"""
+
+    def db_for_read(self, model, **hints):
+        if _use_read_database.get():
+            return get_read_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # 読み取り専用の接続から読んだインスタンスもプライマリに保存する
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, get_read_database()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db != DEFAULT_DB_ALIAS and db == getattr(
+            settings, "FORUM_READ_DATABASE", None
+        ):
+            return False
+        return None
@@ -0,0 +1,428 @@
+"""トピックの新着メッセージ・コメントを Server-Sent Events で配信する。
+
+新着はデータベースの ID の最高水位 (watermark) をポーリングして見つけるので、
+別のワーカーで投稿された分も届く。ワーカーのプロセスごとに 1 つの EventBroker が
+1 回のポーリングの結果を購読者 (SSE の接続) ごとのキューに配る。同じプロセスでの
+投稿はコミット時に wake() でポーリングを前倒しする。
+
+ASGI では EventStreamRouter が Django を通さずに接続を受け持つ (Django 4.0 の
+ASGIHandler はストリーミングの応答をイベントループ上で同期的に読むため)。
+待機中の接続はキューを待つコルーチンだけなので、1 トピックに数千の購読者が
+いても負荷はほぼ増えない。WSGI では forum.views.EventStreamView が
+接続ごとにスレッドでポーリングする。
+"""
+import asyncio
+import heapq
+import json
+import logging
+import re
+import time
+from collections import defaultdict, namedtuple
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max
+
+from .db import use_read_database
+from .models import Comment, Message
+from .topics import get_topic
+
+logger = logging.getLogger(__name__)
+
+# /forum/<topic>/events/ (言語のプレフィックス付きも)
+EVENTS_PATH_RE = re.compile(r"^/(?:[\w-]+/)?forum/(?P<topic>[^/]+)/events/$")
+
+RETRY_MS = 3000
+
+HEARTBEAT = b": ping\n\n"
+
+Watermark = namedtuple("Watermark", ["message_id", "comment_id"])
+
+Event = namedtuple("Event", ["type", "id", "data"])
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def format_watermark(watermark):
+    return f"{watermark.message_id}-{watermark.comment_id}"
+
+
+def parse_watermark(value):
+    """Last-Event-ID の値を Watermark にする。解釈できなければ None。"""
+    try:
+        message_id, comment_id = (int(part) for part in (value or "").split("-"))
+    except ValueError:
+        return None
+    if message_id < 0 or comment_id < 0:
+        return None
+    return Watermark(message_id, comment_id)
+
+
+def get_watermark():
+    with use_read_database():
+        message_id = Message.objects.aggregate(id=Max("id"))["id"]
+        comment_id = Comment.objects.aggregate(id=Max("id"))["id"]
+    return Watermark(message_id or 0, comment_id or 0)
+
+
+def encode(event_type, watermark, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return (
+        f"id: {format_watermark(watermark)}\nevent: {event_type}\n"
+        f"data: {payload}\n\n"
+    ).encode()
+
+
+def fetch_events(after, until, topic_ids, limit=None):
+    """after より後、until までに投稿されたメッセージとコメントを返す。
+
+    (topic_id, Event) のリストを投稿順に返す。Event.data は SSE のイベントを
+    エンコードしたもので、id にはそのイベントまでの Watermark を入れる。
+    """
+    if not topic_ids or after == until:
+        return []
+
+    with use_read_database():
+        messages = (
+            Message.objects.filter(
+                id__gt=after.message_id,
+                id__lte=until.message_id,
+                topic_id__in=topic_ids,
+            )
+            .order_by("id")
+            .values("id", "topic_id", "content", "created_at", "image")
+        )
+        comments = (
+            Comment.objects.filter(
+                id__gt=after.comment_id,
+                id__lte=until.comment_id,
+                message__topic_id__in=topic_ids,
+            )
+            .order_by("id")
+            .values("id", "message_id", "message__topic_id", "content", "created_at")
+        )
+        if limit is not None:
+            messages, comments = messages[:limit], comments[:limit]
+        rows = heapq.merge(
+            (("message", row) for row in messages),
+            (("comment", row) for row in comments),
+            key=lambda item: item[1]["created_at"],
+        )
+
+        image_storage = Message._meta.get_field("image").storage
+        events = []
+        message_id, comment_id = after
+        for event_type, row in rows:
+            if event_type == "message":
+                message_id = row["id"]
+                topic_id = row["topic_id"]
+                data = {
+                    "id": row["id"],
+                    "content": row["content"],
+                    "created_at": row["created_at"].isoformat(),
+                    "image": image_storage.url(row["image"]) if row["image"] else None,
+                }
+            else:
+                comment_id = row["id"]
+                topic_id = row["message__topic_id"]
+                data = {
+                    "id": row["id"],
+                    "message": row["message_id"],
+                    "content": row["content"],
+                    "created_at": row["created_at"].isoformat(),
+                }
+            watermark = Watermark(message_id, comment_id)
+            events.append(
+                (topic_id, Event(event_type, row["id"], encode(event_type, watermark, data)))
+            )
+    return events[:limit] if limit is not None else events
+
+
+def replay_events(after, until, topic_id):
+    """再接続したクライアントが受け取っていないイベント。
+
+    多すぎる場合はページを読み込み直させる。
+    """
+    limit = get_setting("FORUM_EVENTS_REPLAY_LIMIT", 100)
+    events = [event for _, event in fetch_events(after, until, [topic_id], limit + 1)]
+    if len(events) > limit:
+        return [Event("reload", None, encode("reload", until, {}))]
+    return events
+
+
+class Subscriber:
+    def __init__(self, topic_id, size):
+        self.topic_id = topic_id
+        self.queue = asyncio.Queue(size)
+        # キューがあふれたら接続を閉じ、Last-Event-ID で再接続させる
+        self.overflowed = False
+
+    def put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventBroker:
+    """プロセス内の購読者にイベントを配る。
+
+    購読者がいる間だけ、イベントループ上のタスクが FORUM_EVENTS_POLL_INTERVAL
+    秒ごとに最高水位を調べ、増えていれば購読中のトピックの分をまとめて取得する。
+    購読者の数によらず 1 回のポーリングは高々 4 クエリで、エンコードも 1 回で済む。
+    """
+
+    def __init__(self, poll_interval=None, heartbeat=None, queue_size=None):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.subscribers = defaultdict(set)
+        self.watermark = None
+        self.loop = None
+        self.task = None
+        self.wakeup = None
+
+    def get_poll_interval(self):
+        return self.poll_interval or get_setting("FORUM_EVENTS_POLL_INTERVAL", 1.0)
+
+    def get_heartbeat(self):
+        return self.heartbeat or get_setting("FORUM_EVENTS_HEARTBEAT", 15)
+
+    async def subscribe(self, topic_id):
+        """購読を始め、その時点の最高水位を返す。"""
+        loop = asyncio.get_running_loop()
+        if not self.running(loop):
+            watermark = await sync_to_async(run_query)(get_watermark)
+            # 待っている間に他の接続が始めていなければ
+            if not self.running(loop):
+                self.loop = loop
+                self.wakeup = asyncio.Event()
+                self.watermark = watermark
+                self.task = loop.create_task(self.poll())
+        subscriber = Subscriber(
+            topic_id, self.queue_size or get_setting("FORUM_EVENTS_QUEUE_SIZE", 100)
+        )
+        self.subscribers[topic_id].add(subscriber)
+        return subscriber, self.watermark
+
+    def running(self, loop):
+        return self.task is not None and not self.task.done() and self.loop is loop
+
+    def unsubscribe(self, subscriber):
+        subscribers = self.subscribers.get(subscriber.topic_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[subscriber.topic_id]
+        if not self.subscribers and self.wakeup is not None:
+            # 購読者がいなくなったらポーリングを止める
+            self.wakeup.set()
+
+    def wake(self):
+        """新しい投稿をすぐに配信させる。どのスレッドからでも呼べる。"""
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.wakeup.set)
+
+    def publish(self, topic_id, event):
+        for subscriber in self.subscribers.get(topic_id, ()):
+            subscriber.put(event)
+
+    def broadcast(self, event):
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.put(event)
+
+    async def poll(self):
+        last_sent = time.monotonic()
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.get_poll_interval())
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not self.subscribers:
+                break
+            try:
+                sent = await self.poll_once()
+            except Exception:
+                logger.exception("Failed to poll forum events")
+                sent = False
+            now = time.monotonic()
+            if sent:
+                last_sent = now
+            elif now - last_sent >= self.get_heartbeat():
+                # プロキシにアイドルの接続を切られないようにする
+                self.broadcast(Event("ping", None, HEARTBEAT))
+                last_sent = now
+
+    async def poll_once(self):
+        watermark = await sync_to_async(run_query)(get_watermark)
+        if watermark == self.watermark:
+            return False
+        events = await sync_to_async(run_query)(
+            fetch_events, self.watermark, watermark, list(self.subscribers)
+        )
+        self.watermark = watermark
+        for topic_id, event in events:
+            self.publish(topic_id, event)
+        return bool(events)
+
+
+def run_query(func, *args):
+    # リクエストの外で接続を使うので、開始・終了時と同じ後始末をする
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+broker = EventBroker()
+
+
+async def stream(topic_id, last_event_id=None, broker=broker):
+    """SSE の本文を bytes で順に返す。"""
+    subscriber, watermark = await broker.subscribe(topic_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        after = parse_watermark(last_event_id)
+        replayed = Watermark(0, 0)
+        if after is not None:
+            events = await sync_to_async(run_query)(
+                replay_events, after, watermark, topic_id
+            )
+            for event in events:
+                yield event.data
+            replayed = watermark
+
+        while True:
+            event = await subscriber.queue.get()
+            if event is None:
+                return
+            # 再送した分と重複するイベントは飛ばす
+            if event.type == "message" and event.id <= replayed.message_id:
+                continue
+            if event.type == "comment" and event.id <= replayed.comment_id:
+                continue
+            yield event.data
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+def stream_sync(topic_id, last_event_id=None):
+    """WSGI 用。接続ごとにポーリングし、FORUM_EVENTS_STREAM_TIMEOUT 秒で終わる。
+
+    クライアントは Last-Event-ID を付けて再接続するので取りこぼしはない。
+    接続はリクエストのものをそのまま使う。
+    """
+    yield f"retry: {RETRY_MS}\n\n".encode()
+    watermark = get_watermark()
+    after = parse_watermark(last_event_id)
+    if after is not None:
+        for event in replay_events(after, watermark, topic_id):
+            yield event.data
+
+    deadline = time.monotonic() + get_setting("FORUM_EVENTS_STREAM_TIMEOUT", 60)
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        time.sleep(get_setting("FORUM_EVENTS_POLL_INTERVAL", 1.0))
+        latest = get_watermark()
+        for _, event in fetch_events(watermark, latest, [topic_id]):
+            yield event.data
+            last_sent = time.monotonic()
+        watermark = latest
+        if time.monotonic() - last_sent >= get_setting("FORUM_EVENTS_HEARTBEAT", 15):
+            yield HEARTBEAT
+            last_sent = time.monotonic()
+
+
+EVENT_STREAM_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    # nginx のバッファリングを止める
+    (b"x-accel-buffering", b"no"),
+]
+
+
+class EventStreamRouter:
+    """/forum/<topic>/events/ を Django の外で処理する ASGI アプリケーション。
+
+    それ以外のリクエストは application に渡す。
+    """
+
+    def __init__(self, application, broker=broker):
+        self.application = application
+        self.broker = broker
+
+    async def __call__(self, scope, receive, send):
+        match = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            match = EVENTS_PATH_RE.match(scope["path"])
+        if match is None:
+            return await self.application(scope, receive, send)
+
+        topic = await sync_to_async(run_query)(get_topic, unquote(match["topic"]))
+        if topic is None:
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": EVENT_STREAM_HEADERS,
+            }
+        )
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers = dict(scope.get("headers", ()))
+        last_event_id = headers.get(b"last-event-id", b"").decode("latin1")
+        await self.send_events(topic.id, last_event_id, receive, send)
+
+    async def send_events(self, topic_id, last_event_id, receive, send):
+        events = stream(topic_id, last_event_id, self.broker)
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            while True:
+                chunk = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait(
+                    {chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not chunk.done():
+                    chunk.cancel()
+                    try:
+                        await chunk
+                    except (asyncio.CancelledError, StopAsyncIteration):
+                        pass
+                    break
+                try:
+                    body = chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": True}
+                )
+            if not disconnected.done():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            await events.aclose()
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
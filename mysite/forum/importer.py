@@ -0,0 +1,358 @@
+"""JSON Lines 形式のダンプを Topic / Message / Comment / Tag に取り込む。
+
+1 行 1 レコードで、type ごとに次のキーを持つ::
+
+    {"type": "topic", "name": "Python"}
+    {"type": "tag", "name": "質問"}
+    {"type": "message", "id": 1, "topic": "Python", "user": "alice",
+     "content": "...", "created_at": "2022-02-25T14:02:00+09:00", "tags": ["質問"]}
+    {"type": "comment", "id": 1, "message": 1, "user": "bob",
+     "content": "...", "created_at": "2022-02-25T15:00:00+09:00"}
+
+message / comment の id はそのまま主キーとして使うので、再実行しても重複しない。
+同じ id の行が内容の異なるまま既にあれば、別のデータと混ざらないよう取り込みを
+中止する。ユーザーは username で引き当て、存在しなければパスワードなしで作成する。
+"""
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import CustomUser
+from .cache import invalidate_topic
+from .models import (
+    ImportCheckpoint,
+    Tag,
+    Topic,
+    TopicTag,
+    TopicTerm,
+    Message,
+    Comment,
+)
+from .storage import message_image_storage
+from .terms import extract_terms
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, line, reason):
+        super().__init__(f"line {line}: {reason}")
+        self.line = line
+
+
+class ImportConflict(ValueError):
+    pass
+
+
+def add_counts(queryset, counts, batch_size=500):
+    """{(topic_id, 値): 件数} を TopicTag / TopicTerm の add でまとめて加算する"""
+    groups = defaultdict(list)
+    for (topic_id, value), num in counts.items():
+        groups[topic_id, num].append(value)
+    for (topic_id, num), values in groups.items():
+        for i in range(0, len(values), batch_size):
+            queryset.add(topic_id, values[i : i + batch_size], num)
+
+
+@contextmanager
+def keep_created_at(model):
+    """created_at の auto_now_add を外し、インスタンスの値をそのまま保存させる。
+
+    フィールドはプロセスで共有されるので、取り込みコマンドの中でだけ使う。
+    """
+    field = model._meta.get_field("created_at")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+# 既存の行と同じレコードかどうかを比べるフィールド
+CONFLICT_FIELDS = {
+    Message: ("topic_id", "user_id", "content"),
+    Comment: ("message_id", "user_id", "content"),
+}
+
+
+class Importer:
+    """ダンプをチャンク単位のトランザクションで取り込む。
+
+    メモリに持つのはユーザー・トピック・タグの名前から主キーへの対応表と
+    1 チャンク分のレコード、まだメッセージが現れていないコメントだけである。
+    チャンクを書き込むたびに同じトランザクションで読み込み位置を記録するため、
+    途中で止まっても次回はその続きから再開できる。読み込み位置は保留中の
+    コメントより先へは進めないので、再開してもそのコメントは失われない。
+    トピックの最終アクティビティと件数は最後のチャンクでまとめて数え直すため、
+    途中で止まった間は古いままになる (再開した回はすべてのトピックを数え直す)。
+    """
+
+    def __init__(self, path, chunk_size=5000, resume=True, stdout=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.resume = resume
+        self.stdout = stdout
+
+        self.users = {}
+        self.topics = dict(Topic.objects.values_list("name", "pk"))
+        self.tags = dict(Tag.objects.values_list("name", "pk"))
+
+        self.rows = 0
+        self.skipped = 0
+        # 最終アクティビティを最後のチャンクで数え直すトピック (None は全件)
+        self.activity_topics = set()
+        # メッセージより前に現れたコメント: [((offset, lines), Comment), ...]
+        self.pending = []
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self.messages = []
+        self.message_tags = []
+        self.comments = []
+
+    def run(self):
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=str(self.path))
+        if not self.resume:
+            checkpoint.offset = checkpoint.lines = 0
+        offset, line_no = checkpoint.offset, checkpoint.lines
+        if offset:
+            # 前回までに取り込んだトピックは分からないので、すべて数え直す
+            self.activity_topics = None
+
+        start = time.perf_counter()
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                position = (offset, line_no)
+                offset += len(raw)
+                line_no += 1
+                if raw.strip():
+                    self.add(line_no, raw, position)
+                if len(self.messages) + len(self.comments) >= self.chunk_size:
+                    self.flush(checkpoint, offset, line_no, start)
+            self.flush(checkpoint, offset, line_no, start, last=True)
+
+        elapsed = time.perf_counter() - start
+        return {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "lines": line_no,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def add(self, line_no, raw, position):
+        # position はこの行の直前の (読み込み位置, 行数)
+        try:
+            record = json.loads(raw)
+            kind = record["type"]
+        except (ValueError, KeyError, TypeError):
+            raise InvalidRecord(line_no, "not a JSON object with a type")
+
+        try:
+            if kind == "topic":
+                self.resolve_topics([record["name"]])
+            elif kind == "tag":
+                self.resolve_tags([record["name"]])
+            elif kind == "message":
+                message = Message(
+                    id=int(record["id"]),
+                    topic_id=self.resolve_topics([record["topic"]])[0],
+                    user_id=self.resolve_users([record["user"]])[0],
+                    content=record["content"],
+                    image=record.get("image") or None,
+                    created_at=self.parse_date(record.get("created_at")),
+                )
+                self.messages.append(message)
+                for tag_id in self.resolve_tags(record.get("tags", [])):
+                    self.message_tags.append((tag_id, message.id))
+            elif kind == "comment":
+                comment = Comment(
+                    id=int(record["id"]),
+                    message_id=int(record["message"]),
+                    user_id=self.resolve_users([record["user"]])[0],
+                    content=record["content"],
+                    created_at=self.parse_date(record.get("created_at")),
+                )
+                self.comments.append((position, comment))
+            else:
+                raise InvalidRecord(line_no, f"unknown type {kind!r}")
+        except (KeyError, TypeError, ValueError) as e:
+            if isinstance(e, InvalidRecord):
+                raise
+            raise InvalidRecord(line_no, f"invalid {kind} record ({e!r})")
+
+    def parse_date(self, value):
+        if not value:
+            return timezone.now()
+        date = parse_datetime(value)
+        if date is None:
+            raise ValueError(f"invalid date {value!r}")
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def resolve_users(self, names):
+        missing = [name for name in names if name not in self.users]
+        if missing:
+            self.users.update(
+                CustomUser.objects.filter(username__in=missing).values_list(
+                    "username", "pk"
+                )
+            )
+            for name in missing:
+                if name not in self.users:
+                    user = CustomUser(username=name)
+                    user.set_unusable_password()
+                    user.save()
+                    self.users[name] = user.pk
+        return [self.users[name] for name in names]
+
+    def resolve_topics(self, names):
+        for name in names:
+            if name not in self.topics:
+                self.topics[name] = Topic.objects.get_or_create(name=name)[0].pk
+        return [self.topics[name] for name in names]
+
+    def resolve_tags(self, names):
+        for name in names:
+            if name not in self.tags:
+                self.tags[name] = Tag.objects.get_or_create(name=name)[0].pk
+        return [self.tags[name] for name in names]
+
+    def new_rows(self, model, rows):
+        """まだ取り込んでいない行だけを返す。
+
+        同じ id の行が既にあれば読み飛ばすが、内容が異なる場合は
+        ImportConflict を送出する (チャンクのトランザクションごと戻す)。
+        """
+        fields = CONFLICT_FIELDS[model]
+        name = model._meta.model_name
+        values = {}
+        for row in rows:
+            value = tuple(getattr(row, field) for field in fields)
+            if values.setdefault(row.id, value) != value:
+                raise ImportConflict(
+                    f"{name} {row.id} appears twice with different data"
+                )
+        existing = set()
+        for pk, *value in model.objects.filter(pk__in=values).values_list(
+            "pk", *fields
+        ):
+            if tuple(value) != values[pk]:
+                raise ImportConflict(f"{name} {pk} already exists with different data")
+            existing.add(pk)
+
+        new = {}
+        for row in rows:
+            if row.id not in existing:
+                new.setdefault(row.id, row)
+        return list(new.values())
+
+    def bulk_create(self, model, rows):
+        # auto_now_add は bulk_create でも現在時刻で上書きするので外しておく
+        with keep_created_at(model):
+            model.objects.bulk_create(rows)
+
+    def refresh_activity(self, batch_size=500):
+        # トピックの全メッセージを読むので、チャンクごとではなく最後に 1 度だけ行う
+        if self.activity_topics is None:
+            Topic.objects.refresh_activity()
+            return
+        topic_ids = sorted(self.activity_topics)
+        for i in range(0, len(topic_ids), batch_size):
+            topics = Topic.objects.filter(pk__in=topic_ids[i : i + batch_size])
+            topics.refresh_activity()
+
+    def flush(self, checkpoint, offset, line_no, start, last=False):
+        with transaction.atomic():
+            messages = self.new_rows(Message, self.messages)
+            self.bulk_create(Message, messages)
+            # save() を通らないので、画像の参照数もここで数える
+            message_image_storage.add_references(m.image.name for m in messages)
+
+            # メッセージがまだないコメントは、ファイルの最後まで保留する
+            comments = self.pending + self.comments
+            message_ids = {comment.message_id for _, comment in comments}
+            existing = set(
+                Message.objects.filter(pk__in=message_ids).values_list("pk", flat=True)
+            )
+            self.pending = [c for c in comments if c[1].message_id not in existing]
+            comments = self.new_rows(
+                Comment, [c for _, c in comments if c.message_id in existing]
+            )
+
+            # 取り込み済みのメッセージに付いているタグは数えない
+            tags = set(self.message_tags)
+            new_ids = {m.id for m in messages}
+            Through = Tag.message.through
+            tags -= set(
+                Through.objects.filter(
+                    message_id__in={m for _, m in tags} - new_ids
+                ).values_list("tag_id", "message_id")
+            )
+            Through.objects.bulk_create(
+                [
+                    Through(tag_id=tag_id, message_id=message_id)
+                    for tag_id, message_id in tags
+                ]
+            )
+            self.bulk_create(Comment, comments)
+
+            # シグナルを通らないので集計列をここで更新する
+            touched_messages = {m.id for m in messages} | {
+                c.message_id for c in comments
+            }
+            topic_ids = set(
+                Message.objects.filter(pk__in=touched_messages).values_list(
+                    "topic_id", flat=True
+                )
+            )
+            Message.objects.filter(pk__in=touched_messages).refresh_replies()
+            if self.activity_topics is not None:
+                # 前回の実行で取り込み済みの行を読み直した場合も数え直す
+                self.activity_topics |= topic_ids
+                self.activity_topics.update(m.topic_id for m in self.messages)
+            # チャンクごとに数え直すとトピックの全メッセージを毎回読むので、
+            # このチャンクで増えた分だけを加算する
+            message_topics = {m.id: m.topic_id for m in self.messages}
+            topic_ids.update(message_topics[m] for _, m in tags)
+            add_counts(
+                TopicTag.objects,
+                Counter((message_topics[m], tag_id) for tag_id, m in tags),
+            )
+            add_counts(
+                TopicTerm.objects,
+                Counter(
+                    (m.topic_id, term)
+                    for m in messages
+                    for term in extract_terms(m.content)
+                ),
+            )
+
+            if last:
+                # 最後まで読んでもメッセージが現れなかったコメントは読み飛ばす
+                self.skipped += len(self.pending)
+                self.pending = []
+                self.refresh_activity()
+                if self.activity_topics is None:
+                    topic_ids.update(Topic.objects.values_list("pk", flat=True))
+                else:
+                    topic_ids |= self.activity_topics
+            if self.pending:
+                checkpoint.offset, checkpoint.lines = min(p for p, _ in self.pending)
+            else:
+                checkpoint.offset, checkpoint.lines = offset, line_no
+            checkpoint.save()
+
+            transaction.on_commit(lambda: invalidate_topic(*topic_ids))
+
+        self.rows += len(messages) + len(tags) + len(comments)
+        if self.stdout is not None:
+            elapsed = time.perf_counter() - start
+            rate = self.rows / elapsed if elapsed else 0.0
+            self.stdout.write(f"line {line_no}: {self.rows} rows ({rate:.0f} rows/sec)")
+        self._reset_chunk()
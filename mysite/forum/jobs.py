@@ -0,0 +1,114 @@
+"""データベースを使った簡易ジョブキュー。
+
+enqueue() で Job を積み、process_jobs コマンドのワーカーが取り出して実行する。
+取り出しは status を条件にした UPDATE で行うので、複数のプロセスやスレッドで
+同じジョブを二重に実行することはない。実行中のまま FORUM_JOB_LEASE 秒が
+過ぎたジョブは、ワーカーが落ちたものとみなして取り出し直す。
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+DEFAULT_LEASE = 600
+
+handlers = {}
+
+
+def register(kind):
+    def decorator(func):
+        handlers[kind] = func
+        return func
+
+    return decorator
+
+
+def enqueue(kind, **payload):
+    # リクエストのトランザクションが確定してから積む
+    transaction.on_commit(lambda: Job.objects.create(kind=kind, payload=payload))
+
+
+def claimable():
+    # 待機中のジョブと、期限 (updated_at + FORUM_JOB_LEASE) の切れた実行中のジョブ
+    lease = getattr(settings, "FORUM_JOB_LEASE", DEFAULT_LEASE)
+    expired = timezone.now() - timedelta(seconds=lease)
+    return Q(status=Job.PENDING) | Q(status=Job.RUNNING, updated_at__lt=expired)
+
+
+def claim():
+    # 試行回数を使い切ったまま期限の切れたジョブは、もう一度は実行しない
+    Job.objects.filter(
+        claimable(), status=Job.RUNNING, attempts__gte=MAX_ATTEMPTS
+    ).update(status=Job.FAILED, last_error="lease expired", updated_at=timezone.now())
+    for pk in Job.objects.filter(claimable()).order_by("id").values_list(
+        "pk", flat=True
+    )[:10]:
+        # update() は auto_now を更新しないので、期限の起点を明示して延ばす
+        claimed = Job.objects.filter(claimable(), pk=pk).update(
+            status=Job.RUNNING, attempts=F("attempts") + 1, updated_at=timezone.now()
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(job):
+    try:
+        handlers[job.kind](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        job.status = Job.PENDING if job.attempts < MAX_ATTEMPTS else Job.FAILED
+        logger.exception(
+            "Job failed", extra={"job_id": job.pk, "kind": job.kind, "attempts": job.attempts}
+        )
+    else:
+        job.status = Job.DONE
+        job.last_error = ""
+    job.save(update_fields=["status", "last_error", "updated_at"])
+
+
+def work(stop, once=False, interval=1.0):
+    while not stop.is_set():
+        if not connection.in_atomic_block:
+            close_old_connections()
+        job = claim()
+        if job is None:
+            if once:
+                return
+            stop.wait(interval)
+            continue
+        run(job)
+
+
+def run_workers(workers=2, once=False, interval=1.0):
+    stop = threading.Event()
+    if workers <= 1:
+        # 1 つだけなら呼び出したスレッドでそのまま実行する
+        try:
+            work(stop, once, interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(work, stop, once, interval) for _ in range(workers)]
+        try:
+            while not all(future.done() for future in futures):
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            stop.set()
+        for future in futures:
+            future.result()
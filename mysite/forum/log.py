@@ -0,0 +1,123 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+# リクエスト単位の情報。RequestLogMiddleware が設定し、RequestContextFilter が付与する
+request_context = contextvars.ContextVar("forum_request_context", default={})
+
+CONTEXT_FIELDS = ("request_id", "user_id", "topic", "view")
+
+# LogRecord が標準で持つ属性。これ以外は extra として JSON に含める
+RESERVED_ATTRS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None)).keys()
+) | {"message", "asctime"}
+
+
+class RequestContextFilter(logging.Filter):
+    """リクエスト ID・ユーザー ID・トピック・ビュー名をレコードに付与する。"""
+
+    def filter(self, record):
+        context = request_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """ロガー名ごとの割合でレコードを間引く。WARNING 以上は必ず通す。"""
+
+    def __init__(self, rates=None, always_level=logging.WARNING):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.always_level = always_level
+
+    def get_rate(self, name):
+        # 最も長く一致するロガー名の割合を使う ("forum" は "forum.views" にも効く)
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= self.always_level:
+            return True
+        rate = self.get_rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LazyRotatingFileHandler(RotatingFileHandler):
+    """最初に書き込むときにディレクトリを作る RotatingFileHandler"""
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
+class QueueListenerHandler(QueueHandler):
+    """リクエストスレッドではキューに積むだけにし、書き込みは別スレッドで行う。
+
+    書き込み先はサイズでローテーションする RotatingFileHandler。
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5):
+        super().__init__(queue.SimpleQueue())
+        self.target = LazyRotatingFileHandler(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self.target.setFormatter(JsonLinesFormatter())
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.listening = True
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # 文字列化と例外の整形だけ済ませ、JSON への変換は書き込みスレッドに任せる
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def stop(self):
+        # close() と atexit の両方から呼ばれる
+        if self.listening:
+            self.listening = False
+            self.listener.stop()
+        self.target.close()
+
+    def close(self):
+        self.stop()
+        super().close()
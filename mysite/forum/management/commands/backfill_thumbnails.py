@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Job, Message
+
+
+class Command(BaseCommand):
+    help = "画像付きでサムネイルのないメッセージのサムネイル作成ジョブを登録します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true", help="作成済みのメッセージも作り直す"
+        )
+
+    def handle(self, *args, **options):
+        messages = Message.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["force"]:
+            messages = messages.filter(thumbnails=[])
+
+        ids = messages.values_list("pk", flat=True).iterator()
+        created = 0
+        batch = []
+        for pk in ids:
+            payload = {"message_id": pk}
+            if options["force"]:
+                payload["force"] = True
+            batch.append(Job(kind="thumbnails", payload=payload))
+            if len(batch) >= 1000:
+                created += len(Job.objects.bulk_create(batch))
+                batch = []
+        created += len(Job.objects.bulk_create(batch))
+        self.stdout.write(self.style.SUCCESS(f"{created} thumbnail jobs enqueued."))
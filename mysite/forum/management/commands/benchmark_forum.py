@@ -0,0 +1,125 @@
+import json
+import platform
+import subprocess
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+from django.utils import timezone
+
+from forum.benchmark import SCALES, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "合成データを規模ごとに作成し、IndexView・ForumView・投稿の応答時間、"
+        "クエリ数、ピークメモリを計測して JSON に保存します。"
+        "--concurrency を指定すると、同じデータで WSGI と ASGI のスループットも比較します。"
+        "計測はテスト用データベースで行い、既存のデータには触れません。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales",
+            default="tiny,small",
+            help=f"カンマ区切りの規模 ({', '.join(SCALES)})",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="シナリオごとの試行回数")
+        parser.add_argument(
+            "--with-cache",
+            action="store_true",
+            help="断片キャッシュを有効にしたまま計測する",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=0,
+            help="同時接続数。指定すると WSGI と ASGI のスループットも比較する",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="スループットの比較で送るリクエスト数",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="結果を保存する JSON ファイル")
+
+    def handle(self, *args, **options):
+        scales = [name.strip() for name in options["scales"].split(",") if name.strip()]
+        unknown = [name for name in scales if name not in SCALES]
+        if unknown:
+            raise CommandError(f"Unknown scale: {', '.join(unknown)}")
+
+        setup_test_environment(debug=False)
+        report = {
+            "commit": self.get_commit(),
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "repeat": options["repeat"],
+            "fragment_cache": options["with_cache"],
+            "concurrency": options["concurrency"],
+            "scales": {},
+        }
+
+        with ExitStack() as stack:
+            if options["concurrency"] and connection.vendor == "sqlite":
+                # インメモリのデータベースは、別スレッドの接続が残っていると
+                # 作り直せないので、同時接続の計測ではファイルに作る
+                tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+                test_settings = connection.settings_dict["TEST"]
+                stack.callback(test_settings.__setitem__, "NAME", test_settings["NAME"])
+                test_settings["NAME"] = str(Path(tmpdir) / "benchmark.sqlite3")
+            self.run_scales(scales, options, report)
+
+        if options["output"]:
+            path = Path(options["output"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Saved to {path}"))
+        else:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    def run_scales(self, scales, options, report):
+        for name in scales:
+            self.stdout.write(f"{name}: {SCALES[name]}")
+            # 規模ごとに空のテスト用データベースを作り直す
+            old_name = connection.creation.create_test_db(verbosity=0, keepdb=False)
+            try:
+                # 読み取り専用の接続は本番のファイルを指すので使わない。
+                # 同じユーザーで続けて投稿するのでレート制限も外す
+                with override_settings(
+                    FORUM_FRAGMENT_CACHE=options["with_cache"],
+                    FORUM_READ_DATABASE=None,
+                    FORUM_THROTTLE_RATES={},
+                ):
+                    report["scales"][name] = run_benchmark(
+                        SCALES[name],
+                        repeat=options["repeat"],
+                        clear_cache=not options["with_cache"],
+                        seed=options["seed"],
+                        concurrency=options["concurrency"],
+                        requests=options["requests"],
+                        stdout=self.stdout,
+                    )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from forum.cache import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = "メッセージ一覧の断片キャッシュのヒット数・ミス数を表示します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="表示後にカウンタを 0 に戻す"
+        )
+
+    def handle(self, *args, **options):
+        counts = stats()
+        total = counts["hits"] + counts["misses"]
+        ratio = counts["hits"] / total if total else 0
+        self.stdout.write(
+            f"hits: {counts['hits']}  misses: {counts['misses']}  "
+            f"hit ratio: {ratio:.1%}"
+        )
+        if options["reset"]:
+            reset_stats()
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forum.importer import ImportConflict, Importer, InvalidRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "JSON Lines のダンプから Topic・Message・Comment・Tag を一括で取り込みます。"
+        "中断した場合は同じコマンドで続きから再開します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="取り込む .jsonl ファイル")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="1 トランザクションで書き込むメッセージ・コメントの件数",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="前回の読み込み位置を無視して先頭から取り込む",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"]).resolve()
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist.")
+
+        importer = Importer(
+            path,
+            chunk_size=options["chunk_size"],
+            resume=not options["restart"],
+            stdout=self.stdout,
+        )
+        try:
+            result = importer.run()
+        except (ImportConflict, InvalidRecord) as e:
+            raise CommandError(f"{path}: {e}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result['rows']} rows from {result['lines']} lines "
+                f"in {result['seconds']}s ({result['rows_per_second']} rows/sec), "
+                f"skipped {result['skipped']} comments."
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from forum import thumbnails  # noqa: F401 (ジョブの登録)
+from forum.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = "データベースのジョブキューからジョブを取り出して実行します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="ワーカースレッド数")
+        parser.add_argument(
+            "--once", action="store_true", help="待機中のジョブがなくなったら終了する"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0, help="ジョブがないときの待機秒数"
+        )
+
+    def handle(self, *args, **options):
+        run_workers(
+            workers=options["workers"],
+            once=options["once"],
+            interval=options["interval"],
+        )
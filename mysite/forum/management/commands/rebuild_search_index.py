@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from forum.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "メッセージの全文検索インデックスを再構築します。"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Search index rebuilt ({type(backend).__name__}).")
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Topic, TopicTag, TopicTerm, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Topic の最終アクティビティ日時とメッセージ数・コメント数、"
+        "Message のコメント数と最新コメント日時、トピックごとのタグと語の件数を"
+        "再計算します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("topics", nargs="*", help="対象のトピック名 (省略時は全件)")
+
+    def handle(self, *args, **options):
+        topics = Topic.objects.all()
+        messages = Message.objects.all()
+        if options["topics"]:
+            topics = topics.filter(name__in=options["topics"])
+            messages = messages.filter(topic__in=topics)
+        updated_messages = messages.refresh_replies()
+        updated_topics = topics.refresh_activity()
+        TopicTag.objects.rebuild(topics)
+        TopicTerm.objects.rebuild(topics)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{updated_topics} topics and {updated_messages} messages reconciled."
+            )
+        )
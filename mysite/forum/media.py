@@ -0,0 +1,191 @@
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import TEMP_DIR
+
+# ContentAddressedStorage の名前と、そこから作るサムネイルの名前
+IMMUTABLE_RE = re.compile(
+    r"^(thumbnails/)?images/[0-9a-f]{2}/[0-9a-f]{64}(-\d+w)?\.\w+$"
+)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def is_immutable(path):
+    return bool(IMMUTABLE_RE.match(path))
+
+
+def get_sendfile_header():
+    """FORUM_MEDIA_SENDFILE ("x-accel-redirect" / "x-sendfile") に対応するヘッダー名"""
+    backend = (getattr(settings, "FORUM_MEDIA_SENDFILE", None) or "").lower()
+    return {"x-accel-redirect": "X-Accel-Redirect", "x-sendfile": "X-Sendfile"}.get(
+        backend
+    )
+
+
+def parse_range(header, size):
+    """Range ヘッダーから (start, end) を返す。end は含む。
+
+    解釈できない、または複数範囲の指定は None (ファイル全体を返す)。
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # bytes=-N は末尾 N バイト
+        length = int(end)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        if start >= size:
+            raise RangeNotSatisfiable
+        return None
+    return start, end
+
+
+class RangeFile:
+    """ファイルの start から length バイトだけを読むラッパー。
+
+    fileno() を持つので、サーバーの wsgi.file_wrapper が sendfile を使える場合は
+    現在位置から Content-Length 分だけゼロコピーで送られる。
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+@require_safe
+def serve(request, path, document_root=None):
+    """MEDIA_ROOT のファイルを返す。
+
+    ETag / Last-Modified による 304、単一範囲の Range リクエストに対応する。
+    FORUM_MEDIA_SENDFILE を設定した場合は本体を返さず、フロントのプロキシに
+    X-Accel-Redirect / X-Sendfile で送信を任せる。
+    """
+    document_root = document_root or settings.MEDIA_ROOT
+    path = posixpath.normpath(path).lstrip("/")
+    if path.split("/", 1)[0] == TEMP_DIR:
+        # 書き込み中のアップロード
+        raise Http404
+    try:
+        fullpath = Path(safe_join(document_root, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = fullpath.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not fullpath.is_file():
+        raise Http404
+
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    content_type = content_type or "application/octet-stream"
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    sendfile_header = get_sendfile_header()
+    if response is None and sendfile_header:
+        # Range もプロキシが処理する
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == "X-Accel-Redirect":
+            prefix = getattr(settings, "FORUM_MEDIA_ACCEL_PREFIX", "/protected-media/")
+            response[sendfile_header] = prefix.rstrip("/") + "/" + quote(path)
+        else:
+            response[sendfile_header] = str(fullpath)
+    elif response is None:
+        response = file_response(
+            request, fullpath, stat, content_type, etag, last_modified
+        )
+
+    response.headers.setdefault("ETag", etag)
+    response.headers.setdefault("Last-Modified", http_date(stat.st_mtime))
+    if encoding and response.status_code != 304:
+        response["Content-Encoding"] = encoding
+    if is_immutable(path) and response.status_code in (200, 206, 304):
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def file_response(request, fullpath, stat, content_type, etag, last_modified):
+    size = stat.st_size
+    byte_range = None
+    header = request.headers.get("Range")
+    if header and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+        response["Content-Length"] = str(size)
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    file = fullpath.open("rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            RangeFile(file, start, length), content_type=content_type, status=206
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .log import request_context
+
+# 読み取りは件数が多いので別ロガーにしてサンプリングできるようにする
+read_logger = logging.getLogger("forum.access.read")
+write_logger = logging.getLogger("forum.access.write")
+
+
+class AsyncCapableMiddleware:
+    """同期・非同期どちらの get_response でも動くミドルウェアの基底クラス。
+
+    ASGI で非同期ビューを使うとき、同期専用のミドルウェアがあると
+    リクエストごとにスレッドへ切り替わってしまうため。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Django にコルーチン関数として扱わせる (MiddlewareMixin と同じ方法)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class RequestLogMiddleware(AsyncCapableMiddleware):
+    """リクエストごとに ID を振り、処理時間をアクセスログとして出力する。"""
+
+    def handle(self, request):
+        token, start = self.start(request)
+        try:
+            return self.finish(request, self.get_response(request), start)
+        finally:
+            request_context.reset(token)
+
+    async def __acall__(self, request):
+        token, start = self.start(request)
+        try:
+            return self.finish(request, await self.get_response(request), start)
+        finally:
+            request_context.reset(token)
+
+    def start(self, request):
+        request.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        token = request_context.set({"request_id": request.request_id})
+        return token, time.perf_counter()
+
+    def finish(self, request, response, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        if response.status_code >= 500:
+            level = logging.ERROR
+        elif response.status_code >= 400:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        logger = read_logger if request.method in ("GET", "HEAD") else write_logger
+        logger.log(
+            level,
+            "%s %s %s",
+            request.method,
+            request.get_full_path(),
+            response.status_code,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(duration_ms, 3),
+            },
+        )
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        user = getattr(request, "user", None)
+        request_context.set(
+            {
+                **request_context.get(),
+                "user_id": user.pk if user is not None and user.is_authenticated else None,
+                "topic": view_kwargs.get("topic"),
+                "view": request.resolver_match.view_name,
+            }
+        )
+
+
+sql_logger = logging.getLogger("forum.sql")
+
+# IN (%s, %s, ...) の要素数の違いは同じクエリとみなす
+IN_LIST_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    return WHITESPACE_RE.sub(" ", IN_LIST_RE.sub("(%s, ...)", sql)).strip()
+
+
+class QueryStats:
+    """connection.execute_wrapper に渡し、実行したクエリを記録する。"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        # 非同期ビューでは複数のスレッドから記録される
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.duration += duration
+                self.count += 1
+                self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: num for sql, num in self.fingerprints.items() if num > 1}
+
+    def record(self, *aliases):
+        # with stats.record(): ... の間に実行されたクエリを数える
+        stack = ExitStack()
+        for alias in aliases or connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+
+def get_query_budget(view_name):
+    return getattr(settings, "FORUM_QUERY_BUDGETS", {}).get(view_name)
+
+
+class QueryCountMiddleware(AsyncCapableMiddleware):
+    """ビューごとのクエリ数・SQL 時間・重複クエリを記録し、予算超過を警告する。"""
+
+    def handle(self, request):
+        stats = request.query_stats = QueryStats()
+        with stats.record():
+            response = self.get_response(request)
+        self.report(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        # 同期のコードはリクエストごとに同じスレッドで実行されるので、
+        # そのスレッドの接続に記録用のラッパーを付ける。非同期ビューが別の
+        # スレッドで実行するクエリは forum.async_views が記録する
+        stats = request.query_stats = QueryStats()
+        recording = await sync_to_async(stats.record)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        self.report(request, stats)
+        return response
+
+    def report(self, request, stats):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        duplicates = stats.duplicates
+        sql_logger.info(
+            "%s: %d queries in %.1f ms",
+            view_name,
+            stats.count,
+            stats.duration * 1000,
+            extra={
+                "query_count": stats.count,
+                "sql_ms": round(stats.duration * 1000, 3),
+                "duplicate_queries": sum(duplicates.values()),
+            },
+        )
+        for sql, num in duplicates.items():
+            sql_logger.warning(
+                "%s: query executed %d times: %s",
+                view_name,
+                num,
+                sql,
+                extra={"fingerprint": sql, "times": num},
+            )
+
+        budget = get_query_budget(view_name)
+        if budget is not None and stats.count > budget:
+            sql_logger.warning(
+                "%s: %d queries exceeds the budget of %d",
+                view_name,
+                stats.count,
+                budget,
+                extra={"query_count": stats.count, "query_budget": budget},
+            )
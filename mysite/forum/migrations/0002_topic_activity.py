@@ -0,0 +1,52 @@
+# Generated by Django 4.0.2 on 2026-10-18 14:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def populate_activity(apps, schema_editor):
+    Topic = apps.get_model("forum", "Topic")
+    Message = apps.get_model("forum", "Message")
+    Comment = apps.get_model("forum", "Comment")
+
+    messages = Message.objects.filter(topic=OuterRef("pk"))
+    comments = Comment.objects.filter(message__topic=OuterRef("pk"))
+    last_message = messages.order_by("-created_at").values("created_at")[:1]
+    last_comment = comments.order_by("-created_at").values("created_at")[:1]
+    message_count = messages.order_by().values("topic").annotate(num=Count("pk")).values("num")
+    comment_count = comments.order_by().values("message__topic").annotate(num=Count("pk")).values("num")
+    Topic.objects.update(
+        message_count=Coalesce(Subquery(message_count), Value(0)),
+        comment_count=Coalesce(Subquery(comment_count), Value(0)),
+        last_activity_at=Greatest(
+            Coalesce(Subquery(last_message), Subquery(last_comment)),
+            Coalesce(Subquery(last_comment), Subquery(last_message)),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='コメント数'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='最終アクティビティ日時'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='メッセージ数'),
+        ),
+        migrations.RunPython(populate_activity, migrations.RunPython.noop),
+    ]
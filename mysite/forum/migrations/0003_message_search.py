@@ -0,0 +1,68 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:20
+
+from django.db import migrations
+
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE forum_message_fts USING fts5(
+    content, content='forum_message', content_rowid='id', tokenize='{tokenizer}'
+)
+"""
+
+# 作成時点の forum.search.FTS5SearchBackend.triggers の写し
+TRIGGERS = {
+    "forum_message_fts_ai": """
+        AFTER INSERT ON forum_message BEGIN
+            INSERT INTO forum_message_fts(rowid, content)
+            VALUES (new.id, new.content);
+        END
+    """,
+    "forum_message_fts_ad": """
+        AFTER DELETE ON forum_message BEGIN
+            INSERT INTO forum_message_fts(forum_message_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+        END
+    """,
+    "forum_message_fts_au": """
+        AFTER UPDATE OF content ON forum_message BEGIN
+            INSERT INTO forum_message_fts(forum_message_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+            INSERT INTO forum_message_fts(rowid, content)
+            VALUES (new.id, new.content);
+        END
+    """,
+}
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    # trigram は SQLite 3.34 以降。古い場合は unicode61 で作成する
+    if schema_editor.connection.Database.sqlite_version_info >= (3, 34, 0):
+        tokenizer = "trigram"
+    else:
+        tokenizer = "unicode61"
+    schema_editor.execute(CREATE_TABLE.format(tokenizer=tokenizer))
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    schema_editor.execute(
+        "INSERT INTO forum_message_fts(forum_message_fts) VALUES ('rebuild')"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    schema_editor.execute("DROP TABLE IF EXISTS forum_message_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0002_topic_activity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
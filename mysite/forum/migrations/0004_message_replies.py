@@ -0,0 +1,39 @@
+# Generated by Django 4.0.2 on 2026-10-18 14:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_replies(apps, schema_editor):
+    Message = apps.get_model("forum", "Message")
+    Comment = apps.get_model("forum", "Comment")
+
+    comments = Comment.objects.filter(message=OuterRef("pk"))
+    latest_reply = comments.order_by("-created_at").values("created_at")[:1]
+    reply_count = comments.order_by().values("message").annotate(num=Count("pk")).values("num")
+    Message.objects.update(
+        reply_count=Coalesce(Subquery(reply_count), Value(0)),
+        latest_reply_at=Subquery(latest_reply),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0003_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='latest_reply_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='最新コメント日時'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='コメント数'),
+        ),
+        migrations.RunPython(populate_replies, migrations.RunPython.noop),
+    ]
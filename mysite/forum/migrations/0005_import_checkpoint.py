@@ -0,0 +1,23 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0004_message_replies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='取り込み元')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='処理済みバイト数')),
+                ('lines', models.BigIntegerField(default=0, verbose_name='処理済み行数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    # name を unique にする前に、同名のタグを最も古いものへまとめる
+    Tag = apps.get_model("forum", "Tag")
+    Through = Tag.message.through
+    duplicates = (
+        Tag.objects.values("name")
+        .annotate(num=Count("pk"), keep=Min("pk"))
+        .filter(num__gt=1)
+    )
+    for row in duplicates:
+        others = Tag.objects.filter(name=row["name"]).exclude(pk=row["keep"])
+        message_ids = Through.objects.filter(tag__in=others).values_list(
+            "message_id", flat=True
+        )
+        Through.objects.bulk_create(
+            [Through(tag_id=row["keep"], message_id=pk) for pk in set(message_ids)],
+            ignore_conflicts=True,
+        )
+        others.delete()
+
+
+def populate_topic_tags(apps, schema_editor):
+    Tag = apps.get_model("forum", "Tag")
+    TopicTag = apps.get_model("forum", "TopicTag")
+    counts = (
+        Tag.message.through.objects.values("message__topic", "tag")
+        .annotate(num=Count("pk"))
+        .order_by()
+    )
+    TopicTag.objects.bulk_create(
+        TopicTag(topic_id=row["message__topic"], tag_id=row["tag"], count=row["num"])
+        for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0005_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=20, unique=True, verbose_name='タグ名'),
+        ),
+        migrations.CreateModel(
+            name='TopicTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0, verbose_name='メッセージ数')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='topic_count', to='forum.tag')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_count', to='forum.topic')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='topictag',
+            index=models.Index(fields=['topic', '-count'], name='forum_topictag_count_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='topictag',
+            constraint=models.UniqueConstraint(fields=('topic', 'tag'), name='unique_topic_tag'),
+        ),
+        migrations.RunPython(populate_topic_tags, migrations.RunPython.noop),
+    ]
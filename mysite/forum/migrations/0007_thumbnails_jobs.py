@@ -0,0 +1,35 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0006_tag_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='種類')),
+                ('payload', models.JSONField(default=dict, verbose_name='引数')),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('running', '実行中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=10, verbose_name='状態')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='試行回数')),
+                ('last_error', models.TextField(blank=True, verbose_name='エラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='サムネイル'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'id'], name='forum_job_status_idx'),
+        ),
+    ]
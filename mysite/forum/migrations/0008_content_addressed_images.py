@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:05
+
+from django.db import migrations, models
+import forum.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0007_thumbnails_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='ファイル名')),
+                ('size', models.BigIntegerField(default=0, verbose_name='サイズ')),
+                ('refcount', models.PositiveIntegerField(default=1, verbose_name='参照数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=forum.storage.get_message_image_storage, upload_to='images', verbose_name='画像'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, Min
+
+
+def merge_duplicate_topics(apps, schema_editor):
+    # name を unique にする前に、同名のトピックを最も古いものへまとめる
+    Topic = apps.get_model("forum", "Topic")
+    Message = apps.get_model("forum", "Message")
+    Comment = apps.get_model("forum", "Comment")
+    TopicTag = apps.get_model("forum", "TopicTag")
+    Through = apps.get_model("forum", "Tag").message.through
+    duplicates = (
+        Topic.objects.values("name")
+        .annotate(num=Count("pk"), keep=Min("pk"))
+        .filter(num__gt=1)
+    )
+    for row in duplicates:
+        keep = Topic.objects.get(pk=row["keep"])
+        others = Topic.objects.filter(name=row["name"]).exclude(pk=keep.pk)
+        Message.objects.filter(topic__in=others).update(topic=keep)
+        TopicTag.objects.filter(topic__in=others).delete()
+        others.delete()
+
+        messages = Message.objects.filter(topic=keep)
+        comments = Comment.objects.filter(message__topic=keep)
+        keep.message_count = messages.count()
+        keep.comment_count = comments.count()
+        keep.last_activity_at = max(
+            filter(
+                None,
+                [
+                    messages.aggregate(at=Max("created_at"))["at"],
+                    comments.aggregate(at=Max("created_at"))["at"],
+                ],
+            ),
+            default=None,
+        )
+        keep.save()
+
+        TopicTag.objects.filter(topic=keep).delete()
+        counts = (
+            Through.objects.filter(message__topic=keep)
+            .values("tag")
+            .annotate(num=Count("pk"))
+            .order_by()
+        )
+        TopicTag.objects.bulk_create(
+            TopicTag(topic=keep, tag_id=count["tag"], count=count["num"])
+            for count in counts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0008_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_topics, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['message', 'created_at', 'id'], name='forum_comment_message_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['topic', 'created_at', 'id'], name='forum_message_topic_idx'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='message',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comment', to='forum.message'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='topic',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='topic_message', to='forum.topic'),
+        ),
+        migrations.AlterField(
+            model_name='topic',
+            name='name',
+            field=models.CharField(max_length=20, unique=True, verbose_name='トピック名'),
+        ),
+    ]
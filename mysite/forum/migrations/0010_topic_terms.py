@@ -0,0 +1,47 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:33
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from forum.terms import extract_terms
+
+
+def populate_topic_terms(apps, schema_editor):
+    Message = apps.get_model("forum", "Message")
+    TopicTerm = apps.get_model("forum", "TopicTerm")
+    counts = Counter()
+    for topic_id, content in Message.objects.values_list("topic_id", "content").iterator():
+        counts.update((topic_id, term) for term in extract_terms(content))
+    TopicTerm.objects.bulk_create(
+        (
+            TopicTerm(topic_id=topic_id, term=term, count=num)
+            for (topic_id, term), num in counts.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50, verbose_name='語')),
+                ('count', models.IntegerField(default=0, verbose_name='メッセージ数')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='forum.topic')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='topicterm',
+            constraint=models.UniqueConstraint(fields=('topic', 'term'), name='unique_topic_term'),
+        ),
+        migrations.RunPython(populate_topic_terms, migrations.RunPython.noop),
+    ]
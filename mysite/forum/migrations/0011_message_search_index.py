@@ -0,0 +1,27 @@
+# Generated by Django 4.0.2 on 2026-10-18 15:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import forum.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0010_topic_terms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageSearchIndex',
+            fields=[
+                ('message', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='forum.message')),
+                ('content', forum.models.SearchContentField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'forum_message_fts',
+                'managed': False,
+            },
+        ),
+    ]
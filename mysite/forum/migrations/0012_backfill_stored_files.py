@@ -0,0 +1,46 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:20
+
+from collections import Counter
+
+from django.db import migrations
+
+
+def backfill_stored_files(apps, schema_editor):
+    # 0008 より前に保存された画像や、取り込みで参照された画像の参照数を数え直す
+    from forum.storage import message_image_storage
+
+    Message = apps.get_model("forum", "Message")
+    StoredFile = apps.get_model("forum", "StoredFile")
+    counts = Counter(
+        Message.objects.exclude(image="")
+        .exclude(image__isnull=True)
+        .values_list("image", flat=True)
+        .iterator()
+    )
+    for stored in StoredFile.objects.iterator():
+        if stored.name not in counts:
+            continue
+        if stored.refcount != counts[stored.name]:
+            stored.refcount = counts[stored.name]
+            stored.save(update_fields=["refcount"])
+        del counts[stored.name]
+    StoredFile.objects.bulk_create(
+        (
+            StoredFile(
+                name=name, size=message_image_storage.file_size(name), refcount=num
+            )
+            for name, num in counts.items()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0011_message_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stored_files, migrations.RunPython.noop),
+    ]
@@ -1,46 +1,383 @@
-from django.db import models
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import models, router, transaction
+from django.db.models import Count, F, Lookup, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from accounts.models import CustomUser
+from .storage import get_message_image_storage
+from .terms import extract_terms
+
+
+class TopicQuerySet(models.QuerySet):
+    def refresh_activity(self):
+        # Message / Comment から最終アクティビティと件数を再計算する
+        messages = Message.objects.filter(topic=OuterRef("pk"))
+        comments = Comment.objects.filter(message__topic=OuterRef("pk"))
+        last_message = messages.order_by("-created_at").values("created_at")[:1]
+        last_comment = comments.order_by("-created_at").values("created_at")[:1]
+        message_count = (
+            messages.order_by().values("topic").annotate(num=Count("pk")).values("num")
+        )
+        comment_count = (
+            comments.order_by()
+            .values("message__topic")
+            .annotate(num=Count("pk"))
+            .values("num")
+        )
+        return self.update(
+            message_count=Coalesce(Subquery(message_count), Value(0)),
+            comment_count=Coalesce(Subquery(comment_count), Value(0)),
+            last_activity_at=Greatest(
+                Coalesce(Subquery(last_message), Subquery(last_comment)),
+                Coalesce(Subquery(last_comment), Subquery(last_message)),
+            ),
+        )
 
 
 class Topic(models.Model):
-    name = models.CharField("トピック名", max_length=20)
+    name = models.CharField("トピック名", max_length=20, unique=True)
+    last_activity_at = models.DateTimeField(
+        "最終アクティビティ日時", null=True, blank=True, editable=False, db_index=True
+    )
+    message_count = models.PositiveIntegerField("メッセージ数", default=0, editable=False)
+    comment_count = models.PositiveIntegerField("コメント数", default=0, editable=False)
+
+    objects = TopicQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
 
+class MessageQuerySet(models.QuerySet):
+    def refresh_replies(self):
+        # Comment からコメント数と最新コメント日時を再計算する
+        comments = Comment.objects.filter(message=OuterRef("pk"))
+        latest_reply = comments.order_by("-created_at").values("created_at")[:1]
+        reply_count = (
+            comments.order_by().values("message").annotate(num=Count("pk")).values("num")
+        )
+        return self.update(
+            reply_count=Coalesce(Subquery(reply_count), Value(0)),
+            latest_reply_at=Subquery(latest_reply),
+        )
+
+
 class Message(models.Model):
     content = models.CharField("内容", max_length=200)
+    # 索引は Meta.indexes の (topic, created_at, id) で兼ねる
     topic = models.ForeignKey(
-        Topic, on_delete=models.CASCADE, related_name="topic_message"
+        Topic, on_delete=models.CASCADE, related_name="topic_message", db_index=False
     )
     created_at = models.DateTimeField("投稿日時", auto_now_add=True)
-    image = models.ImageField("画像", null=True, blank=True)
+    image = models.ImageField(
+        "画像",
+        null=True,
+        blank=True,
+        upload_to="images",
+        storage=get_message_image_storage,
+    )
     user = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name="user_message"
     )
+    reply_count = models.PositiveIntegerField("コメント数", default=0, editable=False)
+    latest_reply_at = models.DateTimeField(
+        "最新コメント日時", null=True, blank=True, editable=False
+    )
+    # [{"width": 320, "format": "webp", "name": "thumbnails/..."}, ...]
+    thumbnails = models.JSONField("サムネイル", default=list, blank=True, editable=False)
+
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ForumView: トピック内のメッセージを投稿順に
+            models.Index(
+                fields=["topic", "created_at", "id"], name="forum_message_topic_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.content
 
+    def save(self, *args, using=None, **kwargs):
+        if not self.image or self.image._committed:
+            return super().save(*args, using=using, **kwargs)
+        # 新しい画像は保存時に参照数 (StoredFile) を加算するので、行の保存と
+        # 同じトランザクションにする
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, using=using, **kwargs)
+
+    def thumbnail_srcset(self, format):
+        return ", ".join(
+            f"{default_storage.url(t['name'])} {t['width']}w"
+            for t in self.thumbnails
+            if t["format"] == format
+        )
+
+    @property
+    def webp_srcset(self):
+        return self.thumbnail_srcset("webp")
+
+    @property
+    def jpeg_srcset(self):
+        return self.thumbnail_srcset("jpeg")
+
+
+class Match(Lookup):
+    """FTS5 の MATCH 演算子 (MessageSearchIndex の検索に使う)"""
+
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+class SearchContentField(models.TextField):
+    pass
+
+
+SearchContentField.register_lookup(Match)
+
+
+class MessageSearchIndex(models.Model):
+    """Message.content の FTS5 仮想テーブル (SQLite のみ)。
+
+    テーブルとトリガーはマイグレーション 0003 と FTS5SearchBackend が作るので、
+    Django では管理しない。rowid が Message の主キー、rank が一致の度合い
+    (小さいほど関連が高い) になる。
+    """
+
+    message = models.OneToOneField(
+        Message,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_index",
+    )
+    content = SearchContentField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "forum_message_fts"
+
+
+class CommentQuerySet(models.QuerySet):
+    def latest_per_message(self, message_ids, limit):
+        # メッセージごとに新しい順で limit 件までを 1 クエリで取得する。結果は
+        # メッセージごとに古い順。各行の相関サブクエリは (message, created_at, id)
+        # の索引を新しい方から limit 件だけ読む
+        if not message_ids:
+            return self.none()
+        latest = (
+            Comment.objects.filter(message_id=OuterRef("message_id"))
+            .order_by("-created_at", "-id")
+            .values("pk")[:limit]
+        )
+        return self.filter(
+            message_id__in=message_ids, pk__in=Subquery(latest)
+        ).order_by("message_id", "created_at", "id")
+
 
 class Comment(models.Model):
     content = models.CharField("内容", max_length=200)
     created_at = models.DateTimeField("投稿日時", auto_now_add=True)
+    # 索引は Meta.indexes の (message, created_at, id) で兼ねる
     message = models.ForeignKey(
-        Message, on_delete=models.CASCADE, related_name="comment"
+        Message, on_delete=models.CASCADE, related_name="comment", db_index=False
     )
     user = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name="user_comment"
     )
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # メッセージごとの最新コメント (latest_per_message, CommentListView)
+            models.Index(
+                fields=["message", "created_at", "id"], name="forum_comment_message_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.content
 
 
 class Tag(models.Model):
-    name = models.CharField("タグ名", max_length=20)
+    name = models.CharField("タグ名", max_length=20, unique=True)
     message = models.ManyToManyField(Message, blank=True, related_name="tag")
 
     def __str__(self):
         return self.name
+
+
+class TopicTagQuerySet(models.QuerySet):
+    def add(self, topic_id, tag_ids, num=1):
+        # 行がなければ 0 件で作ってから F 式で加算する
+        self.bulk_create(
+            [TopicTag(topic_id=topic_id, tag_id=tag_id) for tag_id in tag_ids],
+            ignore_conflicts=True,
+        )
+        self.filter(topic_id=topic_id, tag_id__in=tag_ids).update(
+            count=F("count") + num
+        )
+
+    def remove(self, topic_id, tag_ids, num=1):
+        self.filter(topic_id=topic_id, tag_id__in=tag_ids).update(
+            count=F("count") - num
+        )
+
+    def rebuild(self, topics):
+        # Message と Tag の中間テーブルから数え直す
+        Through = Tag.message.through
+        topic_ids = list(topics.values_list("pk", flat=True))
+        counts = (
+            Through.objects.filter(message__topic__in=topic_ids)
+            .values("message__topic", "tag")
+            .annotate(num=Count("pk"))
+            .order_by()
+        )
+        self.filter(topic__in=topic_ids).delete()
+        self.bulk_create(
+            TopicTag(topic_id=row["message__topic"], tag_id=row["tag"], count=row["num"])
+            for row in counts
+        )
+
+
+class TopicTag(models.Model):
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="tag_count")
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="topic_count")
+    count = models.IntegerField("メッセージ数", default=0)
+
+    objects = TopicTagQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["topic", "tag"], name="unique_topic_tag"),
+        ]
+        indexes = [
+            models.Index(fields=["topic", "-count"], name="forum_topictag_count_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} / {self.tag} ({self.count})"
+
+
+class TopicTermQuerySet(models.QuerySet):
+    def add(self, topic_id, terms, num=1):
+        # TopicTagQuerySet.add と同じく、行がなければ 0 件で作ってから加算する
+        if not terms:
+            return
+        self.bulk_create(
+            [TopicTerm(topic_id=topic_id, term=term) for term in terms],
+            ignore_conflicts=True,
+        )
+        self.filter(topic_id=topic_id, term__in=terms).update(count=F("count") + num)
+
+    def remove(self, topic_id, terms, num=1):
+        # 語の種類は増え続けるので、どのメッセージにも現れなくなった行は消す
+        if terms:
+            rows = self.filter(topic_id=topic_id, term__in=terms)
+            rows.update(count=F("count") - num)
+            rows.filter(count__lte=0).delete()
+
+    def rebuild(self, topics):
+        # メッセージの本文から数え直す
+        topic_ids = list(topics.values_list("pk", flat=True))
+        counts = Counter()
+        messages = Message.objects.filter(topic__in=topic_ids).values_list(
+            "topic_id", "content"
+        )
+        for topic_id, content in messages.iterator():
+            counts.update((topic_id, term) for term in extract_terms(content))
+        self.filter(topic__in=topic_ids).delete()
+        self.bulk_create(
+            (
+                TopicTerm(topic_id=topic_id, term=term, count=num)
+                for (topic_id, term), num in counts.items()
+            ),
+            batch_size=1000,
+        )
+
+    def starting_with(self, topic_id, prefix):
+        # (topic, term) の一意索引を範囲で引く。U+10FFFF は UTF-8 で最大の文字
+        return self.filter(
+            topic_id=topic_id,
+            term__gte=prefix,
+            term__lt=prefix + "\U0010ffff",
+            count__gt=0,
+        )
+
+
+class TopicTerm(models.Model):
+    """トピックのメッセージに現れる語と、その語を含むメッセージ数 (入力補完用)"""
+
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name="terms")
+    term = models.CharField("語", max_length=50)
+    count = models.IntegerField("メッセージ数", default=0)
+
+    objects = TopicTermQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["topic", "term"], name="unique_topic_term"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} / {self.term} ({self.count})"
+
+
+class ImportCheckpoint(models.Model):
+    source = models.CharField("取り込み元", max_length=255, unique=True)
+    offset = models.BigIntegerField("処理済みバイト数", default=0)
+    lines = models.BigIntegerField("処理済み行数", default=0)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.lines} lines)"
+
+
+class Job(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "待機中"),
+        (RUNNING, "実行中"),
+        (DONE, "完了"),
+        (FAILED, "失敗"),
+    ]
+
+    kind = models.CharField("種類", max_length=50)
+    payload = models.JSONField("引数", default=dict)
+    status = models.CharField(
+        "状態", max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField("試行回数", default=0)
+    last_error = models.TextField("エラー", blank=True)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="forum_job_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class StoredFile(models.Model):
+    name = models.CharField("ファイル名", max_length=255, unique=True)
+    size = models.BigIntegerField("サイズ", default=0)
+    refcount = models.PositiveIntegerField("参照数", default=1)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
@@ -0,0 +1,164 @@
+import base64
+import collections.abc
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPaginator:
+    """(created_at, id) をキーにしたキーセットページネーション。
+
+    OFFSET と COUNT(*) を使わないので、どのページでもインデックスを引くだけで済む。
+    """
+
+    def __init__(self, queryset, per_page, ordering=("created_at", "id")):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = ordering
+
+    @cached_property
+    def count(self):
+        # 総件数は必要なときだけ数える
+        return self.queryset.count()
+
+    def encode_cursor(self, obj, direction="n"):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip("-"))
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        data = json.dumps({"d": direction, "v": values}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, values = data["d"], data["v"]
+        except (TypeError, ValueError, KeyError):
+            raise InvalidCursor("Invalid cursor.")
+        if direction not in ("n", "p") or len(values) != len(self.ordering):
+            raise InvalidCursor("Invalid cursor.")
+        opts = self.queryset.model._meta
+        try:
+            values = [
+                opts.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except ValidationError:
+            raise InvalidCursor("Invalid cursor.")
+        return direction, values
+
+    def _nullable(self, name):
+        return self.queryset.model._meta.get_field(name).null
+
+    def _seek(self, values, reverse):
+        # (a, b) > (x, y) を a > x OR (a = x AND b > y) に展開する。
+        # NULL を許すカラムは NULL を最後 (逆順のときは最初) に並べる
+        condition = Q(pk__in=[])
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            if values[i] is None:
+                if not reverse:
+                    # NULL の後には何もない
+                    continue
+                q = Q(**{f"{name}__isnull": False})
+            else:
+                q = Q(**{f"{name}__{lookup}": values[i]})
+                if not reverse and self._nullable(name):
+                    q |= Q(**{f"{name}__isnull": True})
+            for prev_field, prev_value in zip(self.ordering[:i], values[:i]):
+                prev_name = prev_field.lstrip("-")
+                if prev_value is None:
+                    q &= Q(**{f"{prev_name}__isnull": True})
+                else:
+                    q &= Q(**{prev_name: prev_value})
+            condition |= q
+        return condition
+
+    def _order(self, reverse):
+        ordering = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            if self._nullable(name):
+                expression = F(name)
+                ordering.append(
+                    expression.desc(nulls_last=not reverse)
+                    if descending
+                    else expression.asc(nulls_last=not reverse)
+                )
+            else:
+                ordering.append(f"-{name}" if descending else name)
+        return ordering
+
+    def page(self, cursor=None):
+        direction, values = ("n", None) if not cursor else self.decode_cursor(cursor)
+        reverse = direction == "p"
+        queryset = self.queryset.order_by(*self._order(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, reverse))
+        object_list = list(queryset[: self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+        if reverse:
+            object_list.reverse()
+            return CursorPage(object_list, self, values is not None, has_more)
+        return CursorPage(object_list, self, has_more, values is not None)
+
+
+def paginate_by_cursor(request, queryset, page_size, ordering=("created_at", "id")):
+    # ListView.paginate_queryset と同じ形で返す
+    paginator = CursorPaginator(queryset, page_size, ordering)
+    try:
+        page = paginator.page(request.GET.get("cursor"))
+    except InvalidCursor as e:
+        raise Http404(str(e))
+    return (paginator, page, page.object_list, page.has_other_pages())
+
+
+class CursorPage(collections.abc.Sequence):
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return "<Cursor page of %d>" % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1], "n")
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], "p")
+        return None
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils.module_loading import import_string
+
+
+class IContainsSearchBackend:
+    """content__icontains による検索 (全件走査)。"""
+
+    def search(self, queryset, keyword):
+        return queryset.filter(content__icontains=keyword)
+
+    def install(self, using=DEFAULT_DB_ALIAS):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class FTS5SearchBackend(IContainsSearchBackend):
+    """SQLite の FTS5 仮想テーブルによる全文検索。
+
+    trigram トークナイザで 3 文字単位に索引するため、単語の区切りがない日本語でも
+    部分一致で検索できる。3 文字未満のキーワード、SQLite 以外、trigram を使えない
+    古い SQLite で unicode61 の索引が作られた場合は icontains に戻る。
+    """
+
+    table = "forum_message_fts"
+    min_length = 3
+    # マイグレーション 0003 はこの定義の写しでトリガーを作る (変更したら新しい
+    # マイグレーションで張り直すこと)
+    triggers = {
+        "forum_message_fts_ai": """
+            AFTER INSERT ON forum_message BEGIN
+                INSERT INTO forum_message_fts(rowid, content)
+                VALUES (new.id, new.content);
+            END
+        """,
+        "forum_message_fts_ad": """
+            AFTER DELETE ON forum_message BEGIN
+                INSERT INTO forum_message_fts(forum_message_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+            END
+        """,
+        "forum_message_fts_au": """
+            AFTER UPDATE OF content ON forum_message BEGIN
+                INSERT INTO forum_message_fts(forum_message_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+                INSERT INTO forum_message_fts(rowid, content)
+                VALUES (new.id, new.content);
+            END
+        """,
+    }
+    # 接続の別名ごとの、実際に作られた索引のトークナイザ (プロセスで 1 回だけ調べる)
+    tokenizers = {}
+
+    def is_available(self, using=DEFAULT_DB_ALIAS):
+        return (
+            connections[using].vendor == "sqlite"
+            and self.get_tokenizer(using) == "trigram"
+        )
+
+    def get_tokenizer(self, using=DEFAULT_DB_ALIAS):
+        if using not in self.tokenizers:
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [self.table],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                # 索引がまだない (migrate の前)。作られたら調べ直す
+                return None
+            self.tokenizers[using] = "trigram" if "trigram" in row[0] else "unicode61"
+        return self.tokenizers[using]
+
+    def to_query(self, keyword):
+        # フレーズとして扱い、FTS5 の演算子を無効化する
+        return '"%s"' % keyword.replace('"', '""')
+
+    def search(self, queryset, keyword):
+        if len(keyword) < self.min_length or not self.is_available(queryset.db):
+            return super().search(queryset, keyword)
+
+        # FTS5 の表を rowid で 1 回だけ結合し、一致の判定と rank を同じ行から読む
+        return queryset.filter(
+            search_index__content__match=self.to_query(keyword)
+        ).order_by("search_index__rank", "created_at", "id")
+
+    def install(self, using=DEFAULT_DB_ALIAS):
+        # SQLite はカラム追加などでテーブルを作り直すとトリガーが消えるため、
+        # migrate のたびに張り直す
+        if connections[using].vendor != "sqlite":
+            return
+        self.tokenizers.pop(using, None)
+        # 索引のテーブルがない (0003 より前まで戻した) 場合にトリガーだけを作ると、
+        # forum_message への INSERT がすべて失敗する
+        if self.get_tokenizer(using) is None:
+            return
+        self.create_triggers(connections[using])
+
+    @classmethod
+    def create_triggers(cls, connection):
+        with connection.cursor() as cursor:
+            for name, body in cls.triggers.items():
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    def rebuild(self):
+        if connection.vendor != "sqlite" or self.get_tokenizer() is None:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+
+def get_search_backend():
+    backend = getattr(
+        settings, "FORUM_SEARCH_BACKEND", "forum.search.FTS5SearchBackend"
+    )
+    return import_string(backend)()
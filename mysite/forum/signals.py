@@ -0,0 +1,246 @@
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .cache import invalidate_tags, invalidate_topic
+from .events import broker
+from .models import Topic, Message, Comment, Tag, TopicTag, TopicTerm
+from .search import get_search_backend
+from .terms import extract_terms
+from .thumbnails import enqueue_thumbnails
+from .topics import invalidate_topics
+
+# 削除中のメッセージの pk。連鎖して削除されるコメントごとの再計算を省く
+_deleting_messages = ContextVar("forum_deleting_messages", default=frozenset())
+
+
+def _touch(queryset, date_field, created_at, **counts):
+    # F 式で加算するので同時投稿でも更新が失われない
+    queryset.update(
+        **{
+            date_field: Greatest(
+                Coalesce(date_field, Value(created_at)), Value(created_at)
+            )
+        },
+        **{field: F(field) + num for field, num in counts.items()},
+    )
+
+
+@receiver(pre_save, sender=Message)
+def message_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # 本文かトピックが変わる場合に入力補完の語を付け替え、画像が変わる場合に
+    # サムネイルを作り直すため、変更前を覚えておく
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {"content", "topic", "image"} & set(
+        update_fields
+    ):
+        return
+    previous = (
+        Message.objects.filter(pk=instance.pk)
+        .values_list("topic_id", "content", "image")
+        .first()
+    )
+    if previous is not None:
+        instance._previous_terms = previous[:2]
+        instance._previous_image = previous[2] or ""
+
+
+def _image_replaced(instance):
+    # 変更前の画像の名前を返す。画像が変わっていなければ None
+    previous = instance.__dict__.pop("_previous_image", None)
+    if previous is None or previous == (instance.image.name or ""):
+        return None
+    return previous
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_image = _image_replaced(instance)
+    if previous_image is not None:
+        # 古い画像のサムネイルを使わないよう空にしてから作り直す
+        if instance.thumbnails:
+            instance.thumbnails = []
+            Message.objects.filter(pk=instance.pk).update(thumbnails=[])
+        if previous_image:
+            storage = instance.image.storage
+            transaction.on_commit(lambda: storage.delete(previous_image))
+    if instance.image and not instance.thumbnails:
+        enqueue_thumbnails(instance)
+    if created:
+        _touch(
+            Topic.objects.filter(pk=instance.topic_id),
+            "last_activity_at",
+            instance.created_at,
+            message_count=1,
+        )
+        TopicTerm.objects.add(instance.topic_id, extract_terms(instance.content))
+        # このプロセスの SSE の購読者には次のポーリングを待たずに配信する
+        transaction.on_commit(broker.wake)
+    else:
+        previous = instance.__dict__.pop("_previous_terms", None)
+        if previous is not None and previous != (instance.topic_id, instance.content):
+            TopicTerm.objects.remove(previous[0], extract_terms(previous[1]))
+            TopicTerm.objects.add(instance.topic_id, extract_terms(instance.content))
+    invalidate_topic(instance.topic_id)
+
+
+def _comment_topic_id(comment):
+    # ビューではメッセージを設定してから保存するので、読み込み済みならそれを使う
+    if Comment.message.is_cached(comment):
+        return comment.message.topic_id
+    return (
+        Message.objects.filter(pk=comment.message_id)
+        .values_list("topic_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        # メッセージとトピックの集計を同じトランザクションで更新する
+        with transaction.atomic():
+            _touch(
+                Message.objects.filter(pk=instance.message_id),
+                "latest_reply_at",
+                instance.created_at,
+                reply_count=1,
+            )
+            _touch(
+                Topic.objects.filter(topic_message__pk=instance.message_id),
+                "last_activity_at",
+                instance.created_at,
+                comment_count=1,
+            )
+        transaction.on_commit(broker.wake)
+    invalidate_topic(_comment_topic_id(instance))
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    if instance.image:
+        # 同じ画像を使う他のメッセージがあれば参照数を減らすだけになる
+        storage, name = instance.image.storage, instance.image.name
+        transaction.on_commit(lambda: storage.delete(name))
+    Topic.objects.filter(pk=instance.topic_id).refresh_activity()
+    TopicTerm.objects.remove(instance.topic_id, extract_terms(instance.content))
+    invalidate_topic(instance.topic_id)
+    _deleting_messages.set(_deleting_messages.get() - {instance.pk})
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # メッセージごと削除される場合は message_deleted で 1 回だけ再計算する
+    if instance.message_id in _deleting_messages.get():
+        return
+    Message.objects.filter(pk=instance.message_id).refresh_replies()
+    topic_id = Message.objects.filter(pk=instance.message_id).values("topic_id")
+    Topic.objects.filter(pk__in=topic_id).refresh_activity()
+    invalidate_topic(*topic_id.values_list("topic_id", flat=True))
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, raw=False, **kwargs):
+    invalidate_topics()
+    if not raw:
+        invalidate_topic(instance.pk)
+
+
+@receiver(post_delete, sender=Topic)
+def topic_deleted(sender, instance, **kwargs):
+    invalidate_topics()
+    invalidate_topic(instance.pk)
+
+
+def _invalidate_tagged(tag, message_ids=None):
+    messages = Message.objects.filter(tag=tag)
+    if message_ids is not None:
+        messages = Message.objects.filter(pk__in=message_ids)
+    invalidate_topic(*messages.values_list("topic_id", flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=Tag.message.through)
+def tags_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if isinstance(instance, Message):
+        invalidate_topic(instance.topic_id)
+    elif action == "pre_clear":
+        _invalidate_tagged(instance)
+    else:
+        _invalidate_tagged(instance, pk_set)
+
+
+@receiver(m2m_changed, sender=Tag.message.through)
+def topic_tags_changed(sender, instance, action, pk_set, **kwargs):
+    # post_add の pk_set は実際に追加された分だけだが、remove / clear は
+    # 実在する行を削除前に数える
+    if action == "post_add":
+        update = TopicTag.objects.add
+    elif action in ("pre_remove", "pre_clear"):
+        update = TopicTag.objects.remove
+    else:
+        return
+
+    if isinstance(instance, Message):
+        tag_ids = pk_set
+        if action != "post_add":
+            links = sender.objects.filter(message=instance)
+            if action == "pre_remove":
+                links = links.filter(tag__in=pk_set)
+            tag_ids = list(links.values_list("tag_id", flat=True))
+        if tag_ids:
+            update(instance.topic_id, tag_ids)
+        return
+
+    if action == "post_add":
+        messages = Message.objects.filter(pk__in=pk_set)
+    elif action == "pre_remove":
+        messages = Message.objects.filter(pk__in=pk_set, tag=instance)
+    else:
+        messages = Message.objects.filter(tag=instance)
+    for row in messages.values("topic").annotate(num=Count("pk")).order_by():
+        update(row["topic"], [instance.pk], row["num"])
+
+
+@receiver(pre_delete, sender=Message)
+def message_deleting(sender, instance, **kwargs):
+    # pre_delete は連鎖するコメントの削除より前に送られる
+    _deleting_messages.set(_deleting_messages.get() | {instance.pk})
+    # 中間テーブルの行は m2m_changed を送らずに消えるので先に減らしておく
+    tag_ids = list(instance.tag.values_list("pk", flat=True))
+    if tag_ids:
+        TopicTag.objects.remove(instance.topic_id, tag_ids)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, raw=False, **kwargs):
+    # 新しいタグはまだどのメッセージにも付いていないが、投稿フォームの選択肢が変わる
+    invalidate_tags()
+    if not created and not raw:
+        _invalidate_tagged(instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    invalidate_tags()
+    _invalidate_tagged(instance)
+
+
+def install_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    get_search_backend().install(using)
@@ -0,0 +1,35 @@
+// 「以前のコメントを見る」を fetch で読み込み、リンクを返ってきたコメントで置き換える。
+// JavaScript が無効な場合や通信に失敗した場合は、コメントのページを開く。
+(function () {
+    "use strict";
+
+    document.addEventListener("click", function (event) {
+        var link = event.target.closest ? event.target.closest(".comment-more a") : null;
+        if (!link || !window.fetch) {
+            return;
+        }
+        event.preventDefault();
+
+        var more = link.closest(".comment-more");
+        fetch(link.href, {
+            credentials: "same-origin",
+            headers: { "X-Requested-With": "XMLHttpRequest" }
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        }).then(function (html) {
+            var template = document.createElement("template");
+            template.innerHTML = html.trim();
+            var elements = Array.prototype.slice.call(template.content.children);
+            // 断片は「さらに以前」のリンクと古い順のコメントなので、そのまま差し替える
+            more.parentNode.replaceChild(template.content, more);
+            if (window.forumRelativeTime) {
+                elements.forEach(window.forumRelativeTime.update);
+            }
+        }).catch(function () {
+            window.location.assign(link.href);
+        });
+    });
+})();
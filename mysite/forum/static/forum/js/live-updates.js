@@ -0,0 +1,68 @@
+// トピックの新着を Server-Sent Events (forum.events) で受け取る。
+// コメントは表示中のメッセージに追加し、新しいメッセージは件数だけ知らせる。
+(function () {
+    "use strict";
+
+    var url = document.body.getAttribute("data-events-url");
+    if (!url || !window.EventSource) {
+        return;
+    }
+
+    var newMessages = 0;
+    var notice = null;
+
+    function showNotice() {
+        if (!notice) {
+            notice = document.createElement("a");
+            notice.className = "live-notice";
+            notice.href = window.location.href;
+            var topic = document.querySelector(".page-topic");
+            topic.parentNode.insertBefore(notice, topic.nextSibling);
+        }
+        notice.textContent = "新着メッセージ " + newMessages + " 件 (クリックで更新)";
+    }
+
+    function addComment(data) {
+        var box = document.querySelector('.message-box[data-message-id="' + data.message + '"]');
+        if (!box || box.querySelector('.comment-box[data-comment-id="' + data.id + '"]')) {
+            return;
+        }
+        var comment = document.createElement("div");
+        comment.className = "comment-box";
+        comment.setAttribute("data-comment-id", data.id);
+        var content = document.createElement("div");
+        content.className = "comment-content";
+        content.textContent = data.content;
+        var date = document.createElement("div");
+        date.className = "comment-date";
+        var time = document.createElement("time");
+        time.className = "relative-time";
+        time.setAttribute("datetime", data.created_at);
+        time.textContent = data.created_at;
+        date.appendChild(time);
+        comment.appendChild(content);
+        comment.appendChild(date);
+        var form = box.querySelector(".comment-form");
+        form.parentNode.insertBefore(comment, form);
+        if (window.forumRelativeTime) {
+            window.forumRelativeTime.update(comment);
+        }
+    }
+
+    var source = new EventSource(url);
+    source.addEventListener("message", function (event) {
+        var data = JSON.parse(event.data);
+        if (!document.querySelector('.message-box[data-message-id="' + data.id + '"]')) {
+            newMessages += 1;
+            showNotice();
+        }
+    });
+    source.addEventListener("comment", function (event) {
+        addComment(JSON.parse(event.data));
+    });
+    source.addEventListener("reload", function () {
+        // 取りこぼしが多すぎるので読み込み直す
+        source.close();
+        window.location.reload();
+    });
+})();
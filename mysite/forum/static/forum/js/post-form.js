@@ -0,0 +1,105 @@
+// メッセージとコメントの投稿を fetch で送り、返ってきた HTML だけをページに追加する。
+// JavaScript が無効な場合や通信に失敗した場合は、通常の送信 (リダイレクト) になる。
+(function () {
+    "use strict";
+
+    function showErrors(form, errors) {
+        var box = form.querySelector(".form-errors");
+        if (!box) {
+            box = document.createElement("ul");
+            box.className = "form-errors";
+            form.insertBefore(box, form.firstChild);
+        }
+        box.textContent = "";
+        Object.keys(errors).forEach(function (field) {
+            errors[field].forEach(function (error) {
+                var item = document.createElement("li");
+                item.textContent = error.message;
+                box.appendChild(item);
+            });
+        });
+    }
+
+    function clearErrors(form) {
+        var box = form.querySelector(".form-errors");
+        if (box) {
+            box.parentNode.removeChild(box);
+        }
+    }
+
+    function insert(form, submitter, html) {
+        var template = document.createElement("template");
+        template.innerHTML = html.trim();
+        var element = template.content.firstElementChild;
+        var target;
+        if (submitter.name === "comment") {
+            // コメントはそのメッセージのコメント欄の末尾 (入力欄の前) に追加する
+            target = form.querySelector(".comment-form");
+            target.parentNode.insertBefore(element, target);
+        } else {
+            target = document.querySelector(".messages");
+            target.appendChild(element);
+        }
+        if (window.forumRelativeTime) {
+            window.forumRelativeTime.update(element);
+        }
+    }
+
+    function clearFields(form, submitter) {
+        var selector = submitter.name === "comment"
+            ? ".comment-field input, .comment-field textarea"
+            : "input[type=text], input[type=file], textarea, input[type=checkbox]";
+        var fields = form.querySelectorAll(selector);
+        for (var i = 0; i < fields.length; i++) {
+            if (fields[i].type === "checkbox") {
+                fields[i].checked = false;
+            } else {
+                fields[i].value = "";
+            }
+        }
+    }
+
+    document.addEventListener("submit", function (event) {
+        var form = event.target;
+        var submitter = event.submitter;
+        if (!window.fetch || !window.FormData || form.method.toUpperCase() !== "POST"
+                || !submitter || (submitter.name !== "message" && submitter.name !== "comment")) {
+            return;
+        }
+        event.preventDefault();
+
+        var data = new FormData(form);
+        data.append(submitter.name, submitter.value);
+        submitter.disabled = true;
+        fetch(form.action, {
+            method: "POST",
+            body: data,
+            credentials: "same-origin",
+            headers: { "X-Requested-With": "XMLHttpRequest" }
+        }).then(function (response) {
+            submitter.disabled = false;
+            if (response.status !== 201 && response.status !== 400 && response.status !== 429) {
+                // 未ログインなど。送信済みかもしれないので再送せずにページを開き直す
+                window.location.assign(form.action);
+                return;
+            }
+            return response.json().then(function (body) {
+                if (response.ok) {
+                    clearErrors(form);
+                    insert(form, submitter, body.html);
+                    clearFields(form, submitter);
+                } else {
+                    showErrors(form, body.errors);
+                }
+            });
+        }, function () {
+            // 通信できなかった場合は通常の送信にする
+            var hidden = document.createElement("input");
+            hidden.type = "hidden";
+            hidden.name = submitter.name;
+            hidden.value = submitter.value;
+            form.appendChild(hidden);
+            HTMLFormElement.prototype.submit.call(form);
+        });
+    });
+})();
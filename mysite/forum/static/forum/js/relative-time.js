@@ -0,0 +1,70 @@
+// <time class="relative-time" datetime="..."> を「n 分前」の表示に書き換える。
+// 文言は forum/templatetags/date.py の elapsed_time と揃えている。
+(function () {
+    "use strict";
+
+    var MINUTE = 60 * 1000;
+    var HOUR = 60 * MINUTE;
+    var DAY = 24 * HOUR;
+    var WEEK = 7 * DAY;
+
+    var messages = {
+        en: {
+            minute: function (n) { return n + (n === 1 ? " minute ago" : " minutes ago"); },
+            hour: function (n) { return n + (n === 1 ? " hour ago" : " hours ago"); },
+            day: function (n) { return n + (n === 1 ? " day ago" : " days ago"); },
+            week: function () { return "more than 1 week"; }
+        },
+        ja: {
+            minute: function (n) { return n + " 分前"; },
+            hour: function (n) { return n + " 時間前"; },
+            day: function (n) { return n + " 日前"; },
+            week: function () { return "1 週間以上前"; }
+        }
+    };
+
+    function getMessages() {
+        var lang = (document.documentElement.lang || "en").toLowerCase().split("-")[0];
+        return messages[lang] || messages.en;
+    }
+
+    function format(date, now, text) {
+        // サーバーとの時計のずれで未来の時刻になった場合は 0 分前とする
+        var delta = Math.max(0, now - date);
+        if (delta < HOUR) {
+            return text.minute(Math.floor(delta / MINUTE));
+        } else if (delta < DAY) {
+            return text.hour(Math.floor(delta / HOUR));
+        } else if (delta < WEEK) {
+            return text.day(Math.floor(delta / DAY));
+        }
+        return text.week();
+    }
+
+    function update(root) {
+        var now = Date.now();
+        var text = getMessages();
+        var elements = (root || document).querySelectorAll("time.relative-time[datetime]");
+        for (var i = 0; i < elements.length; i++) {
+            var element = elements[i];
+            var date = Date.parse(element.getAttribute("datetime"));
+            if (isNaN(date)) {
+                continue;
+            }
+            if (!element.title) {
+                // 書き換える前の絶対時刻はツールチップに残す
+                element.title = element.textContent.trim();
+            }
+            element.textContent = format(date, now, text);
+        }
+    }
+
+    window.forumRelativeTime = { update: update };
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", function () { update(); });
+    } else {
+        update();
+    }
+    setInterval(update, MINUTE);
+})();
@@ -0,0 +1,84 @@
+// 検索欄の入力補完。入力のたびにトピック内のタグ名と語の候補を取得し、
+// <datalist> に表示する。タグを選んだ場合はタグで絞り込む。
+(function () {
+    "use strict";
+
+    var form = document.querySelector(".search-form[data-suggest-url]");
+    var input = form && form.querySelector("input[name=keyword]");
+    if (!input || !window.fetch) {
+        return;
+    }
+
+    var url = form.getAttribute("data-suggest-url");
+    var list = document.createElement("datalist");
+    list.id = "search-suggestions";
+    form.appendChild(list);
+    input.setAttribute("list", list.id);
+    input.setAttribute("autocomplete", "off");
+
+    var results = {};
+    var tags = {};
+    var controller = null;
+    var timer = null;
+
+    function show(data) {
+        list.textContent = "";
+        tags = {};
+        data.tags.forEach(function (tag) {
+            var option = document.createElement("option");
+            option.value = tag.name;
+            option.label = "タグ (" + tag.count + ")";
+            list.appendChild(option);
+            tags[tag.name] = true;
+        });
+        data.terms.forEach(function (term) {
+            var option = document.createElement("option");
+            option.value = term.term;
+            option.label = term.count + " 件";
+            list.appendChild(option);
+        });
+    }
+
+    function suggest() {
+        var q = input.value.trim();
+        if (!q) {
+            list.textContent = "";
+            return;
+        }
+        if (results[q]) {
+            show(results[q]);
+            return;
+        }
+        if (controller) {
+            // 古い入力の応答は使わない
+            controller.abort();
+        }
+        controller = window.AbortController ? new AbortController() : null;
+        fetch(url + "?q=" + encodeURIComponent(q), {
+            credentials: "same-origin",
+            signal: controller ? controller.signal : undefined
+        }).then(function (response) {
+            return response.ok ? response.json() : null;
+        }).then(function (data) {
+            if (data) {
+                results[q] = data;
+                if (input.value.trim() === q) {
+                    show(data);
+                }
+            }
+        }).catch(function () {});
+    }
+
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 80);
+    });
+
+    form.addEventListener("submit", function (event) {
+        var value = input.value.trim();
+        if (tags[value]) {
+            event.preventDefault();
+            window.location.search = "?tag=" + encodeURIComponent(value);
+        }
+    });
+})();
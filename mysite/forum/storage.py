@@ -0,0 +1,153 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter, defaultdict
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import LazyObject
+
+
+# 書き込み中のファイルを置くディレクトリ。os.replace() で移すので同じ
+# ファイルシステム (MEDIA_ROOT の下) に置き、media.serve からは返さない
+TEMP_DIR = ".tmp"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """内容の SHA-256 をファイル名にして保存するストレージ。
+
+    同じ内容のファイルは 1 つだけ保存し、StoredFile の参照カウントで管理する。
+    delete() は参照カウントを減らし、0 になったときだけ実際に削除する。
+    名前が内容で決まるので、URL は内容が変わらない限り変わらない。
+
+    参照カウントの更新とファイルの配置・削除は、StoredFile の行をロックした
+    同じトランザクションで行う。save() は呼び出し側のトランザクション
+    (Message.save()) に含まれるので、行の保存に失敗すれば参照カウントも戻る。
+    """
+
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # 同じ名前は同じ内容なので、別名を探す必要はない
+        return name
+
+    def hashed_name(self, name, digest):
+        dirname, basename = posixpath.split(name.replace("\\", "/"))
+        ext = os.path.splitext(basename)[1].lower()
+        return posixpath.join(dirname, digest[:2], f"{digest}{ext}")
+
+    def _save(self, name, content):
+        from .models import StoredFile
+
+        tmp_dir = self.path(TEMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # 書き込みながらハッシュを計算する (内容を 2 度読まない)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks(self.chunk_size):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            name = self.hashed_name(name, hasher.hexdigest())
+            with transaction.atomic():
+                stored, created = StoredFile.objects.select_for_update().get_or_create(
+                    name=name, defaults={"size": size}
+                )
+                if not created:
+                    StoredFile.objects.filter(pk=stored.pk).update(
+                        refcount=F("refcount") + 1
+                    )
+                # 同時に実行される delete() が行を消してからファイルを消す前に
+                # 置いてしまわないよう、ロックを持ったまま確認する
+                if not super().exists(name):
+                    path = self.path(name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+    def delete(self, name):
+        from .models import StoredFile
+
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is not None and stored.refcount > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(
+                    refcount=F("refcount") - 1
+                )
+                return
+            if stored is not None:
+                stored.delete()
+            # _save() が同じ名前で参照を増やしてファイルを確認するのは、この
+            # トランザクションが終わってから
+            super().delete(name)
+            self.delete_derived(name)
+
+    def add_references(self, names):
+        """save() を通らずに参照されたファイル (取り込みなど) の参照を数える"""
+        from .models import StoredFile
+
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+        existing = set(
+            StoredFile.objects.filter(name__in=counts).values_list("name", flat=True)
+        )
+        StoredFile.objects.bulk_create(
+            [
+                StoredFile(name=name, size=self.file_size(name), refcount=0)
+                for name in counts
+                if name not in existing
+            ],
+            ignore_conflicts=True,
+        )
+        names_by_count = defaultdict(list)
+        for name, num in counts.items():
+            names_by_count[num].append(name)
+        for num, names in names_by_count.items():
+            StoredFile.objects.filter(name__in=names).update(
+                refcount=F("refcount") + num
+            )
+
+    def file_size(self, name):
+        # ファイルがまだ置かれていなければ 0
+        return self.size(name) if super().exists(name) else 0
+
+    def delete_derived(self, name):
+        # サムネイルは元画像の名前から作られるので一緒に消す
+        from .thumbnails import thumbnail_dir, thumbnail_prefix
+
+        directory = thumbnail_dir(name)
+        if not super().exists(directory):
+            return
+        prefix = thumbnail_prefix(name)
+        for filename in self.listdir(directory)[1]:
+            if filename.startswith(prefix):
+                super().delete(posixpath.join(directory, filename))
+
+
+class MessageImageStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = ContentAddressedStorage()
+
+
+message_image_storage = MessageImageStorage()
+
+
+def get_message_image_storage():
+    return message_image_storage
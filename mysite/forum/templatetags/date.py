@@ -1,7 +1,10 @@
 from datetime import timedelta
 
 from django import template
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateformat import format as format_date
+from django.utils.html import format_html
 
 from django.utils.translation import gettext, ngettext
 
@@ -33,3 +36,26 @@ def elapsed_time(dt):
         return ngettext("%d day ago", "%d days ago", delta.days) % delta.days
     else:
         return gettext("more than 1 week")
+
+
+@register.filter
+def relative_time(dt):
+    """<time> 要素を返す。
+
+    FORUM_TIMESTAMP_MODE が "client" のときは絶対時刻を表示しておき、
+    forum/js/relative-time.js が「n 分前」に書き換える。出力が現在時刻に
+    依存しないので、ページをキャッシュしたり ETag を付けたりできる。
+    "server" のときは elapsed_time の結果をそのまま表示する。
+    """
+    if not dt:
+        return ""
+
+    if getattr(settings, "FORUM_TIMESTAMP_MODE", "client") == "server":
+        text = elapsed_time(dt)
+    else:
+        text = format_date(timezone.localtime(dt), "Y-m-d H:i")
+    return format_html(
+        '<time class="relative-time" datetime="{}">{}</time>',
+        dt.isoformat(timespec="seconds"),
+        text,
+    )
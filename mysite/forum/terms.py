@@ -0,0 +1,30 @@
+"""入力補完 (TopicTerm) に使う語の抽出。
+
+日本語は分かち書きしないので、文字種が変わるところで区切り、漢字の連続と
+カタカナの連続を語とする。ひらがなは助詞や活用語尾がほとんどなので使わない。
+英数字は空白や記号で区切る。NFKC で正規化して小文字にそろえる。
+"""
+import re
+import unicodedata
+
+TERM_RE = re.compile(
+    r"[0-9a-z\u00df-\u00f6\u00f8-\u024f]+"  # 英数字 (ラテン文字)
+    r"|[\u30a1-\u30fa\u30fc]+"  # カタカナ (長音を含む)
+    r"|[\u3400-\u4dbf\u4e00-\u9fff\u3005]+"  # 漢字 (々を含む)
+)
+
+MIN_LENGTH = 2
+MAX_LENGTH = 50
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def extract_terms(text):
+    """text に含まれる語の集合"""
+    return {
+        term
+        for term in TERM_RE.findall(normalize(text))
+        if MIN_LENGTH <= len(term) <= MAX_LENGTH
+    }
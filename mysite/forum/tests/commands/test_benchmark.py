@@ -0,0 +1,55 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from forum.benchmark import (
+    Scale,
+    build_dataset,
+    percentile,
+    run_benchmark,
+    summarize_throughput,
+)
+from forum.models import Topic, Message, Comment
+
+
+class TestBenchmark(TestCase):
+    scale = Scale(topics=2, messages=6, comments=2, tags=3, users=2)
+
+    def test_build_dataset(self):
+        build_dataset(self.scale)
+        self.assertEqual(Topic.objects.count(), 2)
+        self.assertEqual(Message.objects.count(), 12)
+        self.assertEqual(Comment.objects.count(), 24)
+
+        topic = Topic.objects.first()
+        self.assertEqual(topic.message_count, 6)
+        self.assertEqual(topic.comment_count, 12)
+        self.assertIsNotNone(topic.last_activity_at)
+        self.assertEqual(Message.objects.first().reply_count, 2)
+
+    def test_run_benchmark(self):
+        result = run_benchmark(self.scale, repeat=2)
+        self.assertEqual(result["dataset"]["messages"], 6)
+        self.assertIn("forum_deep_page", result["scenarios"])
+        for scenario in result["scenarios"].values():
+            self.assertEqual(scenario["requests"], 2)
+            self.assertLessEqual(scenario["p50_ms"], scenario["p99_ms"])
+            self.assertGreater(scenario["queries"], 0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+
+    def test_summarize_throughput(self):
+        results = [(0.1, 200), (0.2, 200), (0.3, 304), (0.4, 404)]
+        summary = summarize_throughput(results, 2.0, concurrency=4)
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["requests_per_second"], 2.0)
+        self.assertEqual(summary["p50_ms"], 200.0)
+
+    def test_unknown_scale(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_forum", scales="huge")
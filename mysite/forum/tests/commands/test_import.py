@@ -0,0 +1,219 @@
+import json
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from forum.importer import Importer
+from forum.models import (
+    TopicQuerySet,
+    ImportCheckpoint,
+    Tag,
+    Topic,
+    TopicTag,
+    TopicTerm,
+    Message,
+    Comment,
+)
+from accounts.models import CustomUser
+
+
+class TestImportCommand(TestCase):
+    records = [
+        {"type": "topic", "name": "Python"},
+        {"type": "tag", "name": "質問"},
+        {
+            "type": "message",
+            "id": 10,
+            "topic": "Python",
+            "user": "alice",
+            "content": "こんにちは",
+            "created_at": "2022-02-25T14:00:00+00:00",
+            "tags": ["質問", "雑談"],
+        },
+        {
+            "type": "message",
+            "id": 11,
+            "topic": "Django",
+            "user": "bob",
+            "content": "Hello",
+            "created_at": "2022-02-25T15:00:00+00:00",
+        },
+        {
+            "type": "comment",
+            "id": 20,
+            "message": 10,
+            "user": "bob",
+            "content": "ありがとう",
+            "created_at": "2022-02-25T16:00:00+00:00",
+        },
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "dump.jsonl"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, records, mode="w"):
+        with open(self.path, mode, encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command("import_forum_jsonl", str(self.path), *args, stdout=out)
+        return out.getvalue()
+
+    def test_import(self):
+        self.write(self.records)
+        self.run_import("--chunk-size", "2")
+
+        self.assertEqual(Topic.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(CustomUser.objects.count(), 2)
+
+        message = Message.objects.get(pk=10)
+        self.assertEqual(message.content, "こんにちは")
+        self.assertEqual(
+            message.created_at, datetime(2022, 2, 25, 14, tzinfo=timezone.utc)
+        )
+        self.assertCountEqual(
+            message.tag.values_list("name", flat=True), ["質問", "雑談"]
+        )
+        self.assertEqual(message.reply_count, 1)
+        self.assertEqual(Comment.objects.get(pk=20).message, message)
+
+        topic = Topic.objects.get(name="Python")
+        self.assertEqual(topic.message_count, 1)
+        self.assertEqual(topic.comment_count, 1)
+        self.assertEqual(
+            topic.last_activity_at, datetime(2022, 2, 25, 16, tzinfo=timezone.utc)
+        )
+
+    def test_created_at_without_update(self):
+        # 投稿日時は INSERT で書き込み、UPDATE し直さない
+        self.write(self.records)
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import("--chunk-size", "1")
+        self.assertFalse(
+            [q for q in queries if q["sql"].startswith('UPDATE "forum_comment"')]
+        )
+        self.assertEqual(
+            Comment.objects.get(pk=20).created_at,
+            datetime(2022, 2, 25, 16, tzinfo=timezone.utc),
+        )
+        # 取り込みの外では auto_now_add のまま
+        message = Message.objects.create(
+            content="New", topic=Topic.objects.first(), user=CustomUser.objects.first()
+        )
+        self.assertGreater(message.created_at.year, 2022)
+
+    def test_refresh_activity_once(self):
+        self.write(self.records)
+        refresh_activity = TopicQuerySet.refresh_activity
+        with mock.patch.object(
+            TopicQuerySet,
+            "refresh_activity",
+            autospec=True,
+            side_effect=refresh_activity,
+        ) as mocked:
+            self.run_import("--chunk-size", "1")
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(Topic.objects.get(name="Django").message_count, 1)
+
+    def test_resume(self):
+        self.write(self.records[:3])
+        self.run_import()
+        self.write(self.records[3:], mode="a")
+        out = self.run_import()
+
+        self.assertIn("Imported 2 rows", out)
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Topic.objects.get(name="Python").comment_count, 1)
+        self.assertEqual(
+            ImportCheckpoint.objects.get().lines, len(self.records)
+        )
+
+    def test_restart_is_idempotent(self):
+        self.write(self.records)
+        self.run_import()
+        self.run_import("--restart")
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Message.objects.get(pk=10).reply_count, 1)
+
+    def test_topic_counts(self):
+        # チャンクごとに加算し、取り込み直しても二重に数えない
+        self.write(self.records)
+        self.run_import("--chunk-size", "1")
+        self.run_import("--restart", "--chunk-size", "1")
+        self.assertEqual(
+            TopicTag.objects.get(topic__name="Python", tag__name="質問").count, 1
+        )
+        self.assertEqual(
+            TopicTerm.objects.get(topic__name="Django", term="hello").count, 1
+        )
+
+    def test_skip_comment_without_message(self):
+        self.write(
+            [{"type": "comment", "id": 1, "message": 99, "user": "bob", "content": "x"}]
+        )
+        out = self.run_import()
+        self.assertIn("skipped 1 comments", out)
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_comment_before_message(self):
+        self.write([self.records[4], *self.records[:4]])
+        out = self.run_import("--chunk-size", "1")
+        self.assertIn("skipped 0 comments", out)
+        self.assertEqual(Comment.objects.get(pk=20).message_id, 10)
+        self.assertEqual(Message.objects.get(pk=10).reply_count, 1)
+
+    def test_resume_keeps_pending_comment(self):
+        # メッセージを待っているコメントより先には読み込み位置を進めない
+        self.write([self.records[4], self.records[3], self.records[2]])
+        flush = Importer.flush
+
+        def fail_on_message(importer, *args, **kwargs):
+            if any(m.id == 10 for m in importer.messages):
+                raise RuntimeError("interrupted")
+            flush(importer, *args, **kwargs)
+
+        with mock.patch.object(Importer, "flush", fail_on_message):
+            with self.assertRaises(RuntimeError):
+                self.run_import("--chunk-size", "1")
+        self.assertEqual(ImportCheckpoint.objects.get().lines, 0)
+        self.assertEqual(Message.objects.count(), 1)
+        # 最終アクティビティは最後のチャンクまで数え直さない
+        self.assertEqual(Topic.objects.get(name="Django").message_count, 0)
+
+        self.run_import("--chunk-size", "1")
+        self.assertEqual(Comment.objects.get(pk=20).message_id, 10)
+        self.assertEqual(Topic.objects.get(name="Django").message_count, 1)
+        self.assertEqual(ImportCheckpoint.objects.get().lines, 3)
+
+    def test_conflicting_id(self):
+        # 別のデータと同じ id の行があれば取り込まない
+        topic = Topic.objects.create(name="Other")
+        user = CustomUser.objects.create(username="carol")
+        Message.objects.create(id=10, content="other", topic=topic, user=user)
+        self.write(self.records[:3])
+        with self.assertRaisesMessage(CommandError, "message 10 already exists"):
+            self.run_import()
+        self.assertEqual(Message.objects.get(pk=10).content, "other")
+        self.assertFalse(Tag.message.through.objects.exists())
+
+    def test_invalid_record(self):
+        self.write(self.records[:1] + [{"type": "unknown"}])
+        with self.assertRaisesMessage(CommandError, "line 2"):
+            self.run_import()
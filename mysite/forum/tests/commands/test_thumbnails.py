@@ -0,0 +1,155 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone, translation
+from PIL import Image
+
+from forum import jobs
+from forum.models import Job, Topic, Message
+from accounts.models import CustomUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, FORUM_THUMBNAIL_WIDTHS=[100, 400, 2000])
+class TestThumbnails(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.user = CustomUser.objects.create(username="TestName", email="test@test.com")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_image(self, width=800, height=400, color="red"):
+        buffer = BytesIO()
+        Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+        return SimpleUploadedFile("test.png", buffer.getvalue(), content_type="image/png")
+
+    def create_message(self, width=800, height=400):
+        image = self.create_image(width, height)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(
+                content="TestContent", topic=self.topic, user=self.user, image=image
+            )
+
+    def test_enqueue_on_upload(self):
+        message = self.create_message()
+        job = Job.objects.get()
+        self.assertEqual(job.kind, "thumbnails")
+        self.assertEqual(job.payload, {"message_id": message.pk})
+
+    def test_process_jobs(self):
+        message = self.create_message()
+        call_command("process_jobs", "--once", "--workers", "1")
+
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        message.refresh_from_db()
+        variants = {(t["width"], t["format"]) for t in message.thumbnails}
+        self.assertEqual(
+            variants, {(100, "webp"), (100, "jpeg"), (400, "webp"), (400, "jpeg")}
+        )
+        for thumbnail in message.thumbnails:
+            with message.image.storage.open(thumbnail["name"]) as f, Image.open(f) as image:
+                self.assertEqual(image.width, thumbnail["width"])
+                self.assertEqual(image.format, thumbnail["format"].upper())
+        self.assertIn(" 400w", message.webp_srcset)
+        self.assertIn(".jpg 100w", message.jpeg_srcset)
+
+    def test_srcset_in_page(self):
+        self.create_message()
+        call_command("process_jobs", "--once", "--workers", "1")
+        # LocaleMiddleware が有効にした言語を後のテストに持ち越さない
+        with translation.override(None):
+            res = self.client.get("/ja/forum/TestTopic/")
+        self.assertContains(res, '<source type="image/webp" srcset=')
+        self.assertContains(res, 'loading="lazy"')
+
+    def test_failed_job(self):
+        job = Job.objects.create(kind="thumbnails", payload={"unknown": 1})
+        for _ in range(3):
+            call_command("process_jobs", "--once", "--workers", "1")
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn("TypeError", job.last_error)
+
+    def test_backfill(self):
+        message = self.create_message()
+        Job.objects.all().delete()
+        Message.objects.create(content="TestContent", topic=self.topic, user=self.user)
+
+        out = StringIO()
+        call_command("backfill_thumbnails", stdout=out)
+        self.assertIn("1 thumbnail jobs", out.getvalue())
+        self.assertEqual(Job.objects.get().payload, {"message_id": message.pk})
+
+    def test_backfill_force(self):
+        message = self.create_message()
+        call_command("process_jobs", "--once", "--workers", "1")
+        message.refresh_from_db()
+        name = message.thumbnails[0]["name"]
+        storage = message.image.storage
+        with storage.open(name, "wb") as f:
+            f.write(b"broken")
+
+        call_command("backfill_thumbnails", "--force", stdout=StringIO())
+        call_command("process_jobs", "--once", "--workers", "1")
+        message.refresh_from_db()
+        # 同じ名前のまま作り直す
+        self.assertEqual(message.thumbnails[0]["name"], name)
+        with storage.open(name) as f, Image.open(f) as image:
+            self.assertEqual(image.width, message.thumbnails[0]["width"])
+
+    def test_image_replaced(self):
+        message = self.create_message()
+        call_command("process_jobs", "--once", "--workers", "1")
+        message.refresh_from_db()
+        old_name = message.image.name
+
+        message.image = self.create_image(color="blue")
+        with self.captureOnCommitCallbacks(execute=True):
+            message.save()
+        message.refresh_from_db()
+        self.assertEqual(message.thumbnails, [])
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+        # 古い画像は参照がなくなるので消える
+        self.assertFalse(message.image.storage.exists(old_name))
+
+        call_command("process_jobs", "--once", "--workers", "1")
+        message.refresh_from_db()
+        prefix = message.image.name.rsplit("/", 1)[1].split(".")[0]
+        self.assertTrue(all(prefix in t["name"] for t in message.thumbnails))
+
+
+class TestJobLease(TestCase):
+    def expire(self, job):
+        Job.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=601)
+        )
+
+    def test_reclaim_expired(self):
+        # ワーカーが落ちて実行中のまま残ったジョブを取り出し直す
+        job = Job.objects.create(kind="noop", status=Job.RUNNING, attempts=1)
+        self.assertIsNone(jobs.claim())
+        self.expire(job)
+        claimed = jobs.claim()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertIsNone(jobs.claim())
+
+    def test_expired_after_max_attempts(self):
+        job = Job.objects.create(
+            kind="noop", status=Job.RUNNING, attempts=jobs.MAX_ATTEMPTS
+        )
+        self.expire(job)
+        self.assertIsNone(jobs.claim())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+
+from forum.db import (
+    ReadWriteRouter,
+    configure_sqlite,
+    get_read_database,
+    use_read_database,
+)
+from forum.models import Topic
+
+
+class TestSqlitePragmas(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma("busy_timeout"), 5000)
+        self.assertEqual(self.pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma("cache_size"), -20000)
+
+    def test_settings(self):
+        with override_settings(FORUM_SQLITE_PRAGMAS={"busy_timeout": 100}):
+            configure_sqlite(sender=connection.__class__, connection=connection)
+        self.addCleanup(self.pragma, "busy_timeout = 5000")
+        self.assertEqual(self.pragma("busy_timeout"), 100)
+
+
+class TestReadWriteRouter(TestCase):
+    router = ReadWriteRouter()
+
+    def read_only(self):
+        return mock.patch.dict(
+            connections["replica"].settings_dict, NAME="file:db.sqlite3?mode=ro"
+        )
+
+    def test_mirror_is_not_used(self):
+        # テストでは replica は default のミラーになっている
+        self.assertIsNone(get_read_database())
+        with use_read_database():
+            self.assertIsNone(self.router.db_for_read(Topic))
+
+    def test_read(self):
+        with self.read_only():
+            self.assertIsNone(self.router.db_for_read(Topic))
+            with use_read_database():
+                self.assertEqual(self.router.db_for_read(Topic), "replica")
+                self.assertEqual(self.router.db_for_write(Topic), "default")
+
+    def test_write(self):
+        with self.read_only():
+            topic = Topic(name="TestTopic")
+            topic._state.db = "replica"
+            self.assertEqual(self.router.db_for_write(Topic, instance=topic), "default")
+
+    @override_settings(FORUM_READ_DATABASE=None)
+    def test_disabled(self):
+        with self.read_only(), use_read_database():
+            self.assertIsNone(self.router.db_for_read(Topic))
+
+    def test_allow_migrate(self):
+        self.assertIsNone(self.router.allow_migrate("default", "forum"))
+        self.assertFalse(self.router.allow_migrate("replica", "forum"))
@@ -0,0 +1,110 @@
+import json
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from forum.forms import MessageForm
+from forum.models import Comment, Message, Tag, Topic
+from accounts.models import CustomUser
+
+SCAN_RE = re.compile(r"^SCAN (\w+)(.*)$")
+
+
+@override_settings(FORUM_FRAGMENT_CACHE=False)
+class TestQueryPlans(TestCase):
+    """ビューのクエリが索引を使い、テーブル全体を走査しないこと。"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create(username="TestName", email="test@test.com")
+        tag = Tag.objects.create(name="TestTag")
+        for name in ("TestTopic", "OtherTopic"):
+            topic = Topic.objects.create(name=name)
+            for i in range(3):
+                message = Message.objects.create(
+                    content=f"TestContent{i}", topic=topic, user=user
+                )
+                message.tag.add(tag)
+                for j in range(7):
+                    Comment.objects.create(
+                        content=f"TestComment{j}", message=message, user=user
+                    )
+            if name == "TestTopic":
+                cls.message = message
+
+    def setUp(self):
+        cache.clear()
+
+    def full_scans(self, sql):
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = [row[-1] for row in cursor.fetchall()]
+        # 索引を使った走査 (ORDER BY のための SCAN ... USING INDEX) やサブクエリの
+        # 結果の走査は許す
+        return [
+            detail
+            for detail in plan
+            if (match := SCAN_RE.match(detail))
+            and match.group(1) in tables
+            and "USING" not in match.group(2)
+        ]
+
+    def assertNoFullScans(self, url, params=None):
+        # リクエストで有効になった言語を後のテストに残さない
+        with translation.override(None), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        # 投稿フォームはすべてのタグを選択肢にする
+        choices = str(MessageForm().fields["tag"].queryset.query)
+        selects = [
+            q["sql"]
+            for q in queries
+            if q["sql"].startswith("SELECT") and q["sql"] != choices
+        ]
+        self.assertTrue(selects)
+        for sql in selects:
+            with self.subTest(sql=sql):
+                self.assertEqual(self.full_scans(sql), [])
+
+    def test_index_view(self):
+        self.assertNoFullScans("/ja/forum/")
+
+    def test_forum_view(self):
+        self.assertNoFullScans("/ja/forum/TestTopic/")
+
+    def test_forum_view_tag(self):
+        self.assertNoFullScans("/ja/forum/TestTopic/", {"tag": "TestTag"})
+
+    @override_settings(FORUM_PAGINATION_MODE="cursor")
+    def test_forum_view_cursor(self):
+        self.assertNoFullScans("/ja/forum/TestTopic/")
+
+    def test_comment_list_view(self):
+        self.assertNoFullScans(
+            f"/ja/forum/TestTopic/messages/{self.message.id}/comments/"
+        )
+
+    def test_topic_list_api(self):
+        self.assertNoFullScans("/ja/forum/api/topics/")
+
+    def test_message_list_api(self):
+        url = "/ja/forum/api/topics/TestTopic/messages/"
+        self.assertNoFullScans(url)
+        with translation.override(None):
+            response = self.client.get(url, {"limit": 1})
+        next_url = json.loads(b"".join(response.streaming_content))["next"]
+        self.assertNoFullScans(next_url)
+
+    def test_comment_list_api(self):
+        url = f"/ja/forum/api/topics/TestTopic/messages/{self.message.id}/comments/"
+        self.assertNoFullScans(url, {"limit": 2})
+
+    def test_suggestion_api(self):
+        self.assertNoFullScans(
+            "/ja/forum/api/topics/TestTopic/suggestions/", {"q": "test"}
+        )
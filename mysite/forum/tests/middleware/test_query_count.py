@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from forum.middleware import QueryStats, fingerprint, get_query_budget
+from forum.models import Tag, Topic, Message, Comment
+from forum.topics import get_topic
+from accounts.models import CustomUser
+
+
+class QueryBudgetMixin:
+    def assertWithinQueryBudget(self, res):
+        view_name = res.wsgi_request.resolver_match.view_name
+        budget = get_query_budget(view_name)
+        self.assertIsNotNone(budget, f"{view_name} has no query budget")
+        count = res.wsgi_request.query_stats.count
+        self.assertLessEqual(
+            count, budget, f"{view_name} ran {count} queries (budget {budget})"
+        )
+        self.assertEqual(res.wsgi_request.query_stats.duplicates, {})
+        return count
+
+
+class TestQueryStats(TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s,  %s)'),
+            'SELECT * FROM "t" WHERE "id" IN (%s, ...)',
+        )
+
+    def test_duplicates(self):
+        topic = Topic.objects.create(name="TestTopic")
+        stats = QueryStats()
+        with stats.record():
+            for _ in range(3):
+                list(Topic.objects.filter(pk=topic.pk))
+            list(Topic.objects.filter(pk__in=[1, 2]))
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(list(stats.duplicates.values()), [3])
+
+
+class TestQueryBudgets(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="TestName", email="test@test.com", password="thisistest"
+        )
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.tags = [Tag.objects.create(name=f"TestTag{i}") for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def create_messages(self, num, comments):
+        for i in range(num):
+            message = Message.objects.create(
+                content=f"TestContent{i}", topic=self.topic, user=self.user
+            )
+            message.tag.set(self.tags)
+            for j in range(comments):
+                Comment.objects.create(
+                    content=f"TestComment{j}", message=message, user=self.user
+                )
+
+    def test_index(self):
+        self.create_messages(3, 2)
+        for i in range(5):
+            Topic.objects.create(name=f"Topic{i}")
+        self.assertWithinQueryBudget(self.client.get("/ja/forum/"))
+
+    def test_forum_independent_of_page_size(self):
+        self.create_messages(1, 1)
+        small = self.assertWithinQueryBudget(self.client.get("/ja/forum/TestTopic/"))
+
+        cache.clear()
+        self.create_messages(10, 8)
+        large = self.assertWithinQueryBudget(self.client.get("/ja/forum/TestTopic/"))
+        self.assertEqual(small, large)
+
+    def test_forum_authenticated(self):
+        self.create_messages(5, 3)
+        self.client.login(username="TestName", password="thisistest")
+        # トピックのキャッシュの読み込みは世代番号ごとに 1 回なので、読み込み済みで数える
+        get_topic("TestTopic")
+        self.assertWithinQueryBudget(
+            self.client.get("/ja/forum/TestTopic/", {"tag": "TestTag0"})
+        )
+
+    def test_forum_search(self):
+        self.create_messages(5, 3)
+        self.assertWithinQueryBudget(
+            self.client.get("/ja/forum/TestTopic/", {"keyword": "TestContent"})
+        )
+
+    def test_comments(self):
+        self.create_messages(1, 12)
+        message = Message.objects.get()
+        self.assertWithinQueryBudget(
+            self.client.get(f"/ja/forum/TestTopic/messages/{message.id}/comments/")
+        )
@@ -0,0 +1,104 @@
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+
+from forum.log import (
+    QueueListenerHandler,
+    RequestContextFilter,
+    SamplingFilter,
+    request_context,
+)
+
+
+class TestSamplingFilter(SimpleTestCase):
+    def make_record(self, name, level=logging.INFO):
+        return logging.LogRecord(name, level, __file__, 0, "test", (), None)
+
+    def test_rate(self):
+        sampling = SamplingFilter({"forum.access": 0.0, "forum.access.write": 1.0})
+        self.assertFalse(sampling.filter(self.make_record("forum.access.read")))
+        self.assertTrue(sampling.filter(self.make_record("forum.access.write")))
+        self.assertTrue(sampling.filter(self.make_record("forum.views")))
+
+    def test_always_log_warning(self):
+        sampling = SamplingFilter({"forum": 0.0})
+        self.assertFalse(sampling.filter(self.make_record("forum.views")))
+        self.assertTrue(
+            sampling.filter(self.make_record("forum.views", logging.WARNING))
+        )
+        self.assertTrue(sampling.filter(self.make_record("forum.views", logging.ERROR)))
+
+
+class TestQueueListenerHandler(SimpleTestCase):
+    def test_json_lines(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = Path(tmpdir) / "logs" / "forum.jsonl"
+            handler = QueueListenerHandler(filename)
+            handler.addFilter(RequestContextFilter())
+            logger = logging.getLogger("forum.tests.queue")
+            logger.addHandler(handler)
+            logger.propagate = False
+            token = request_context.set({"request_id": "abc", "topic": "TestTopic"})
+            try:
+                logger.warning("posted %s", "message", extra={"message_id": 1})
+                try:
+                    raise ValueError("boom")
+                except ValueError:
+                    logger.exception("failed")
+            finally:
+                request_context.reset(token)
+                logger.removeHandler(handler)
+                handler.close()
+
+            lines = filename.read_text(encoding="utf-8").splitlines()
+
+        self.assertEqual(len(lines), 2)
+        record = json.loads(lines[0])
+        self.assertEqual(record["message"], "posted message")
+        self.assertEqual(record["level"], "WARNING")
+        self.assertEqual(record["request_id"], "abc")
+        self.assertEqual(record["topic"], "TestTopic")
+        self.assertIsNone(record["user_id"])
+        self.assertEqual(record["message_id"], 1)
+        self.assertIn("ValueError: boom", json.loads(lines[1])["exc_info"])
+
+    def test_creates_directory_on_write(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = Path(tmpdir) / "logs" / "forum.jsonl"
+            handler = QueueListenerHandler(filename)
+            self.assertFalse(filename.parent.exists())
+            handler.handle(logging.makeLogRecord({"name": "forum", "msg": "test"}))
+            handler.close()
+            self.assertTrue(filename.exists())
+            # atexit からもう一度止めても失敗しない
+            handler.stop()
+
+    def test_sampling_before_context(self):
+        filters = settings.LOGGING["handlers"]["forum_file"]["filters"]
+        self.assertLess(filters.index("sampling"), filters.index("request_context"))
+
+
+class TestRequestLogMiddleware(TestCase):
+    def test_request_id(self):
+        res = self.client.get("/ja/forum/", HTTP_X_REQUEST_ID="test-request")
+        self.assertEqual(res["X-Request-ID"], "test-request")
+
+        res = self.client.get("/ja/forum/")
+        self.assertEqual(len(res["X-Request-ID"]), 32)
+
+    def test_access_log(self):
+        with self.assertLogs("forum.access.read", "INFO") as logs:
+            self.client.get("/ja/forum/")
+        record = logs.records[0]
+        self.assertEqual(record.status, 200)
+        self.assertEqual(record.path, "/ja/forum/")
+        self.assertGreaterEqual(record.duration_ms, 0)
+
+    def test_not_found_is_warning(self):
+        with self.assertLogs("forum.access.read", "WARNING") as logs:
+            self.client.get("/ja/forum/NotExist/")
+        self.assertEqual(logs.records[0].status, 404)
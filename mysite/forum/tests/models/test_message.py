@@ -1,11 +1,21 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
+
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from forum.models import Message, Topic
+from forum import signals
+from forum.models import Message, Topic, Comment
 from accounts.models import CustomUser
 
+MEDIA_ROOT = tempfile.mkdtemp()
+
 
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestMessageModel(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -27,6 +37,11 @@ class TestMessageModel(TestCase):
             user=cls.user,
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def test_is_empty(self):
         records = Message.objects.all()
         self.assertEqual(records.count(), 1)
@@ -42,6 +57,66 @@ class TestMessageModel(TestCase):
 
     def test_default_value(self):
         self.assertEqual(self.message.image, None)
+        self.assertEqual(self.message.reply_count, 0)
+        self.assertIsNone(self.message.latest_reply_at)
+
+    def test_replies_on_comment_created(self):
+        Comment.objects.create(content="TestContent", message=self.message, user=self.user)
+        comment = Comment.objects.create(
+            content="TestContent", message=self.message, user=self.user
+        )
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.reply_count, 2)
+        self.assertEqual(self.message.latest_reply_at, comment.created_at)
+
+    def test_replies_updated_atomically(self):
+        # トピックの更新に失敗したらメッセージの集計も戻す
+        touch = signals._touch
+
+        def fail_on_topic(queryset, *args, **kwargs):
+            if queryset.model is Topic:
+                raise DatabaseError("topic update failed")
+            touch(queryset, *args, **kwargs)
+
+        with mock.patch("forum.signals._touch", fail_on_topic):
+            with self.assertRaises(DatabaseError):
+                Comment.objects.create(
+                    content="TestContent", message=self.message, user=self.user
+                )
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.reply_count, 0)
+
+    def test_replies_without_loaded_message(self):
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.create(
+                content="TestContent", message_id=self.message.id, user=self.user
+            )
+        # メッセージの行を読まずにトピックを更新する
+        self.assertFalse(
+            [q for q in queries if q["sql"].startswith('SELECT "forum_message"."id"')]
+        )
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.comment_count, 1)
+
+    def test_replies_on_comment_deleted(self):
+        comment = Comment.objects.create(
+            content="TestContent", message=self.message, user=self.user
+        )
+        Comment.objects.create(content="TestContent", message=self.message, user=self.user)
+        Comment.objects.filter(pk__gt=comment.pk).delete()
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.reply_count, 1)
+        self.assertEqual(self.message.latest_reply_at, comment.created_at)
+
+    def test_refresh_replies(self):
+        comment = Comment.objects.create(
+            content="TestContent", message=self.message, user=self.user
+        )
+        Message.objects.update(reply_count=0, latest_reply_at=None)
+        Message.objects.refresh_replies()
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.reply_count, 1)
+        self.assertEqual(self.message.latest_reply_at, comment.created_at)
 
     def test_update(self):
         self.message.content = "TestContent2"
@@ -0,0 +1,105 @@
+import hashlib
+import importlib
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from forum.media import is_immutable
+from forum.models import Message, StoredFile, Topic
+from accounts.models import CustomUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestStoredFile(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.user = CustomUser.objects.create(username="TestName", email="test@test.com")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_message(self, data=b"image-data", filename="test.png"):
+        image = SimpleUploadedFile(filename, data, content_type="image/png")
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(
+                content="TestContent", topic=self.topic, user=self.user, image=image
+            )
+
+    def delete_message(self, message):
+        with self.captureOnCommitCallbacks(execute=True):
+            message.delete()
+
+    def test_name_is_content_hash(self):
+        message = self.create_message()
+        digest = hashlib.sha256(b"image-data").hexdigest()
+        self.assertEqual(message.image.name, f"images/{digest[:2]}/{digest}.png")
+        self.assertTrue(is_immutable(message.image.name))
+
+    def test_same_content_is_stored_once(self):
+        first = self.create_message(filename="a.png")
+        second = self.create_message(filename="b.PNG")
+        self.assertEqual(first.image.name, second.image.name)
+        stored = StoredFile.objects.get()
+        self.assertEqual(stored.refcount, 2)
+        self.assertEqual(stored.size, len(b"image-data"))
+
+    def test_delete_releases_reference(self):
+        first = self.create_message()
+        second = self.create_message()
+        storage, name = first.image.storage, first.image.name
+        thumbnail = default_storage.save(
+            f"thumbnails/{name[:-4]}-100w.jpg", ContentFile(b"thumbnail")
+        )
+
+        self.delete_message(first)
+        self.assertEqual(StoredFile.objects.get().refcount, 1)
+        self.assertTrue(storage.exists(name))
+
+        self.delete_message(second)
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(default_storage.exists(thumbnail))
+
+    def test_reference_rolled_back_with_message(self):
+        # メッセージの保存に失敗したら参照数の加算も戻す
+        self.create_message()
+        with mock.patch.object(Message, "_do_insert", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.create_message()
+        self.assertEqual(StoredFile.objects.get().refcount, 1)
+
+    def test_add_references(self):
+        name = self.create_message().image.name
+        Message.objects.create(
+            content="Imported", topic=self.topic, user=self.user, image=name
+        )
+        storage = Message._meta.get_field("image").storage
+        storage.add_references([name, "images/missing.png", "images/missing.png"])
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 2)
+        missing = StoredFile.objects.get(name="images/missing.png")
+        self.assertEqual((missing.refcount, missing.size), (2, 0))
+
+    def test_backfill_migration(self):
+        message = self.create_message()
+        Message.objects.create(
+            content="Copy", topic=self.topic, user=self.user, image=message.image.name
+        )
+        StoredFile.objects.all().delete()
+
+        migration = importlib.import_module("forum.migrations.0012_backfill_stored_files")
+        migration.backfill_stored_files(apps, None)
+        stored = StoredFile.objects.get()
+        self.assertEqual((stored.name, stored.refcount), (message.image.name, 2))
+        self.assertEqual(stored.size, len(b"image-data"))
@@ -1,7 +1,9 @@
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 
-from forum.models import Tag, Topic, Message
+from django.db import IntegrityError
+
+from forum.models import Tag, Topic, TopicTag, Message
 from accounts.models import CustomUser
 
 
@@ -64,3 +66,70 @@ class TestTagModel(TestCase):
 
         self.tag.message.remove(self.message)
         self.assertEqual(self.tag.message.count(), 0)
+
+
+class TestTopicTagCount(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.other_topic = Topic.objects.create(name="OtherTopic")
+        cls.user = CustomUser.objects.create(username="TestName", email="test@test.com")
+        cls.tag = Tag.objects.create(name="TestTag")
+        cls.tag2 = Tag.objects.create(name="TestTag2")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.message2 = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.other_message = Message.objects.create(
+            content="TestContent", topic=cls.other_topic, user=cls.user
+        )
+
+    def counts(self, topic):
+        return dict(
+            TopicTag.objects.filter(topic=topic, count__gt=0).values_list(
+                "tag__name", "count"
+            )
+        )
+
+    def test_unique_name(self):
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(name="TestTag")
+
+    def test_add_from_message(self):
+        self.message.tag.add(self.tag, self.tag2)
+        self.message2.tag.add(self.tag)
+        self.message2.tag.add(self.tag)  # 追加済み
+        self.assertEqual(self.counts(self.topic), {"TestTag": 2, "TestTag2": 1})
+        self.assertEqual(self.counts(self.other_topic), {})
+
+    def test_add_from_tag(self):
+        self.tag.message.add(self.message, self.message2, self.other_message)
+        self.assertEqual(self.counts(self.topic), {"TestTag": 2})
+        self.assertEqual(self.counts(self.other_topic), {"TestTag": 1})
+
+    def test_remove(self):
+        self.message.tag.add(self.tag, self.tag2)
+        self.message.tag.remove(self.tag)
+        self.message2.tag.remove(self.tag)  # 付いていない
+        self.assertEqual(self.counts(self.topic), {"TestTag2": 1})
+
+    def test_clear(self):
+        self.tag.message.add(self.message, self.message2)
+        self.message.tag.clear()
+        self.assertEqual(self.counts(self.topic), {"TestTag": 1})
+        self.tag.message.clear()
+        self.assertEqual(self.counts(self.topic), {})
+
+    def test_message_deleted(self):
+        self.message.tag.add(self.tag)
+        self.message2.tag.add(self.tag)
+        self.message.delete()
+        self.assertEqual(self.counts(self.topic), {"TestTag": 1})
+
+    def test_rebuild(self):
+        self.message.tag.add(self.tag)
+        TopicTag.objects.all().delete()
+        TopicTag.objects.rebuild(Topic.objects.all())
+        self.assertEqual(self.counts(self.topic), {"TestTag": 1})
@@ -1,7 +1,14 @@
+from io import StringIO
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
 
-from forum.models import Topic
+from django.core.management import call_command
+
+from forum.models import Topic, Message, Comment
+from accounts.models import CustomUser
 
 
 class TestTopicModel(TestCase):
@@ -38,3 +45,94 @@ class TestTopicModel(TestCase):
 
     def test_relation(self):
         pass
+
+
+class TestTopicActivity(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.user = CustomUser.objects.create(username="TestName", email="test@test.com")
+
+    def test_default_activity(self):
+        self.assertIsNone(self.topic.last_activity_at)
+        self.assertEqual(self.topic.message_count, 0)
+        self.assertEqual(self.topic.comment_count, 0)
+
+    def test_message_created(self):
+        message = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.last_activity_at, message.created_at)
+        self.assertEqual(self.topic.message_count, 1)
+
+    def test_comment_created(self):
+        message = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        comment = Comment.objects.create(
+            content="TestContent", message=message, user=self.user
+        )
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.last_activity_at, comment.created_at)
+        self.assertEqual(self.topic.comment_count, 1)
+
+    def test_comment_deleted(self):
+        message = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        comment = Comment.objects.create(
+            content="TestContent", message=message, user=self.user
+        )
+        comment.delete()
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.last_activity_at, message.created_at)
+        self.assertEqual(self.topic.comment_count, 0)
+
+    def test_message_deleted(self):
+        message = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        Comment.objects.create(content="TestContent", message=message, user=self.user)
+        message.delete()
+        self.topic.refresh_from_db()
+        self.assertIsNone(self.topic.last_activity_at)
+        self.assertEqual(self.topic.message_count, 0)
+        self.assertEqual(self.topic.comment_count, 0)
+
+    def test_message_deleted_with_comments(self):
+        message = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        for _ in range(3):
+            Comment.objects.create(content="TestContent", message=message, user=self.user)
+        # コメントの件数によらず、再計算はメッセージの削除で 1 回だけ行う
+        with CaptureQueriesContext(connection) as queries:
+            message.delete()
+        updates = [q["sql"].split(" SET ")[0] for q in queries]
+        self.assertEqual(updates.count('UPDATE "forum_topic"'), 1)
+        self.assertEqual(updates.count('UPDATE "forum_message"'), 0)
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.comment_count, 0)
+
+        # 削除が終わればコメントの削除は再び集計を更新する
+        other = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        for _ in range(2):
+            comment = Comment.objects.create(
+                content="TestContent", message=other, user=self.user
+            )
+        comment.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.reply_count, 1)
+
+    def test_reconcile_command(self):
+        message = Message.objects.create(
+            content="TestContent", topic=self.topic, user=self.user
+        )
+        Topic.objects.update(last_activity_at=None, message_count=0)
+        call_command("reconcile_activity", stdout=StringIO())
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.last_activity_at, message.created_at)
+        self.assertEqual(self.topic.message_count, 1)
@@ -0,0 +1,85 @@
+import tempfile
+import time
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.http import Http404
+from django.test import TestCase, override_settings
+
+from forum.models import Message, Topic
+from forum.topics import GENERATION_KEY, TopicCache, get_topic, get_topic_or_404
+from accounts.models import CustomUser
+
+
+class TestTopicCache(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.user = CustomUser.objects.create(username="TestName", email="test@test.com")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get(self):
+        self.assertEqual(get_topic("TestTopic"), self.topic)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_topic("TestTopic").name, "TestTopic")
+
+    def test_missing(self):
+        self.assertIsNone(get_topic("Missing"))
+        with self.assertRaises(Http404):
+            get_topic_or_404("Missing")
+
+    def test_counters_are_not_cached(self):
+        topic = get_topic("TestTopic")
+        Message.objects.create(content="TestContent", topic=self.topic, user=self.user)
+        self.assertEqual(get_topic("TestTopic").message_count, 1)
+        self.assertEqual(topic.message_count, 1)
+
+    def test_invalidated_by_signals(self):
+        get_topic("TestTopic")
+        self.topic.name = "Renamed"
+        self.topic.save()
+        self.assertIsNone(get_topic("TestTopic"))
+        self.assertEqual(get_topic("Renamed"), self.topic)
+
+        Topic.objects.get(name="Renamed").delete()
+        self.assertIsNone(get_topic("Renamed"))
+
+    def test_invalidated_by_other_worker(self):
+        get_topic("TestTopic")
+        # シグナルを送らない更新は、別のワーカーで行われたものとみなす
+        Topic.objects.filter(pk=self.topic.pk).update(name="Renamed")
+        self.assertIsNotNone(get_topic("TestTopic"))
+
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+        self.assertIsNone(get_topic("TestTopic"))
+        self.assertEqual(get_topic("Renamed"), self.topic)
+
+    def test_lru(self):
+        Topic.objects.bulk_create(Topic(name=f"Topic{i}") for i in range(3))
+        topics = TopicCache(size=2)
+        topics.get("Topic0")
+        self.assertEqual(len(topics.entries), 2)
+        topics.get("Topic1")
+        topics.get("Topic0")
+        topics.get("Topic2")
+        self.assertEqual(list(topics.entries), ["Topic0", "Topic2"])
+
+    def test_requires_shared_cache(self):
+        # 世代番号をワーカー間で共有できないキャッシュは本番向けのチェックで報告する
+        with self.assertRaisesMessage(SystemCheckError, "forum.E001"):
+            call_command("check", "--deploy", stdout=StringIO(), stderr=StringIO())
+
+        shared = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": tempfile.gettempdir(),
+            }
+        }
+        out = StringIO()
+        with override_settings(CACHES=shared):
+            call_command("check", "--deploy", stdout=out, stderr=out)
+        self.assertNotIn("forum.E001", out.getvalue())
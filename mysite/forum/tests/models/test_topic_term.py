@@ -0,0 +1,96 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from forum.models import Message, Topic, TopicTerm
+from forum.terms import extract_terms
+from accounts.models import CustomUser
+
+
+class TestExtractTerms(TestCase):
+    def test_extract_terms(self):
+        self.assertEqual(
+            extract_terms("Djangoの非同期ビューとＡＳＧＩについて質問です"),
+            {"django", "非同期", "ビュー", "asgi", "質問"},
+        )
+
+    def test_short_terms(self):
+        self.assertEqual(extract_terms("a 本 ア です"), set())
+
+
+class TestTopicTerm(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="TestName", email="test@test.com")
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.other = Topic.objects.create(name="OtherTopic")
+
+    def counts(self, topic):
+        return dict(
+            TopicTerm.objects.filter(topic=topic, count__gt=0).values_list(
+                "term", "count"
+            )
+        )
+
+    def test_updated_on_post(self):
+        Message.objects.create(content="Django 質問", topic=self.topic, user=self.user)
+        Message.objects.create(content="Django 回答", topic=self.topic, user=self.user)
+        self.assertEqual(self.counts(self.topic), {"django": 2, "質問": 1, "回答": 1})
+        self.assertEqual(self.counts(self.other), {})
+
+    def test_updated_on_edit(self):
+        message = Message.objects.create(
+            content="Django 質問", topic=self.topic, user=self.user
+        )
+        message.content = "Python 質問"
+        message.save()
+        self.assertEqual(self.counts(self.topic), {"python": 1, "質問": 1})
+
+        message.topic = self.other
+        message.save()
+        self.assertEqual(self.counts(self.topic), {})
+        self.assertEqual(self.counts(self.other), {"python": 1, "質問": 1})
+
+    def test_unchanged_on_other_fields(self):
+        message = Message.objects.create(
+            content="Django 質問", topic=self.topic, user=self.user
+        )
+        # 本文を含まない update_fields では変更前の値を読まない
+        with self.assertNumQueries(1):
+            message.save(update_fields=["thumbnails"])
+        self.assertEqual(self.counts(self.topic), {"django": 1, "質問": 1})
+
+    def test_updated_on_delete(self):
+        message = Message.objects.create(
+            content="Django 質問", topic=self.topic, user=self.user
+        )
+        Message.objects.create(content="Django", topic=self.topic, user=self.user)
+        message.delete()
+        self.assertEqual(self.counts(self.topic), {"django": 1})
+        # 0 件になった語の行は残さない
+        self.assertFalse(TopicTerm.objects.filter(count__lte=0).exists())
+
+    def test_rebuild(self):
+        Message.objects.create(content="Django 質問", topic=self.topic, user=self.user)
+        Message.objects.create(content="Django 回答", topic=self.topic, user=self.user)
+        expected = self.counts(self.topic)
+        TopicTerm.objects.all().delete()
+        TopicTerm.objects.rebuild(Topic.objects.all())
+        self.assertEqual(self.counts(self.topic), expected)
+
+    def test_reconcile_command(self):
+        Message.objects.create(content="Django 質問", topic=self.topic, user=self.user)
+        TopicTerm.objects.filter(topic=self.topic).update(count=5)
+        TopicTerm.objects.create(topic=self.topic, term="stale", count=1)
+        call_command("reconcile_activity", stdout=StringIO())
+        self.assertEqual(self.counts(self.topic), {"django": 1, "質問": 1})
+
+    def test_starting_with(self):
+        Message.objects.create(
+            content="Django Djangoist Docker", topic=self.topic, user=self.user
+        )
+        terms = TopicTerm.objects.starting_with(self.topic.id, "djan")
+        self.assertEqual(
+            sorted(terms.values_list("term", flat=True)), ["django", "djangoist"]
+        )
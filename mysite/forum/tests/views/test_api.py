@@ -0,0 +1,234 @@
+import json
+
+from django.test import TestCase
+
+from forum.models import Comment, Message, Tag, Topic
+from accounts.models import CustomUser
+
+
+def get_json(client, url, data=None):
+    res = client.get(url, data)
+    if res.streaming:
+        return res, json.loads(b"".join(res.streaming_content))
+    return res, json.loads(res.content)
+
+
+class TestTopicListAPI(TestCase):
+    url = "/ja/forum/api/topics/"
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create(username="TestName", email="test@test.com")
+        cls.old = Topic.objects.create(name="Old")
+        cls.new = Topic.objects.create(name="New")
+        cls.empty = Topic.objects.create(name="Empty")
+        cls.empty2 = Topic.objects.create(name="Empty2")
+        Message.objects.create(content="TestContent", topic=cls.old, user=user)
+        Message.objects.create(content="TestContent", topic=cls.new, user=user)
+
+    def test_list(self):
+        res, data = get_json(self.client, self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["Content-Type"], "application/json")
+        self.assertEqual(
+            [topic["name"] for topic in data["results"]],
+            ["New", "Old", "Empty2", "Empty"],
+        )
+        self.assertEqual(
+            set(data["results"][0]),
+            {"id", "name", "last_activity_at", "message_count", "comment_count"},
+        )
+        self.assertEqual(data["results"][0]["message_count"], 1)
+        self.assertIsNone(data["next"])
+        self.assertIsNone(data["previous"])
+
+    def test_cursor(self):
+        # 最終アクティビティが NULL のトピックをまたいで前後に移動できる
+        names = []
+        url, data = self.url, {"limit": 1, "fields": "name"}
+        while url:
+            res, page = get_json(self.client, url, data)
+            names.extend(topic["name"] for topic in page["results"])
+            url, data = page["next"], None
+        self.assertEqual(names, ["New", "Old", "Empty2", "Empty"])
+
+        names = []
+        url = page["previous"]
+        while url:
+            res, page = get_json(self.client, url)
+            names.extend(topic["name"] for topic in page["results"])
+            url = page["previous"]
+        self.assertEqual(names, ["Empty2", "Old", "New"])
+
+    def test_fields(self):
+        with self.assertNumQueries(1) as queries:
+            res, data = get_json(self.client, self.url, {"fields": "id,name"})
+        self.assertEqual(set(data["results"][0]), {"id", "name"})
+        self.assertNotIn("message_count", queries.captured_queries[0]["sql"])
+
+    def test_invalid_parameters(self):
+        for params in (
+            {"fields": "id,password"},
+            {"limit": "0"},
+            {"limit": "x"},
+            {"cursor": "invalid"},
+        ):
+            with self.subTest(params=params):
+                res, data = get_json(self.client, self.url, params)
+                self.assertEqual(res.status_code, 400)
+                self.assertIn("error", data)
+
+
+class TestMessageListAPI(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            username="TestName", email="test@test.com"
+        )
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.tag = Tag.objects.create(name="TestTag")
+        cls.messages = [
+            Message.objects.create(content=f"Content{i}", topic=cls.topic, user=cls.user)
+            for i in range(3)
+        ]
+        cls.messages[1].tag.add(cls.tag)
+        cls.url = f"/ja/forum/api/topics/{cls.topic.name}/messages/"
+
+    def test_list(self):
+        res, data = get_json(self.client, self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [message["content"] for message in data["results"]],
+            ["Content0", "Content1", "Content2"],
+        )
+        message = data["results"][1]
+        self.assertEqual(message["tags"], ["TestTag"])
+        self.assertEqual(message["user"], "TestName")
+        self.assertIsNone(message["image"])
+        self.assertEqual(message["reply_count"], 0)
+
+    def test_fields_skip_joins(self):
+        get_json(self.client, self.url)
+        with self.assertNumQueries(1) as queries:
+            res, data = get_json(self.client, self.url, {"fields": "id,content"})
+        self.assertEqual(set(data["results"][0]), {"id", "content"})
+        self.assertNotIn("JOIN", queries.captured_queries[0]["sql"])
+
+        with self.assertNumQueries(2):
+            get_json(self.client, self.url, {"fields": "id,user,tags"})
+
+    def test_filters(self):
+        res, data = get_json(self.client, self.url, {"tag": "TestTag"})
+        self.assertEqual([m["id"] for m in data["results"]], [self.messages[1].id])
+
+        res, data = get_json(self.client, self.url, {"keyword": "Content2"})
+        self.assertEqual([m["id"] for m in data["results"]], [self.messages[2].id])
+
+    def test_cursor(self):
+        res, data = get_json(self.client, self.url, {"limit": 2, "fields": "id"})
+        self.assertEqual(len(data["results"]), 2)
+        self.assertIn("fields=id", data["next"])
+        res, data = get_json(self.client, data["next"])
+        self.assertEqual([m["id"] for m in data["results"]], [self.messages[2].id])
+        self.assertIsNone(data["next"])
+
+    def test_not_found(self):
+        res = self.client.get("/ja/forum/api/topics/Missing/messages/")
+        self.assertEqual(res.status_code, 404)
+
+
+class TestCommentListAPI(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            username="TestName", email="test@test.com"
+        )
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.comments = [
+            Comment.objects.create(
+                content=f"Comment{i}", message=cls.message, user=cls.user
+            )
+            for i in range(3)
+        ]
+        cls.url = (
+            f"/ja/forum/api/topics/{cls.topic.name}/messages/{cls.message.id}/comments/"
+        )
+
+    def test_list(self):
+        res, data = get_json(self.client, self.url)
+        self.assertEqual(
+            [comment["content"] for comment in data["results"]],
+            ["Comment2", "Comment1", "Comment0"],
+        )
+        self.assertEqual(data["results"][0]["message"], self.message.id)
+        self.assertEqual(data["results"][0]["user"], "TestName")
+
+    def test_other_topic(self):
+        other = Topic.objects.create(name="Other")
+        res = self.client.get(
+            f"/ja/forum/api/topics/{other.name}/messages/{self.message.id}/comments/"
+        )
+        self.assertEqual(res.status_code, 404)
+
+
+class TestSuggestionAPI(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            username="TestName", email="test@test.com"
+        )
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.other = Topic.objects.create(name="OtherTopic")
+        cls.tag = Tag.objects.create(name="Django")
+        for content in ("Django 質問", "Django 設定", "Docker 質問"):
+            message = Message.objects.create(
+                content=content, topic=cls.topic, user=cls.user
+            )
+            if "Django" in content:
+                message.tag.add(cls.tag)
+        Message.objects.create(content="Dart", topic=cls.other, user=cls.user)
+        cls.url = f"/ja/forum/api/topics/{cls.topic.name}/suggestions/"
+
+    def test_suggestions(self):
+        res = self.client.get(self.url, {"q": "D"})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("max-age=30", res["Cache-Control"])
+        data = res.json()
+        self.assertEqual(data["tags"], [{"name": "Django", "count": 2}])
+        self.assertEqual(
+            data["terms"],
+            [{"term": "django", "count": 2}, {"term": "docker", "count": 1}],
+        )
+
+    def test_normalized_prefix(self):
+        res = self.client.get(self.url, {"q": "ＤＪＡ"})
+        self.assertEqual([t["term"] for t in res.json()["terms"]], ["django"])
+
+        res = self.client.get(self.url, {"q": "質"})
+        self.assertEqual(res.json()["terms"], [{"term": "質問", "count": 2}])
+
+    def test_limit(self):
+        res = self.client.get(self.url, {"q": "d", "limit": 1})
+        self.assertEqual([t["term"] for t in res.json()["terms"]], ["django"])
+
+        res = self.client.get(self.url, {"q": "d", "limit": 100})
+        self.assertEqual(res.status_code, 400)
+
+    def test_empty(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url, {"q": " "})
+        self.assertEqual(res.json()["terms"], [])
+
+    def test_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {"q": "dj"})
+
+    def test_updated_on_post(self):
+        Message.objects.create(content="Deno", topic=self.topic, user=self.user)
+        res = self.client.get(self.url, {"q": "den"})
+        self.assertEqual(res.json()["terms"], [{"term": "deno", "count": 1}])
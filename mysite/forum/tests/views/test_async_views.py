@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import translation
+
+from forum.models import Comment, Message, Tag, Topic
+from forum.search import FTS5SearchBackend
+from accounts.models import CustomUser
+
+
+def create_data(cls):
+    cls.user = CustomUser.objects.create_user(
+        username="TestName", email="test@test.com", password="thisistest"
+    )
+    cls.topic = Topic.objects.create(name="TestTopic")
+    cls.tag = Tag.objects.create(name="TestTag")
+    cls.message = Message.objects.create(
+        content="TestContent", topic=cls.topic, user=cls.user
+    )
+    cls.message.tag.add(cls.tag)
+    Comment.objects.create(content="TestComment", message=cls.message, user=cls.user)
+    cls.forum_url = f"/ja/forum/{cls.topic.name}/"
+
+
+def override_language(test):
+    # LocaleMiddleware が有効にした言語を後のテストに残さない
+    override = translation.override(None)
+    override.__enter__()
+    test.addCleanup(override.__exit__, None, None, None)
+
+
+@override_settings(ROOT_URLCONF="mysite.async_urls", FORUM_ASYNC_CONCURRENT_QUERIES=False)
+class TestAsyncViews(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_data(cls)
+
+    def setUp(self):
+        cache.clear()
+        override_language(self)
+
+    async def test_index(self):
+        res = await self.async_client.get("/ja/forum/")
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "TestTopic")
+
+        headers = {"If-None-Match": res["ETag"]}
+        res = await self.async_client.get("/ja/forum/", **headers)
+        self.assertEqual(res.status_code, 304)
+
+    async def test_forum(self):
+        res = await self.async_client.get(self.forum_url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["X-Fragment-Cache"], "miss")
+        self.assertContains(res, "TestContent")
+        self.assertContains(res, "TestComment")
+        self.assertContains(res, "TestTag (1)")
+        self.assertContains(res, 'name="csrfmiddlewaretoken"')
+        self.assertGreater(res.asgi_request.query_stats.count, 0)
+
+        res = await self.async_client.get(self.forum_url)
+        self.assertEqual(res["X-Fragment-Cache"], "hit")
+        self.assertContains(res, "TestContent")
+
+    async def test_not_modified(self):
+        res = await self.async_client.get(self.forum_url)
+        headers = {"If-None-Match": res["ETag"]}
+        res = await self.async_client.get(self.forum_url, **headers)
+        self.assertEqual(res.status_code, 304)
+
+    async def test_not_found(self):
+        res = await self.async_client.get("/ja/forum/Missing/")
+        self.assertEqual(res.status_code, 404)
+
+    async def test_search(self):
+        # トークナイザを調べるクエリもイベントループの外で実行する
+        with mock.patch.dict(FTS5SearchBackend.tokenizers, clear=True):
+            res = await self.async_client.get(self.forum_url, {"keyword": "Content"})
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "TestContent")
+
+    @override_settings(FORUM_CONDITIONAL_GET=False, FORUM_FRAGMENT_CACHE=False)
+    async def test_without_caches(self):
+        res = await self.async_client.get(self.forum_url, {"tag": "TestTag"})
+        self.assertContains(res, "TestContent")
+        self.assertFalse(res.has_header("ETag"))
+
+    def test_post_uses_sync_view(self):
+        self.client.force_login(self.user)
+        res = self.client.post(self.forum_url, {"message": "1", "content": "NewContent"})
+        self.assertRedirects(res, self.forum_url)
+        self.assertTrue(Message.objects.filter(content="NewContent").exists())
+
+
+@override_settings(ROOT_URLCONF="mysite.async_urls", FORUM_ASYNC_CONCURRENT_QUERIES=True)
+class TestAsyncViewsConcurrentQueries(TransactionTestCase):
+    # 別スレッドの接続から見えるよう、データをコミットする
+    def setUp(self):
+        cache.clear()
+        override_language(self)
+        create_data(self)
+
+    async def test_forum(self):
+        res = await self.async_client.get(self.forum_url)
+        self.assertContains(res, "TestContent")
+        self.assertContains(res, "TestComment")
+        self.assertContains(res, "TestTag (1)")
+        # 別スレッドで実行したクエリも数える
+        self.assertGreaterEqual(res.asgi_request.query_stats.count, 4)
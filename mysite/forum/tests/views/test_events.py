@@ -0,0 +1,263 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from forum.events import (
+    HEARTBEAT,
+    Event,
+    EventBroker,
+    EventStreamRouter,
+    Watermark,
+    fetch_events,
+    get_watermark,
+    parse_watermark,
+    replay_events,
+)
+from forum.models import Comment, Message, Topic
+from accounts.models import CustomUser
+
+
+def create_data(cls):
+    cls.user = CustomUser.objects.create_user(
+        username="TestName", email="test@test.com", password="thisistest"
+    )
+    cls.topic = Topic.objects.create(name="TestTopic")
+    cls.other_topic = Topic.objects.create(name="OtherTopic")
+    cls.message = Message.objects.create(
+        content="TestContent", topic=cls.topic, user=cls.user
+    )
+
+
+def parse_events(body):
+    events = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in block.splitlines() if ": " in line
+        )
+        if "event" in fields:
+            events.append((fields["event"], fields["id"], json.loads(fields["data"])))
+    return events
+
+
+class TestEvents(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_data(cls)
+
+    def test_parse_watermark(self):
+        self.assertEqual(parse_watermark("12-3"), Watermark(12, 3))
+        self.assertIsNone(parse_watermark(None))
+        self.assertIsNone(parse_watermark("12"))
+        self.assertIsNone(parse_watermark("a-b"))
+        self.assertIsNone(parse_watermark("-1-2"))
+
+    def test_wake_on_create(self):
+        # 編集は配信しないので、作成したときだけ購読者を起こす
+        with mock.patch("forum.signals.broker") as broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                message = Message.objects.create(
+                    content="NewMessage", topic=self.topic, user=self.user
+                )
+            self.assertEqual(broker.wake.call_count, 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                message.content = "Edited"
+                message.save()
+            self.assertEqual(broker.wake.call_count, 1)
+
+    def test_fetch_events(self):
+        after = get_watermark()
+        comment = Comment.objects.create(
+            content="NewComment", message=self.message, user=self.user
+        )
+        message = Message.objects.create(
+            content="NewMessage", topic=self.topic, user=self.user
+        )
+        Message.objects.create(content="Other", topic=self.other_topic, user=self.user)
+
+        events = fetch_events(after, get_watermark(), [self.topic.id])
+        self.assertEqual([topic_id for topic_id, _ in events], [self.topic.id] * 2)
+        parsed = parse_events(b"".join(event.data for _, event in events))
+        self.assertEqual(
+            parsed,
+            [
+                (
+                    "comment",
+                    f"{after.message_id}-{comment.id}",
+                    {
+                        "id": comment.id,
+                        "message": self.message.id,
+                        "content": "NewComment",
+                        "created_at": comment.created_at.isoformat(),
+                    },
+                ),
+                (
+                    "message",
+                    f"{message.id}-{comment.id}",
+                    {
+                        "id": message.id,
+                        "content": "NewMessage",
+                        "created_at": message.created_at.isoformat(),
+                        "image": None,
+                    },
+                ),
+            ],
+        )
+
+    def test_fetch_events_without_changes(self):
+        watermark = get_watermark()
+        with self.assertNumQueries(0):
+            self.assertEqual(fetch_events(watermark, watermark, [self.topic.id]), [])
+
+    @override_settings(FORUM_EVENTS_REPLAY_LIMIT=1)
+    def test_replay_too_many(self):
+        after = get_watermark()
+        for content in ("First", "Second"):
+            Message.objects.create(content=content, topic=self.topic, user=self.user)
+        until = get_watermark()
+
+        events = replay_events(after, until, self.topic.id)
+        self.assertEqual([event.type for event in events], ["reload"])
+
+
+@override_settings(FORUM_EVENTS_STREAM_TIMEOUT=0)
+class TestEventStreamView(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_data(cls)
+
+    def test_replay(self):
+        after = Watermark(self.message.id - 1, 0)
+        res = self.client.get(
+            f"/ja/forum/{self.topic.name}/events/",
+            HTTP_LAST_EVENT_ID=f"{after.message_id}-{after.comment_id}",
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["Content-Type"], "text/event-stream; charset=utf-8")
+        self.assertEqual(res["Cache-Control"], "no-cache")
+        body = b"".join(res.streaming_content)
+        self.assertTrue(body.startswith(b"retry: "))
+        events = parse_events(body)
+        self.assertEqual([event[2]["content"] for event in events], ["TestContent"])
+
+    def test_without_last_event_id(self):
+        res = self.client.get(f"/ja/forum/{self.topic.name}/events/")
+        self.assertEqual(parse_events(b"".join(res.streaming_content)), [])
+
+    def test_not_found(self):
+        res = self.client.get("/ja/forum/Missing/events/")
+        self.assertEqual(res.status_code, 404)
+
+
+class ASGIClient:
+    """EventStreamRouter を直接呼び出す最小限の ASGI クライアント"""
+
+    def __init__(self, app, path, headers=()):
+        self.scope = {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "headers": list(headers),
+        }
+        self.app = app
+        self.incoming = asyncio.Queue()
+        self.messages = []
+        self.received = asyncio.Event()
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        self.messages.append(message)
+        self.received.set()
+
+    def start(self):
+        self.task = asyncio.ensure_future(
+            self.app(self.scope, self.receive, self.send)
+        )
+
+    async def wait_for(self, predicate):
+        while not predicate(self.body):
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), 5)
+
+    async def disconnect(self):
+        await self.incoming.put({"type": "http.disconnect"})
+        await asyncio.wait_for(self.task, 5)
+
+    @property
+    def status(self):
+        return self.messages[0]["status"]
+
+    @property
+    def body(self):
+        return b"".join(m.get("body", b"") for m in self.messages[1:])
+
+
+async def fallback(scope, receive, send):
+    await send({"type": "http.response.start", "status": 204, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class TestEventStreamRouter(TransactionTestCase):
+    # ポーリングはリクエストの外で接続を開閉するので、トランザクションで囲まない
+
+    def setUp(self):
+        create_data(self)
+        self.broker = EventBroker(poll_interval=0.05, heartbeat=60)
+        self.app = EventStreamRouter(fallback, self.broker)
+
+    async def test_stream(self):
+        client = ASGIClient(self.app, f"/ja/forum/{self.topic.name}/events/")
+        client.start()
+        await client.wait_for(lambda body: body.startswith(b"retry: "))
+        self.assertEqual(client.status, 200)
+        self.assertIn(self.topic.id, self.broker.subscribers)
+
+        await sync_to_async(Message.objects.create)(
+            content="Other", topic=self.other_topic, user=self.user
+        )
+        message = await sync_to_async(Message.objects.create)(
+            content="Live", topic=self.topic, user=self.user
+        )
+        await client.wait_for(lambda body: b"event: message" in body)
+        events = parse_events(client.body)
+        self.assertEqual([event[2]["id"] for event in events], [message.id])
+
+        await client.disconnect()
+        self.assertEqual(self.broker.subscribers, {})
+
+    async def test_last_event_id(self):
+        headers = [(b"last-event-id", f"{self.message.id - 1}-0".encode())]
+        client = ASGIClient(self.app, f"/forum/{self.topic.name}/events/", headers)
+        client.start()
+        await client.wait_for(lambda body: b"event: message" in body)
+        events = parse_events(client.body)
+        self.assertEqual([event[2]["id"] for event in events], [self.message.id])
+        await client.disconnect()
+
+    async def test_overflow_closes_stream(self):
+        self.broker.queue_size = 1
+        client = ASGIClient(self.app, f"/forum/{self.topic.name}/events/")
+        client.start()
+        await client.wait_for(lambda body: body.startswith(b"retry: "))
+        for subscriber in self.broker.subscribers[self.topic.id]:
+            for _ in range(3):
+                subscriber.put(Event("ping", None, HEARTBEAT))
+            self.assertTrue(subscriber.overflowed)
+        await asyncio.wait_for(client.task, 5)
+        self.assertEqual(self.broker.subscribers, {})
+
+    async def test_not_found(self):
+        client = ASGIClient(self.app, "/forum/Missing/events/")
+        client.start()
+        await asyncio.wait_for(client.task, 5)
+        self.assertEqual(client.status, 404)
+
+    async def test_other_paths(self):
+        client = ASGIClient(self.app, f"/forum/{self.topic.name}/")
+        client.start()
+        await asyncio.wait_for(client.task, 5)
+        self.assertEqual(client.status, 204)
@@ -1,10 +1,29 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.db import connection
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 from forum.models import Tag, Topic, Message, Comment
+from forum.search import FTS5SearchBackend
+from forum.throttle import IMAGE_MIN_BYTES, get_post_scopes
 from accounts.models import CustomUser
 
+# 画像を投稿するテストは一時ディレクトリに保存する
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
 
 class TestWithAuthMixin:
     @classmethod
@@ -16,10 +35,15 @@ class TestWithAuthMixin:
             username=cls._username, email=cls._email, password=cls._password
         )
 
+    def setUp(self):
+        # メッセージ一覧の断片キャッシュはテストをまたいで残るため消しておく
+        cache.clear()
+
     def login(self):
         return self.client.login(username=self._username, password=self._password)
 
 
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestForumView(TestWithAuthMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -230,8 +254,575 @@ class TestForumView(TestWithAuthMixin, TestCase):
         records = Comment.objects.filter(content=self.content)
         self.assertEqual(records.count(), 0)
 
+    def test_tag_facets(self):
+        self.message.tag.add(self.tag)
+        res = self.client.get(self.forum_url)
+        facets = [(f.tag.name, f.count) for f in res.context["tag_facets"]]
+        self.assertEqual(facets, [(self.tag_name, 1)])
+        self.assertContains(res, 'class="tag-facet"')
+
     def test_valid_message_search_post(self):
         self.login()
         valid_url = f"{self.forum_url}?keyword=test_keyword"
         res = self.client.get(valid_url)
         self.assertEqual(res.status_code, 200)
+
+
+@override_settings(FORUM_PAGINATION_MODE="cursor")
+class TestForumViewCursorPagination(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.topic_name = "TestTopic"
+        cls.topic = Topic.objects.create(name=cls.topic_name)
+        cls.tag = Tag.objects.create(name="TestTag")
+
+        cls.messages = []
+        for i in range(12):
+            message = Message.objects.create(
+                content=f"TestContent{i}", topic=cls.topic, user=cls.user
+            )
+            if i % 2 == 0:
+                message.tag.add(cls.tag)
+            cls.messages.append(message)
+
+        cls.forum_url = f"/ja/forum/{cls.topic_name}/"
+
+    def test_first_page(self):
+        res = self.client.get(self.forum_url)
+        self.assertEqual(res.status_code, 200)
+        page = res.context["page_obj"]
+        self.assertEqual(list(page), self.messages[:5])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_next_and_previous(self):
+        page = self.client.get(self.forum_url).context["page_obj"]
+        res = self.client.get(self.forum_url, {"cursor": page.next_cursor})
+        page = res.context["page_obj"]
+        self.assertEqual(list(page), self.messages[5:10])
+        self.assertTrue(page.has_previous())
+
+        res = self.client.get(self.forum_url, {"cursor": page.previous_cursor})
+        page = res.context["page_obj"]
+        self.assertEqual(list(page), self.messages[:5])
+        self.assertFalse(page.has_previous())
+
+    def test_last_page(self):
+        page = self.client.get(self.forum_url).context["page_obj"]
+        page = self.client.get(
+            self.forum_url, {"cursor": page.next_cursor}
+        ).context["page_obj"]
+        page = self.client.get(
+            self.forum_url, {"cursor": page.next_cursor}
+        ).context["page_obj"]
+        self.assertEqual(list(page), self.messages[10:])
+        self.assertFalse(page.has_next())
+
+    def test_with_tag(self):
+        res = self.client.get(self.forum_url, {"tag": "TestTag"})
+        page = res.context["page_obj"]
+        self.assertEqual(list(page), self.messages[0:10:2])
+        res = self.client.get(
+            self.forum_url, {"tag": "TestTag", "cursor": page.next_cursor}
+        )
+        self.assertEqual(list(res.context["page_obj"]), self.messages[10::2])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(self.forum_url, {"cursor": "invalid"})
+        self.assertEqual(res.status_code, 404)
+
+
+class TestForumViewSearch(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.topic_name = "TestTopic"
+        cls.topic = Topic.objects.create(name=cls.topic_name)
+        cls.message_ja = Message.objects.create(
+            content="こんにちは世界", topic=cls.topic, user=cls.user
+        )
+        cls.message_en = Message.objects.create(
+            content="Hello World", topic=cls.topic, user=cls.user
+        )
+        cls.message_both = Message.objects.create(
+            content="Hello hello こんにちは", topic=cls.topic, user=cls.user
+        )
+        cls.forum_url = f"/ja/forum/{cls.topic_name}/"
+
+    def search(self, keyword):
+        res = self.client.get(self.forum_url, {"keyword": keyword})
+        self.assertEqual(res.status_code, 200)
+        return list(res.context["object_list"])
+
+    def test_japanese_substring(self):
+        self.assertCountEqual(
+            self.search("にちは"), [self.message_ja, self.message_both]
+        )
+
+    def test_case_insensitive(self):
+        self.assertCountEqual(
+            self.search("HELLO"), [self.message_en, self.message_both]
+        )
+
+    def test_relevance_order(self):
+        self.assertEqual(self.search("hello"), [self.message_both, self.message_en])
+
+    def test_short_keyword_fallback(self):
+        self.assertEqual(self.search("世界"), [self.message_ja])
+
+    def test_single_match(self):
+        queryset = FTS5SearchBackend().search(Message.objects.all(), "hello")
+        self.assertEqual(str(queryset.query).count("MATCH"), 1)
+
+    def test_unicode61_fallback(self):
+        # trigram を使えない SQLite で作られた索引では部分一致できない
+        with mock.patch.dict(FTS5SearchBackend.tokenizers, {"default": "unicode61"}):
+            self.assertCountEqual(
+                self.search("にちは"), [self.message_ja, self.message_both]
+            )
+
+    def test_quote_in_keyword(self):
+        self.assertEqual(self.search('"Hello'), [])
+
+    def test_index_follows_update_and_delete(self):
+        self.message_en.content = "Goodbye World"
+        self.message_en.save()
+        self.assertEqual(self.search("Goodbye"), [self.message_en])
+        self.message_en.delete()
+        self.assertEqual(self.search("Goodbye"), [])
+
+    def test_install_without_index(self):
+        # 索引のテーブルがなければ (0003 より前まで戻した場合) トリガーを作らない
+        with connection.cursor() as cursor:
+            for name in FTS5SearchBackend.triggers:
+                cursor.execute(f"DROP TRIGGER {name}")
+            cursor.execute(f"DROP TABLE {FTS5SearchBackend.table}")
+        try:
+            FTS5SearchBackend().install()
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+                self.assertEqual(cursor.fetchall(), [])
+            Message.objects.create(content="NoIndex", topic=self.topic, user=self.user)
+        finally:
+            FTS5SearchBackend.tokenizers.clear()
+
+    @override_settings(FORUM_SEARCH_BACKEND="forum.search.IContainsSearchBackend")
+    def test_icontains_backend(self):
+        self.assertEqual(self.search("World"), [self.message_en])
+
+
+class TestForumViewComments(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.topic_name = "TestTopic"
+        cls.topic = Topic.objects.create(name=cls.topic_name)
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.other = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.comments = [
+            Comment.objects.create(content=f"Comment{i}", message=cls.message, user=cls.user)
+            for i in range(12)
+        ]
+        cls.forum_url = f"/ja/forum/{cls.topic_name}/"
+        cls.comments_url = f"/ja/forum/{cls.topic_name}/messages/{cls.message.id}/comments/"
+
+    def test_latest_comments(self):
+        res = self.client.get(self.forum_url)
+        message, other = res.context["object_list"]
+        self.assertEqual(message.latest_comments, self.comments[-5:])
+        self.assertIsNotNone(message.older_comments_cursor)
+        self.assertEqual(other.latest_comments, [])
+        self.assertIsNone(other.older_comments_cursor)
+
+    def test_older_comments(self):
+        res = self.client.get(self.forum_url)
+        cursor = res.context["object_list"][0].older_comments_cursor
+
+        res = self.client.get(
+            self.comments_url, {"cursor": cursor}, HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTemplateUsed(res, "forum/comments.html")
+        self.assertTemplateNotUsed(res, "forum/comments_page.html")
+        self.assertEqual(list(res.context["object_list"]), self.comments[2:7][::-1])
+
+        res = self.client.get(
+            self.comments_url, {"cursor": res.context["page_obj"].next_cursor}
+        )
+        self.assertEqual(list(res.context["object_list"]), self.comments[:2][::-1])
+        self.assertFalse(res.context["page_obj"].has_next())
+
+    def test_older_comments_page(self):
+        # JavaScript を使わずにリンクを開いた場合はページ全体を返す
+        res = self.client.get(self.comments_url)
+        self.assertEqual(res.status_code, 200)
+        self.assertTemplateUsed(res, "forum/comments_page.html")
+        self.assertContains(res, "<html")
+        self.assertContains(res, self.forum_url)
+        self.assertIn("X-Requested-With", res["Vary"])
+
+    def test_comments_of_other_topic(self):
+        Topic.objects.create(name="OtherTopic")
+        res = self.client.get(
+            f"/ja/forum/OtherTopic/messages/{self.message.id}/comments/"
+        )
+        self.assertEqual(res.status_code, 404)
+
+
+class TestForumViewFragmentCache(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.topic_name = "TestTopic"
+        cls.topic = Topic.objects.create(name=cls.topic_name)
+        cls.tag = Tag.objects.create(name="TestTag")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.forum_url = f"/ja/forum/{cls.topic_name}/"
+
+    def assertCache(self, url, status, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["X-Fragment-Cache"], status)
+        return res
+
+    def test_hit(self):
+        self.assertCache(self.forum_url, "miss")
+        res = self.assertCache(self.forum_url, "hit")
+        self.assertContains(res, "TestContent")
+        self.assertNotContains(res, "__forum_csrf_")
+        self.assertContains(res, 'name="csrfmiddlewaretoken"', count=2)
+
+    def test_placeholder_in_content(self):
+        # 本文に書かれた文字列は CSRF トークンに置き換えない
+        Message.objects.create(
+            content="__forum_csrf_token__", topic=self.topic, user=self.user
+        )
+        self.assertCache(self.forum_url, "miss")
+        res = self.assertCache(self.forum_url, "hit")
+        self.assertContains(res, "__forum_csrf_token__", count=1)
+
+    def test_key_by_language(self):
+        self.assertCache(self.forum_url, "miss")
+        self.assertCache(f"/en/forum/{self.topic_name}/", "miss")
+        self.assertCache(self.forum_url, "hit", page="1")
+
+    def test_first_page_only(self):
+        # 絞り込みや 2 ページ目以降はキャッシュしない
+        for params in ({"page": "2"}, {"tag": "TestTag"}, {"keyword": "Test"}):
+            res = self.client.get(self.forum_url, params)
+            self.assertFalse(res.has_header("X-Fragment-Cache"))
+
+    def test_invalidated_by_message(self):
+        self.assertCache(self.forum_url, "miss")
+        Message.objects.create(content="NewContent", topic=self.topic, user=self.user)
+        res = self.assertCache(self.forum_url, "miss")
+        self.assertContains(res, "NewContent")
+
+    def test_invalidated_by_comment(self):
+        self.assertCache(self.forum_url, "miss")
+        Comment.objects.create(content="NewComment", message=self.message, user=self.user)
+        res = self.assertCache(self.forum_url, "miss")
+        self.assertContains(res, "NewComment")
+
+    def test_invalidated_by_tag(self):
+        self.assertCache(self.forum_url, "miss")
+        self.tag.message.add(self.message)
+        res = self.assertCache(self.forum_url, "miss")
+        self.assertContains(res, "TestTag")
+
+    def test_invalidated_by_other_worker(self):
+        self.assertCache(self.forum_url, "miss")
+        Topic.objects.filter(pk=self.topic.pk).update(comment_count=1)
+        self.assertCache(self.forum_url, "miss")
+
+    def test_not_invalidated_by_other_topic(self):
+        other = Topic.objects.create(name="OtherTopic")
+        self.assertCache(self.forum_url, "miss")
+        Message.objects.create(content="NewContent", topic=other, user=self.user)
+        self.assertCache(self.forum_url, "hit")
+
+    @override_settings(FORUM_FRAGMENT_CACHE=False)
+    def test_disabled(self):
+        res = self.client.get(self.forum_url)
+        self.assertFalse(res.has_header("X-Fragment-Cache"))
+
+    @override_settings(FORUM_TIMESTAMP_MODE="server")
+    def test_disabled_with_server_timestamps(self):
+        res = self.client.get(self.forum_url)
+        self.assertFalse(res.has_header("X-Fragment-Cache"))
+
+
+class TestForumViewTimestamps(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        Message.objects.filter(pk=cls.message.pk).update(
+            created_at=datetime(2022, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+        )
+        cls.forum_url = f"/ja/forum/{cls.topic.name}/"
+
+    def test_client(self):
+        res = self.client.get(self.forum_url)
+        self.assertContains(
+            res,
+            '<time class="relative-time" datetime="2022-02-03T04:05:06+00:00">'
+            "2022-02-03 13:05</time>",
+            html=True,
+        )
+        self.assertContains(res, "forum/js/relative-time.js")
+        self.assertContains(res, '<html lang="ja">')
+
+    @override_settings(FORUM_TIMESTAMP_MODE="server")
+    def test_server(self):
+        res = self.client.get(self.forum_url)
+        self.assertContains(res, "1 週間以上前")
+
+
+class TestForumViewConditionalGet(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.forum_url = f"/ja/forum/{cls.topic.name}/"
+
+    def test_not_modified(self):
+        res = self.client.get(self.forum_url)
+        self.assertIn("no-cache", res["Cache-Control"])
+        self.assertIn("Cookie", res["Vary"])
+        # トピックはキャッシュから引き、集計列を 1 クエリで読むだけで、一覧の
+        # クエリもテンプレートの描画もしない
+        with self.assertNumQueries(1):
+            res = self.client.get(self.forum_url, HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b"")
+
+    def test_modified_by_other_worker(self):
+        # シグナルを送らない更新は、別のワーカーで行われたものとみなす
+        etag = self.client.get(self.forum_url)["ETag"]
+        Topic.objects.filter(pk=self.topic.pk).update(message_count=2)
+        res = self.client.get(self.forum_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.forum_url)["Last-Modified"]
+        res = self.client.get(self.forum_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, 304)
+
+    def test_modified(self):
+        etag = self.client.get(self.forum_url)["ETag"]
+        changes = [
+            lambda: Comment.objects.create(
+                content="TestComment", message=self.message, user=self.user
+            ),
+            lambda: Message.objects.filter(pk=self.message.pk).first().save(),
+            lambda: self.message.tag.add(Tag.objects.create(name="TestTag")),
+        ]
+        for change in changes:
+            with self.subTest(change=change):
+                change()
+                res = self.client.get(self.forum_url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(res.status_code, 200)
+                etag = res["ETag"]
+
+    def test_new_tag(self):
+        # どのメッセージにも付いていないタグでも投稿フォームの選択肢は変わる
+        etag = self.client.get(self.forum_url)["ETag"]
+        Tag.objects.create(name="NewTag")
+        res = self.client.get(self.forum_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "NewTag")
+
+    def test_params(self):
+        etag = self.client.get(self.forum_url)["ETag"]
+        for params in ({"tag": "TestTag"}, {"keyword": "Test"}, {"page": "1"}):
+            with self.subTest(params=params):
+                res = self.client.get(self.forum_url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(res.status_code, 200)
+
+    def test_csrf_cookie(self):
+        etag = self.client.get(self.forum_url)["ETag"]
+        self.client.cookies.clear()
+        res = self.client.get(self.forum_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(FORUM_TIMESTAMP_MODE="server")
+    def test_disabled_with_server_timestamps(self):
+        self.assertFalse(self.client.get(self.forum_url).has_header("ETag"))
+
+
+class TestForumViewFragmentPost(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.tag = Tag.objects.create(name="TestTag")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.forum_url = f"/ja/forum/{cls.topic.name}/"
+
+    def post(self, data):
+        return self.client.post(
+            self.forum_url, data, HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+
+    def test_message(self):
+        self.login()
+        res = self.post({"message": "value", "content": "New", "tag": [self.tag.id]})
+        self.assertEqual(res.status_code, 201)
+        message = Message.objects.get(content="New")
+        html = res.json()["html"]
+        self.assertIn(f'data-message-id="{message.id}"', html)
+        self.assertIn("TestTag", html)
+        self.assertIn('name="csrfmiddlewaretoken"', html)
+        self.assertIn(f'name="comment" value="{message.id}"', html)
+        self.assertNotIn("TestContent", html)
+
+    def test_comment(self):
+        self.login()
+        res = self.post({"comment": self.message.id, "content": "New"})
+        self.assertEqual(res.status_code, 201)
+        comment = Comment.objects.get(content="New")
+        html = res.json()["html"]
+        self.assertIn(f'data-comment-id="{comment.id}"', html)
+        self.assertIn('<time class="relative-time"', html)
+        self.assertNotIn("message-box", html)
+
+    def test_validation_errors(self):
+        self.login()
+        res = self.post({"message": "value", "content": "x" * 201})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("content", res.json()["errors"])
+
+        res = self.post({"comment": self.message.id})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("content", res.json()["errors"])
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_not_authenticated(self):
+        res = self.post({"comment": self.message.id, "content": "New"})
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_without_header_redirects(self):
+        self.login()
+        res = self.client.post(
+            self.forum_url, {"comment": self.message.id, "content": "New"}
+        )
+        self.assertRedirects(res, self.forum_url)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    FORUM_THROTTLE_RATES={"message": (2, 60), "comment": (1, 60), "image": (1, 600)},
+)
+class TestForumViewThrottle(TestWithAuthMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.topic = Topic.objects.create(name="TestTopic")
+        cls.message = Message.objects.create(
+            content="TestContent", topic=cls.topic, user=cls.user
+        )
+        cls.forum_url = f"/ja/forum/{cls.topic.name}/"
+
+    def post_message(self, **extra):
+        return self.client.post(
+            self.forum_url, {"message": "value", "content": "New"}, **extra
+        )
+
+    def test_messages(self):
+        self.login()
+        for _ in range(2):
+            self.assertEqual(self.post_message().status_code, 302)
+
+        # セッションとユーザーを読むだけで、書き込みはしない
+        with self.assertNumQueries(2):
+            res = self.post_message()
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res["Retry-After"], "30")
+        self.assertEqual(Message.objects.filter(content="New").count(), 2)
+
+        # コメントは別のバケット
+        res = self.client.post(
+            self.forum_url, {"comment": self.message.id, "content": "New"}
+        )
+        self.assertEqual(res.status_code, 302)
+
+    def test_refill(self):
+        self.login()
+        with mock.patch("forum.throttle.time.time", return_value=1000):
+            self.post_message()
+            self.post_message()
+            self.assertEqual(self.post_message().status_code, 429)
+        with mock.patch("forum.throttle.time.time", return_value=1030):
+            self.assertEqual(self.post_message().status_code, 302)
+            self.assertEqual(self.post_message().status_code, 429)
+
+    def test_images(self):
+        self.login()
+        # 画像の判定は本文の大きさによるので、圧縮の効かない画像にする
+        png = BytesIO()
+        Image.frombytes("RGB", (64, 64), os.urandom(64 * 64 * 3)).save(png, "PNG")
+        for status in (302, 429):
+            image = SimpleUploadedFile(
+                "test.png", png.getvalue(), content_type="image/png"
+            )
+            res = self.client.post(
+                self.forum_url,
+                {"message": "value", "content": "Image", "image": image},
+            )
+            self.assertEqual(res.status_code, status)
+        self.assertEqual(Message.objects.filter(content="Image").count(), 1)
+        # 画像のない投稿は制限されない
+        self.assertEqual(self.post_message().status_code, 302)
+
+    def test_scopes_without_parsing_upload(self):
+        body = b"x" * (IMAGE_MIN_BYTES + 1)
+        request = RequestFactory().post(
+            self.forum_url,
+            body,
+            content_type="multipart/form-data; boundary=BoUnDaRy",
+        )
+        self.assertEqual(get_post_scopes(request), ["message", "image"])
+        # 本文を解析していない
+        self.assertFalse(hasattr(request, "_files"))
+
+    def test_per_ip(self):
+        other = CustomUser.objects.create_user(
+            username="Other", email="other@test.com", password="thisistest"
+        )
+        self.login()
+        self.post_message()
+        self.post_message()
+        self.client.force_login(other)
+        self.assertEqual(self.post_message().status_code, 429)
+        res = self.post_message(REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(res.status_code, 302)
+
+    def test_fragment(self):
+        self.login()
+        self.post_message()
+        self.post_message()
+        res = self.post_message(HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.json()["errors"]["__all__"][0]["code"], "throttled")
+        self.assertIn("Retry-After", res)
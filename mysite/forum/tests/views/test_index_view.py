@@ -1,4 +1,9 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from forum.models import Topic, Message
+from accounts.models import CustomUser
 
 
 class TestIndexView(TestCase):
@@ -6,3 +11,50 @@ class TestIndexView(TestCase):
         res = self.client.get("/ja/forum/")
         self.assertEqual(res.status_code, 200)
         self.assertTemplateUsed(res, "forum/index.html")
+
+    def test_ordered_by_last_activity(self):
+        user = CustomUser.objects.create(username="TestName", email="test@test.com")
+        old = Topic.objects.create(name="Old")
+        new = Topic.objects.create(name="New")
+        empty = Topic.objects.create(name="Empty")
+        Message.objects.create(content="TestContent", topic=old, user=user)
+        Message.objects.create(content="TestContent", topic=new, user=user)
+        res = self.client.get("/ja/forum/")
+        self.assertEqual(list(res.context["object_list"]), [new, old, empty])
+
+
+class TestIndexViewConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        res = self.client.get("/ja/forum/")
+        self.assertIn("no-cache", res["Cache-Control"])
+        # トピック一覧は読まず、最終アクティビティの集計だけを行う
+        with self.assertNumQueries(1):
+            res = self.client.get("/ja/forum/", HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 304)
+
+    def test_modified_by_other_worker(self):
+        # シグナルを送らない更新は、別のワーカーで行われたものとみなす
+        topic = Topic.objects.create(name="Old")
+        res = self.client.get("/ja/forum/")
+        Topic.objects.filter(pk=topic.pk).update(last_activity_at=timezone.now())
+        res = self.client.get("/ja/forum/", HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 200)
+
+    def test_modified_by_topic(self):
+        res = self.client.get("/ja/forum/")
+        Topic.objects.create(name="New")
+        res = self.client.get("/ja/forum/", HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "New")
+
+    def test_language(self):
+        etag = self.client.get("/ja/forum/")["ETag"]
+        res = self.client.get("/en/forum/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(FORUM_CONDITIONAL_GET=False)
+    def test_disabled(self):
+        self.assertFalse(self.client.get("/ja/forum/").has_header("ETag"))
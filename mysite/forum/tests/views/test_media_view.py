@@ -0,0 +1,121 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from forum.media import IMMUTABLE_CACHE_CONTROL
+
+MEDIA_ROOT = tempfile.mkdtemp()
+HASHED = "images/ab/" + "ab" * 32 + ".png"
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestMediaView(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ("test.txt", HASHED, ".tmp/tmpabc123"):
+            path = Path(MEDIA_ROOT) / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"0123456789")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_full_response(self):
+        response = self.client.get("/media/test.txt")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        self.assertNotIn("Cache-Control", response)
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get("/media/missing.txt").status_code, 404)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/images").status_code, 404)
+        self.assertEqual(self.client.post("/media/test.txt").status_code, 405)
+
+    def test_temp_file(self):
+        # 書き込み中のアップロードは返さない
+        for path in ("/media/.tmp/tmpabc123", "/media/images/../.tmp/tmpabc123"):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_not_modified(self):
+        response = self.client.get("/media/test.txt")
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        response = self.client.get("/media/test.txt", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.client.get("/media/test.txt", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        cases = {
+            "bytes=2-5": (b"2345", "bytes 2-5/10"),
+            "bytes=7-": (b"789", "bytes 7-9/10"),
+            "bytes=-3": (b"789", "bytes 7-9/10"),
+            "bytes=8-100": (b"89", "bytes 8-9/10"),
+        }
+        for header, (body, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get("/media/test.txt", HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b"".join(response.streaming_content), body)
+                self.assertEqual(response["Content-Length"], str(len(body)))
+                self.assertEqual(response["Content-Range"], content_range)
+
+    def test_range_not_satisfiable(self):
+        response = self.client.get("/media/test.txt", HTTP_RANGE="bytes=10-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_unsupported_range_returns_whole_file(self):
+        for header in ("bytes=0-1,4-5", "items=0-1", "bytes=5-2"):
+            with self.subTest(header=header):
+                response = self.client.get("/media/test.txt", HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+
+    def test_if_range(self):
+        etag = self.client.get("/media/test.txt")["ETag"]
+        response = self.client.get(
+            "/media/test.txt", HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=etag
+        )
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(
+            "/media/test.txt", HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            "/media/test.txt", HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=http_date(0)
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_immutable(self):
+        response = self.client.get("/media/" + HASHED)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+
+    @override_settings(FORUM_MEDIA_SENDFILE="x-accel-redirect")
+    def test_x_accel_redirect(self):
+        response = self.client.get("/media/" + HASHED, HTTP_RANGE="bytes=0-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + HASHED)
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+
+    @override_settings(FORUM_MEDIA_SENDFILE="x-sendfile")
+    def test_x_sendfile(self):
+        response = self.client.get("/media/test.txt")
+        self.assertEqual(response["X-Sendfile"], str(Path(MEDIA_ROOT) / "test.txt"))
+        response = self.client.get("/media/test.txt", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
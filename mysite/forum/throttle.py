@@ -0,0 +1,100 @@
+"""投稿のレート制限 (トークンバケット)。
+
+バケットはユーザーと IP アドレスのそれぞれに、FORUM_THROTTLE_RATES の種類
+("message" / "comment" / "image") ごとに用意する。状態 (残りのトークンと更新時刻)
+はキャッシュに置くので、キャッシュを共有するワーカー間で制限が共有される。
+読み出しと書き込みの間に他のワーカーが消費した分は失われることがあるが、
+超過は同時に処理されたリクエストの数までに限られる。
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = "forum:throttle"
+
+# 画像のない投稿の multipart の本文はこれより小さい (内容は 200 文字まで)
+IMAGE_MIN_BYTES = 8 * 1024
+
+
+def get_rates():
+    # {"種類": (バケットの容量, 容量分が回復する秒数)}
+    return getattr(settings, "FORUM_THROTTLE_RATES", {})
+
+
+def get_client_ip(request):
+    # プロキシの後ろでは REMOTE_ADDR を実際のクライアントに設定しておくこと
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def get_idents(request):
+    idents = [f"ip:{get_client_ip(request)}"]
+    if request.user.is_authenticated:
+        idents.append(f"user:{request.user.pk}")
+    return idents
+
+
+def consume(scopes, idents, now=None):
+    """すべてのバケットから 1 トークンずつ消費する。
+
+    消費できた場合は 0 を返す。どれかが足りない場合は何も消費せずに、
+    足りるようになるまでの秒数を返す。
+    """
+    rates = get_rates()
+    buckets = {
+        f"{KEY_PREFIX}:{scope}:{ident}": rates[scope]
+        for scope in scopes
+        if scope in rates
+        for ident in idents
+    }
+    if not buckets:
+        return 0
+
+    now = time.time() if now is None else now
+    state = cache.get_many(buckets)
+    wait = 0
+    updated = {}
+    for key, (capacity, period) in buckets.items():
+        tokens, updated_at = state.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * capacity / period)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) * period / capacity)
+        updated[key] = (tokens - 1, now)
+    if wait:
+        return wait
+
+    # 満杯まで回復したバケットは消えてよい
+    timeout = max(math.ceil(period) for capacity, period in buckets.values())
+    cache.set_many(updated, timeout)
+    return 0
+
+
+def get_content_length(request):
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
+
+
+def get_post_scopes(request):
+    """ForumView.post の投稿の種類
+
+    本文を解析するとアップロードが一時ファイルに書き出されるので、画像の有無は
+    Content-Type と Content-Length から判断する。画像を含むほど大きい本文は
+    解析せずにメッセージの投稿として扱い、小さい本文だけ request.POST を読む。
+    """
+    if (
+        request.content_type == "multipart/form-data"
+        and get_content_length(request) > IMAGE_MIN_BYTES
+    ):
+        return ["message", "image"]
+    if "message" in request.POST:
+        return ["message"]
+    if "comment" in request.POST:
+        return ["comment"]
+    return []
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
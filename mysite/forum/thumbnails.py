@@ -0,0 +1,82 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from .jobs import enqueue, register
+from .models import Message
+
+DEFAULT_WIDTHS = [320, 640, 1280]
+
+
+def get_formats():
+    formats = ["jpeg"]
+    if features.check("webp"):
+        formats.insert(0, "webp")
+    return formats
+
+
+def thumbnail_dir(name):
+    return str(PurePosixPath("thumbnails") / PurePosixPath(name).parent)
+
+
+def thumbnail_prefix(name):
+    return f"{PurePosixPath(name).stem}-"
+
+
+def thumbnail_name(name, width, format):
+    # 元画像の名前から決めるので、同じ画像のサムネイルは一度だけ作られる
+    ext = "jpg" if format == "jpeg" else format
+    return f"{thumbnail_dir(name)}/{thumbnail_prefix(name)}{width}w.{ext}"
+
+
+def make_thumbnails(image_file, widths=None):
+    """縮小した画像を (width, format, bytes) で返す。元より大きくはしない。"""
+    widths = sorted(widths or getattr(settings, "FORUM_THUMBNAIL_WIDTHS", DEFAULT_WIDTHS))
+    with Image.open(image_file) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA")
+
+        targets = [w for w in widths if w < original.width] or [original.width]
+        for width in targets:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for format in get_formats():
+                image = resized
+                if format == "jpeg" and image.mode != "RGB":
+                    image = image.convert("RGB")
+                buffer = BytesIO()
+                image.save(buffer, format=format.upper(), quality=80)
+                yield width, format, buffer.getvalue()
+
+
+@register("thumbnails")
+def generate_thumbnails(message_id, force=False):
+    """force が真なら、作成済みのサムネイルも作り直して上書きする"""
+    message = Message.objects.filter(pk=message_id).first()
+    if message is None or not message.image:
+        return
+
+    # サムネイルは内容ではなく元画像の名前で保存するので、通常のストレージを使う
+    storage = default_storage
+    thumbnails = []
+    with message.image.open("rb") as image_file:
+        for width, format, data in make_thumbnails(image_file):
+            name = thumbnail_name(message.image.name, width, format)
+            if force and storage.exists(name):
+                # 既存のファイルがあると save() は別名で保存する
+                storage.delete(name)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(data))
+            thumbnails.append({"width": width, "format": format, "name": name})
+
+    message.thumbnails = thumbnails
+    message.save(update_fields=["thumbnails"])
+
+
+def enqueue_thumbnails(message):
+    enqueue("thumbnails", message_id=message.pk)
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+
+from .models import Topic
+
+GENERATION_KEY = "forum:topics:generation"
+
+DEFAULT_SIZE = 256
+
+
+class TopicCache:
+    """トピック名から Topic を引くプロセス内の LRU キャッシュ。
+
+    id と name だけを保持し、呼び出しごとに新しいインスタンスを返す。件数などの
+    カラムは遅延読み込みになるので、古い値を返すことはない。
+    共有キャッシュの世代番号が変わると (どのワーカーでトピックが変更されても)
+    全体を読み込み直す。共有キャッシュであることは manage.py check --deploy で
+    確かめる (forum.checks.check_shared_cache)。
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def get_size(self):
+        return self.size or getattr(settings, "FORUM_TOPIC_CACHE_SIZE", DEFAULT_SIZE)
+
+    def get(self, name):
+        """name の Topic を返す。存在しなければ None。"""
+        generation = cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+        with self.lock:
+            if generation != self.generation:
+                self.load(generation)
+            entry = self.entries.get(name)
+            if entry is not None:
+                self.entries.move_to_end(name)
+
+        if entry is None:
+            entry = Topic.objects.filter(name=name).values_list("id", "name").first()
+            if entry is None:
+                return None
+            with self.lock:
+                if generation == self.generation:
+                    self.put(name, entry)
+
+        return Topic.from_db(DEFAULT_DB_ALIAS, ["id", "name"], entry)
+
+    def load(self, generation):
+        # 最近アクティブなトピックから読み込んでおく
+        self.entries.clear()
+        topics = Topic.objects.order_by("-last_activity_at").values_list("id", "name")
+        for entry in reversed(topics[: self.get_size()]):
+            self.entries[entry[1]] = entry
+        self.generation = generation
+
+    def put(self, name, entry):
+        self.entries[name] = entry
+        while len(self.entries) > self.get_size():
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation = None
+
+
+topic_cache = TopicCache()
+
+
+def get_topic(name):
+    return topic_cache.get(name)
+
+
+def get_topic_or_404(name):
+    topic = get_topic(name)
+    if topic is None:
+        raise Http404("トピックが見つかりません。")
+    return topic
+
+
+def invalidate_topics():
+    """トピックの追加・変更・削除を全ワーカーに知らせる。"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+    topic_cache.clear()
@@ -1,9 +1,31 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = "forum"
 
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
     path('<topic>/', views.ForumView.as_view(), name='forum'),
+    path(
+        '<topic>/messages/<int:message_id>/comments/',
+        views.CommentListView.as_view(),
+        name='comments',
+    ),
+    path('<topic>/events/', views.EventStreamView.as_view(), name='events'),
+    path('api/topics/', api.TopicListAPIView.as_view(), name='api-topics'),
+    path(
+        'api/topics/<topic>/messages/',
+        api.MessageListAPIView.as_view(),
+        name='api-messages',
+    ),
+    path(
+        'api/topics/<topic>/messages/<int:message_id>/comments/',
+        api.CommentListAPIView.as_view(),
+        name='api-comments',
+    ),
+    path(
+        'api/topics/<topic>/suggestions/',
+        api.SuggestionAPIView.as_view(),
+        name='api-suggestions',
+    ),
 ]
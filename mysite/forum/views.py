@@ -1,42 +1,183 @@
+import hashlib
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Count, Max, OuterRef, Q, Subquery
-from django.db.models.functions import Greatest, Coalesce
+from django.template.loader import render_to_string
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+from django.utils.translation import get_language
+from django.db.models import Count, F, Max
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic.list import ListView
-from django.views.generic.base import TemplateView
+from django.views.generic.base import TemplateView, View
 
-from .models import Topic, Message, Comment
+from .cache import (
+    csrf_placeholder,
+    fragment_key,
+    generation_time,
+    get_fragment,
+    index_generation,
+    render_fragment,
+    set_fragment,
+    tags_generation,
+    topic_generation,
+)
+from .db import use_read_database
+from .events import stream_sync
+from .models import Topic, TopicTag, Message, Comment
 from .forms import MessageForm, CommentForm, MessageSearchForm
+from .pagination import CursorPaginator, paginate_by_cursor
+from .search import get_search_backend
+from .throttle import consume, get_idents, get_post_scopes, retry_after
+from .topics import get_topic_or_404
+
+logger = logging.getLogger(__name__)
+
+
+def last_modified(generation, *dates):
+    # 世代番号の時刻と DB の日時のうち最も新しいもの (UNIX 時刻)
+    return max(
+        [generation_time(generation), *(date.timestamp() for date in dates if date)]
+    )
+
+
+class ReadDatabaseMixin:
+    """GET / HEAD の読み取りを FORUM_READ_DATABASE に送る。POST はプライマリで扱う。"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+
+        with use_read_database():
+            response = super().dispatch(request, *args, **kwargs)
+            # テンプレートで評価されるクエリも読み取り専用の接続で実行する
+            if hasattr(response, "render") and callable(response.render):
+                response.render()
+        return response
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified を付け、一致する GET には本体を作らず 304 を返す。
+
+    get_validators() は一覧のクエリやテンプレートの描画より前に呼ばれるので、
+    キャッシュの世代番号や非正規化したカラムだけから安く計算すること。
+    """
+
+    def conditional_get_enabled(self):
+        # サーバーで「n 分前」を描画する場合、ページは現在時刻によって変わる
+        return getattr(settings, "FORUM_CONDITIONAL_GET", True) and (
+            getattr(settings, "FORUM_TIMESTAMP_MODE", "client") != "server"
+        )
+
+    def get_validators(self):
+        """(ETag の元になる値のリスト, Last-Modified の UNIX 時刻) を返す"""
+        raise NotImplementedError
+
+    def get_conditional_headers(self):
+        """(ETag, Last-Modified の UNIX 時刻) を返す"""
+        parts, last_modified = self.get_validators()
+        etag = '"%s"' % hashlib.md5(
+            "|".join(str(part) for part in parts).encode()
+        ).hexdigest()
+        return etag, last_modified
+
+    def not_modified(self, request, etag, last_modified):
+        # 一致すれば 304 (または 412) を、そうでなければ None を返す
+        return get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified)
+        )
+
+    def set_conditional_headers(self, response, etag, last_modified):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # 毎回再検証させる (変更がなければ 304 で済む)
+        patch_cache_control(response, no_cache=True)
+
+    def conditional_response(self, request, render):
+        if not self.conditional_get_enabled():
+            return render()
+
+        etag, last_modified = self.get_conditional_headers()
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            response = render()
+        self.set_conditional_headers(response, etag, last_modified)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, partial(super().get, request, *args, **kwargs)
+        )
 
 
-class IndexView(ListView):
+class IndexView(ReadDatabaseMixin, ConditionalGetMixin, ListView):
     template_name = "forum/index.html"
     model = Topic
 
-    def get_queryset(self, **kwargs):
-        queryset = (
-            Topic.objects.all()
-            .annotate(
-                letest_message_date=Max("topic_message__created_at"),
-                letest_comment_date=Max("topic_message__comment__created_at"),
-                latest_date=Greatest("letest_message_date", "letest_comment_date"),
-                time=Coalesce(
-                    "latest_date", "letest_message_date", "letest_comment_date"
-                ),
-            )
-            .order_by("-time")
+    def get_validators(self):
+        # 世代番号に加え、別のワーカーでの変更も反映されるよう DB の最終
+        # アクティビティとトピック数を使う (last_activity_at の索引で引ける)
+        generation = index_generation()
+        activity = Topic.objects.aggregate(
+            last_activity_at=Max("last_activity_at"), count=Count("pk")
         )
+        parts = [
+            generation,
+            activity["last_activity_at"],
+            activity["count"],
+            get_language(),
+        ]
+        return parts, last_modified(generation, activity["last_activity_at"])
+
+    def get_queryset(self, **kwargs):
+        queryset = Topic.objects.order_by(F("last_activity_at").desc(nulls_last=True))
         return queryset
 
 
-class ForumView(ListView):
+class ForumView(ReadDatabaseMixin, ConditionalGetMixin, ListView):
     template_name = "forum/forum.html"
     paginate_by = 5
+    comment_limit = 5
+
+    def get_pagination_mode(self):
+        # "offset" (既定) か "cursor"
+        return getattr(settings, "FORUM_PAGINATION_MODE", "offset")
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != "cursor":
+            return super().paginate_queryset(queryset, page_size)
+
+        return paginate_by_cursor(self.request, queryset, page_size)
 
     def get_context_data(self, **kwargs):
+        context = self.get_page_context(**kwargs)
+        context.update(self.get_form_context())
+        context["tag_facets"] = self.get_tag_facets()
+        return context
+
+    def get_page_context(self, **kwargs):
+        # 表示するページのメッセージと、それぞれの最新コメント
         context = super().get_context_data(**kwargs)
+        self.attach_latest_comments(context["object_list"])
+        return context
+
+    def get_tag_facets(self):
+        return (
+            TopicTag.objects.filter(topic=self.topic, count__gt=0)
+            .select_related("tag")
+            .order_by("-count", "tag__name")
+        )
 
-        topic = get_object_or_404(Topic, name=self.kwargs["topic"])
-        context["topic"] = topic
+    def get_form_context(self):
+        # メッセージ一覧の断片キャッシュに含めない、リクエストごとの部分
+        context = {"topic": self.topic}
 
         context["message_form"] = MessageForm()
         context["comment_form"] = CommentForm()
@@ -50,21 +191,36 @@ class ForumView(ListView):
         if self.request.GET.get("tag"):
             context["tag"] = self.request.GET.get("tag")
 
+        context["pagination_mode"] = self.get_pagination_mode()
+
         return context
 
-    def get_queryset(self, **kwargs):
-        subquery = Comment.objects.filter(message=OuterRef("id")).order_by(
-            "-created_at"
+    def attach_latest_comments(self, messages):
+        # 最新 comment_limit 件だけを読み込み、残りは CommentListView で取得する
+        messages = list(messages)
+        comments = {message.id: [] for message in messages}
+        for comment in Comment.objects.latest_per_message(
+            comments.keys(), self.comment_limit + 1
+        ):
+            comments[comment.message_id].append(comment)
+
+        paginator = CursorPaginator(
+            Comment.objects.none(), self.comment_limit, ordering=("-created_at", "-id")
         )
+        for message in messages:
+            latest = comments[message.id]
+            message.latest_comments = latest[-self.comment_limit :]
+            message.older_comments_cursor = None
+            if len(latest) > self.comment_limit:
+                message.older_comments_cursor = paginator.encode_cursor(
+                    message.latest_comments[0]
+                )
+
+    def get_queryset(self, **kwargs):
         queryset = (
-            Message.objects.filter(topic__name=self.kwargs["topic"])
-            .annotate(
-                reply_num=Count("comment"),
-                latest_reply_date=Subquery(subquery.values("created_at")[:1]),
-                # latest_reply_date=Max('comment__created_at'),
-            )
-            .prefetch_related("tag", "comment")
-            .order_by("created_at")
+            Message.objects.filter(topic_id=self.topic.id)
+            .prefetch_related("tag")
+            .order_by("created_at", "id")
         )
         if "tag" in self.request.GET:
             queryset = queryset.filter(tag__name=self.request.GET["tag"])
@@ -73,20 +229,56 @@ class ForumView(ListView):
         if form.is_valid():
             keyword = form.cleaned_data["keyword"]
             if keyword:
-                queryset = queryset.filter(content__icontains=keyword)
+                queryset = get_search_backend().search(queryset, keyword)
 
         return queryset
 
+    def wants_fragment(self):
+        # fetch / XMLHttpRequest からの投稿には、リダイレクトの代わりに
+        # 追加したメッセージ・コメントの HTML だけを返す
+        return self.request.headers.get("X-Requested-With") == "XMLHttpRequest"
+
+    def render_fragment(self, template_name, context, status=201):
+        html = render_to_string(template_name, context, request=self.request)
+        return JsonResponse({"html": html}, status=status)
+
+    def form_errors(self, form, status=400):
+        return JsonResponse({"errors": form.errors.get_json_data()}, status=status)
+
+    def throttled(self, wait, fragment):
+        message = "投稿が多すぎます。しばらくしてから再度お試しください。"
+        if fragment:
+            response = JsonResponse(
+                {"errors": {"__all__": [{"message": message, "code": "throttled"}]}},
+                status=429,
+            )
+        else:
+            response = HttpResponse(
+                message, status=429, content_type="text/plain; charset=utf-8"
+            )
+        response["Retry-After"] = retry_after(wait)
+        return response
+
     def post(self, request, *args, **kwargs):
+        fragment = self.wants_fragment()
 
         if self.request.user.is_anonymous:
+            logger.info("Anonymous post rejected")
+            if fragment:
+                return JsonResponse({"errors": {}}, status=403)
             return redirect("forum:forum", topic=self.kwargs["topic"])
 
+        # フォームの検証や保存の前に制限する
+        wait = consume(get_post_scopes(request), get_idents(request))
+        if wait:
+            logger.warning("Post throttled", extra={"retry_after": wait})
+            return self.throttled(wait, fragment)
+
         if "message" in request.POST:
 
             message_form = MessageForm(request.POST, request.FILES)
 
-            topic = get_object_or_404(Topic, name=self.kwargs["topic"])
+            topic = get_topic_or_404(self.kwargs["topic"])
 
             if message_form.is_valid():
                 message_form.instance.topic = topic
@@ -94,6 +286,32 @@ class ForumView(ListView):
                 message = message_form.save()
                 for tag in message_form.cleaned_data["tag"]:
                     message.tag.add(tag)
+                logger.info(
+                    "Message posted",
+                    extra={
+                        "message_id": message.id,
+                        "tags": len(message_form.cleaned_data["tag"]),
+                        "image": bool(message.image),
+                    },
+                )
+                if fragment:
+                    message.latest_comments = []
+                    message.older_comments_cursor = None
+                    return self.render_fragment(
+                        "forum/message.html",
+                        {
+                            "message": message,
+                            "topic": topic,
+                            "comment_form": CommentForm(),
+                        },
+                    )
+            else:
+                logger.warning(
+                    "Invalid message form",
+                    extra={"errors": message_form.errors.get_json_data()},
+                )
+                if fragment:
+                    return self.form_errors(message_form)
 
         elif "comment" in request.POST:
 
@@ -107,8 +325,187 @@ class ForumView(ListView):
                 comment_form.instance.message = message
                 comment_form.instance.user = self.request.user
                 comment = comment_form.save()
+                logger.info(
+                    "Comment posted",
+                    extra={"message_id": message.id, "comment_id": comment.id},
+                )
+                if fragment:
+                    return self.render_fragment("forum/comment.html", {"comment": comment})
+            else:
+                logger.warning(
+                    "Invalid comment form",
+                    extra={"errors": comment_form.errors.get_json_data()},
+                )
+                if fragment:
+                    return self.form_errors(comment_form)
 
+        if fragment:
+            return JsonResponse({"errors": {}}, status=400)
         return redirect("forum:forum", topic=self.kwargs["topic"])
 
+    activity_fields = ["last_activity_at", "message_count", "comment_count"]
+
+    def get_topic(self):
+        return get_topic_or_404(self.kwargs["topic"])
+
+    def get_activity(self):
+        """別のワーカーでの投稿・削除も反映される、DB の集計列の値"""
+        # トピックのキャッシュは id と name だけなので、集計列を 1 クエリで読み足す
+        # (フィールドごとの遅延読み込みにしない)
+        deferred = self.topic.get_deferred_fields() & set(self.activity_fields)
+        if deferred:
+            values = (
+                Topic.objects.filter(pk=self.topic.id)
+                .values_list(*self.activity_fields)
+                .first()
+            )
+            if values is None:
+                raise Http404("トピックが見つかりません。")
+            for field, value in zip(self.activity_fields, values):
+                setattr(self.topic, field, value)
+        return [getattr(self.topic, field) for field in self.activity_fields]
+
+    def get_validators(self):
+        self.topic = self.get_topic()
+        # 世代番号はメッセージ・コメント・タグの変更のたびに変わる
+        generation = topic_generation(self.topic.id)
+        # 投稿フォームのタグの選択肢はトピックによらない
+        tags = tags_generation()
+        parts = [
+            self.topic.id,
+            generation,
+            tags,
+            *self.get_activity(),
+            get_language(),
+            self.get_pagination_mode(),
+            # ページには CSRF トークンが埋め込まれているので Cookie の値ごとに変える
+            self.get_csrf_secret(),
+            *(
+                f"{name}={self.request.GET.get(name, '')}"
+                for name in ("page", "cursor", "tag", "keyword")
+            ),
+        ]
+        # 世代番号は変更した時刻なので、新しい方を Last-Modified に使う
+        return parts, last_modified(
+            max(generation, tags), self.topic.last_activity_at
+        )
+
+    def get_csrf_secret(self):
+        # Cookie がない初回のリクエストでも、ここで発行した値がページに埋め込まれる
+        get_token(self.request)
+        return self.request.META["CSRF_COOKIE"]
+
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        response = self.conditional_response(
+            request, partial(self.render_list, request)
+        )
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+    def render_list(self, request):
+        if not hasattr(self, "topic"):
+            self.topic = self.get_topic()
+
+        key = self.get_fragment_key()
+        fragment = get_fragment(key) if key else None
+        if fragment is not None:
+            self.object_list = None
+            return self.render_page(self.get_form_context(), fragment, "hit")
+
+        self.object_list = self.get_queryset()
+        context = self.get_context_data()
+        fragment = self.render_message_list(context, key)
+        return self.render_page(context, fragment, "miss" if key else None)
+
+    def fragment_cache_enabled(self):
+        # サーバーで「n 分前」を描画する場合、断片は現在時刻によって変わる
+        return getattr(settings, "FORUM_FRAGMENT_CACHE", True) and (
+            getattr(settings, "FORUM_TIMESTAMP_MODE", "client") != "server"
+        )
+
+    def get_fragment_key(self):
+        # 絞り込みのない先頭ページだけをキャッシュする。クエリ文字列の値ごとに
+        # キーを作ると、任意の値でキャッシュを埋められてしまう
+        if not self.fragment_cache_enabled():
+            return None
+        params = {
+            name: self.request.GET[name]
+            for name in ("page", "cursor", "tag", "keyword")
+            if name in self.request.GET
+        }
+        if params.pop("page", "1") != "1" or params:
+            return None
+        params = {
+            "mode": self.get_pagination_mode(),
+            "activity": ":".join(str(value) for value in self.get_activity()),
+        }
+        return fragment_key(self.topic.id, get_language(), params)
+
+    def render_message_list(self, context, key=None):
+        """(CSRF トークンの代わりの文字列, HTML) を返す"""
+        placeholder = csrf_placeholder()
+        html = render_to_string(
+            "forum/message_list.html", {**context, "csrf_token": placeholder}
+        )
+        if key:
+            set_fragment(key, placeholder, html)
+        return placeholder, html
+
+    def render_page(self, context, fragment, fragment_cache=None):
+        context["message_list"] = render_fragment(self.request, *fragment)
+        response = self.render_to_response(context)
+        if fragment_cache:
+            response["X-Fragment-Cache"] = fragment_cache
+        return response
+
+
+class CommentListView(ReadDatabaseMixin, ListView):
+    paginate_by = 5
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["message"] = self.message
+        return context
+
+    def get_queryset(self, **kwargs):
+        topic = get_topic_or_404(self.kwargs["topic"])
+        self.message = get_object_or_404(
+            Message, id=self.kwargs["message_id"], topic_id=topic.id
+        )
+        self.message.topic = topic
+        return Comment.objects.filter(message=self.message)
+
+    def paginate_queryset(self, queryset, page_size):
+        return paginate_by_cursor(
+            self.request, queryset, page_size, ordering=("-created_at", "-id")
+        )
+
+    def get_template_names(self):
+        # fetch からはコメントの HTML だけを返し、リンクを直接開いた場合は
+        # ページ全体を返す
+        if self.request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return ["forum/comments.html"]
+        return ["forum/comments_page.html"]
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        patch_vary_headers(response, ["X-Requested-With"])
+        return response
+
+
+class EventStreamView(View):
+    """トピックの新着メッセージ・コメントを Server-Sent Events で返す。
+
+    WSGI 用で、接続ごとにスレッドを使う。ASGI では forum.events.EventStreamRouter が
+    このビューより先に処理する。
+    """
+
+    def get(self, request, *args, **kwargs):
+        topic = get_topic_or_404(self.kwargs["topic"])
+        response = StreamingHttpResponse(
+            stream_sync(topic.id, request.headers.get("Last-Event-ID")),
+            content_type="text/event-stream; charset=utf-8",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
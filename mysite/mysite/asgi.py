@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# 掲示板の一覧を非同期版のビュー (forum.async_views) で返す
+os.environ.setdefault('FORUM_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from forum.events import EventStreamRouter  # noqa: E402 (Django の初期化後に読み込む)
+
+# トピックの SSE (/forum/<topic>/events/) は Django を通さずに処理する
+application = EventStreamRouter(django_application)
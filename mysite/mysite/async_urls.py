@@ -0,0 +1,4 @@
+"""FORUM_ASYNC_VIEWS の設定によらず非同期版のビューを使う URLconf (ベンチマークとテスト用)"""
+from .urls import get_urlpatterns
+
+urlpatterns = get_urlpatterns(async_views=True)
@@ -61,11 +61,19 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'forum.middleware.RequestLogMiddleware',
+    'forum.middleware.QueryCountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# IndexView / ForumView を非同期版 (forum.async_views) にする。mysite/asgi.py が有効にする
+FORUM_ASYNC_VIEWS = os.environ.get('FORUM_ASYNC_VIEWS') == '1'
+
+# debug_toolbar のミドルウェアは同期専用で、非同期ビューの利点がなくなる
+if not FORUM_ASYNC_VIEWS:
+    MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -94,10 +102,75 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+    },
+    # 同じファイルを読み取り専用で開く接続。WAL では書き込み中も読める
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['forum.db.ReadWriteRouter']
+
+
+# Cache
+# 断片キャッシュやトピックのキャッシュの無効化をワーカー間で共有するため、本番では
+# memcached / Redis などの共有キャッシュを指定すること (LocMemCache のままだと
+# manage.py check --deploy がエラー forum.E001 を報告する)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
 
+# Logging
+# リクエストスレッドは QueueHandler でキューに積むだけにし、JSON Lines への書き込みと
+# ローテーションは QueueListener のスレッドで行う
+
+LOG_DIR = BASE_DIR / "logs"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {
+            '()': 'forum.log.RequestContextFilter',
+        },
+        'sampling': {
+            '()': 'forum.log.SamplingFilter',
+            # 読み取りのアクセスログと SQL の集計は 10% だけ残す (WARNING 以上は常に残す)
+            'rates': {'forum.access.read': 0.1, 'forum.sql': 0.1},
+        },
+    },
+    'handlers': {
+        'forum_file': {
+            'class': 'forum.log.QueueListenerHandler',
+            'filename': LOG_DIR / 'forum.jsonl',
+            'max_bytes': 10 * 1024 * 1024,
+            'backup_count': 5,
+            # 間引くレコードにはコンテキストを付けない
+            'filters': ['sampling', 'request_context'],
+        },
+    },
+    'loggers': {
+        'forum': {
+            'handlers': ['forum_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'django.request': {
+            'handlers': ['forum_file'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -166,4 +239,73 @@ ACCOUNT_LOGOUT_REDIRECT_URL = 'forum:index'
 ACCOUNT_LOGOUT_ON_GET = True
 
 ACCOUNT_EMAIL_VERIFICATION = 'none'
-ACCOUNT_EMAIL_REQUIRED = True
\ No newline at end of file
+ACCOUNT_EMAIL_REQUIRED = True
+
+# Forum
+# ForumView のページネーション ("offset" または "cursor")
+FORUM_PAGINATION_MODE = "offset"
+
+# メッセージ検索のバックエンド (icontains にする場合は "forum.search.IContainsSearchBackend")
+FORUM_SEARCH_BACKEND = "forum.search.FTS5SearchBackend"
+
+# ForumView のメッセージ一覧の断片キャッシュ
+FORUM_FRAGMENT_CACHE = True
+FORUM_FRAGMENT_CACHE_TIMEOUT = 300
+
+# 日時の表示 ("client" は <time> に絶対時刻を出し、JavaScript で「n 分前」にする。
+# "server" はサーバーで「n 分前」を描画するため、ページが現在時刻に依存する)
+FORUM_TIMESTAMP_MODE = "client"
+
+# 非同期版のビューで、互いに依存しないクエリを別々のスレッドで同時に実行する
+FORUM_ASYNC_CONCURRENT_QUERIES = True
+
+# トピック名から Topic を引くプロセス内キャッシュの件数
+FORUM_TOPIC_CACHE_SIZE = 256
+
+# IndexView / ForumView などの GET で読み取りに使う接続
+FORUM_READ_DATABASE = "replica"
+
+# IndexView / ForumView に ETag と Last-Modified を付け、変更がなければ 304 を返す
+# (FORUM_TIMESTAMP_MODE が "server" のときは無効)
+FORUM_CONDITIONAL_GET = True
+
+# トピックの新着を配信する SSE (forum.events)。新着は ID の最高水位をポーリングして調べる
+FORUM_EVENTS_POLL_INTERVAL = 1.0
+# 無通信の接続に送るコメント行の間隔 (秒)
+FORUM_EVENTS_HEARTBEAT = 15
+# 購読者ごとのキューの長さ。あふれた接続は閉じてクライアントに再接続させる
+FORUM_EVENTS_QUEUE_SIZE = 100
+# 再接続時 (Last-Event-ID) に再送する件数の上限。超えたらページを読み込み直させる
+FORUM_EVENTS_REPLAY_LIMIT = 100
+# WSGI で 1 つの接続を保つ秒数 (スレッドを占有するため)
+FORUM_EVENTS_STREAM_TIMEOUT = 60
+
+# 投稿のレート制限。種類ごとに (バケットの容量, 容量分が回復する秒数) で、
+# ユーザーと IP アドレスのそれぞれに適用する。超えた投稿には 429 を返す
+FORUM_THROTTLE_RATES = {
+    "message": (10, 60),
+    "comment": (20, 60),
+    "image": (5, 300),
+}
+
+# ビューごとのクエリ数の上限 (ページサイズやコメント数によらず一定であること)
+FORUM_QUERY_BUDGETS = {
+    "forum:index": 2,
+    "forum:forum": 9,
+    "forum:comments": 3,
+    "forum:api-topics": 1,
+    "forum:api-messages": 3,
+    "forum:api-comments": 3,
+    "forum:api-suggestions": 3,
+}
+
+# Message.image から作るサムネイルの幅 (px)。process_jobs コマンドが作成する
+FORUM_THUMBNAIL_WIDTHS = [320, 640, 1280]
+# 実行中のままこの秒数を過ぎたジョブは、ワーカーが落ちたものとして取り出し直す
+FORUM_JOB_LEASE = 600
+
+# MEDIA_ROOT の配信をフロントのプロキシに任せる ("x-accel-redirect" または "x-sendfile")。
+# 空の場合は Django が返す (WSGI サーバーが wsgi.file_wrapper を持てば sendfile を使う)
+FORUM_MEDIA_SENDFILE = ""
+# nginx の internal location のプレフィックス (x-accel-redirect のとき)
+FORUM_MEDIA_ACCEL_PREFIX = "/protected-media/"
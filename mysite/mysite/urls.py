@@ -13,19 +13,38 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from django.conf.urls.i18n import i18n_patterns
 
+from forum import media
+
+
+def get_urlpatterns(async_views=False):
+    # ASGI では一覧を非同期版のビューにする (mysite/asgi.py を参照)
+    forum_urls = "forum.async_urls" if async_views else "forum.urls"
+    urlpatterns = [
+        path('admin/', admin.site.urls),
+        path('accounts/', include('allauth.urls')), # 追加
+    ] + i18n_patterns(path("forum/", include(forum_urls)))
+
+    # MEDIA_URL が外部の URL (CDN など) のときは Django では配信しない
+    if settings.MEDIA_URL.startswith("/"):
+        urlpatterns += [
+            re_path(
+                r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")),
+                media.serve,
+                name="media",
+            )
+        ]
+
+    if settings.DEBUG:
+        urlpatterns += [path("__debug__/", include("debug_toolbar.urls"))]
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('accounts/', include('allauth.urls')), # 追加
-] + i18n_patterns(path("forum/", include("forum.urls")))
+    return urlpatterns
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
-if settings.DEBUG:
-    urlpatterns += [path("__debug__/", include("debug_toolbar.urls"))]
+urlpatterns = get_urlpatterns(getattr(settings, "FORUM_ASYNC_VIEWS", False))